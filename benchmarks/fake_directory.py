@@ -0,0 +1,110 @@
+import random
+import re
+import threading
+import time
+from typing import List, Optional
+
+import mcommunity.mcommunity_mocks as mocks
+
+from eligibility_checker.directory import PrefetchedMCommunityUser
+
+# Template mock user -> share of the synthetic population. Roughly the mix of a campus-wide tenant: mostly students and
+# staff with the enterprise uSE, a few sponsored affiliates of each type, alumni and retirees without it, and a small
+# number of entitlement mismatches.
+POPULATION = {
+    'nemcards': 0.45,  # Student with uSE
+    'nemcardrs': 0.25,  # Regular staff with uSE
+    'nemcardf': 0.08,  # Faculty with uSE
+    'nemcardts': 0.05,  # Temporary staff with uSE
+    'nemcardsa1': 0.03,  # Sponsored affiliate type 1
+    'nemcardsa2': 0.02,  # Sponsored affiliate type 2
+    'um999999': 0.01,  # Sponsored affiliate type 3
+    'nemcarda': 0.04,  # Alumni
+    'nemcardr': 0.05,  # Retiree
+    'nemcardferr': 0.01,  # Faculty missing uSE
+    'nemcardaerr': 0.01,  # Alumni with a hanging uSE
+}
+
+_UID_RE = re.compile(r'\(?uid=([^)&|(]+)\)?')
+
+
+class FakeDirectory:
+    """
+    Synthetic MCommunity with any number of users, for use as the side effect of a patched MCommunityBase.search.
+    Users are named bench0000000, bench0000001, ... and each one is a copy of a mcommunity_mocks user chosen by
+    POPULATION, built on demand so that a million-user directory takes no memory. Group searches are answered by
+    mcommunity_mocks. Every search sleeps for latency plus per_entry_latency for each entry returned.
+    """
+    def __init__(self, size: int, latency: float = 0.0, per_entry_latency: float = 0.0, seed: int = 0):
+        self.size = size
+        self.latency = latency
+        self.per_entry_latency = per_entry_latency
+        self.seed = seed
+        self.searches = 0
+        self.search_durations = []  # Seconds per search, including the simulated latency
+        self._lock = threading.Lock()
+        names = list(POPULATION)
+        rng = random.Random(seed)
+        self._choices = rng.choices(names, weights=[POPULATION[n] for n in names], k=min(size, 65536))
+        self._templates = {name: mocks.mcomm_side_effect(f'uid={name}', ['*'])[0] for name in names}
+
+    def uniqnames(self, count: Optional[int] = None) -> List[str]:
+        return [self.uniqname(i) for i in range(self.size if count is None else min(count, self.size))]
+
+    @staticmethod
+    def uniqname(index: int) -> str:
+        return f'bench{index:07d}'
+
+    def template_for(self, uniqname: str) -> Optional[str]:
+        if not uniqname.startswith('bench') or not uniqname[5:].isdigit() or int(uniqname[5:]) >= self.size:
+            return None
+        return self._choices[int(uniqname[5:]) % len(self._choices)]
+
+    def entry(self, uniqname: str) -> Optional[tuple]:
+        template = self.template_for(uniqname)
+        if template is None:
+            return None
+        dn, attrs = self._templates[template]
+        attrs = dict(attrs)
+        attrs['uid'] = [uniqname.encode()]
+        return dn.replace(template, uniqname), attrs
+
+    def search(self, query: str, attributes=None, *args, **kwargs) -> list:
+        started = time.perf_counter()
+        uids = _UID_RE.findall(query)
+        if not uids:
+            results = mocks.mcomm_side_effect(query, attributes, *args, **kwargs)
+        else:
+            results = [entry for entry in (self.entry(uid) for uid in uids) if entry is not None]
+            if attributes and '*' not in attributes:  # Projection, like the real directory
+                results = [(dn, {k: v for k, v in attrs.items() if k in attributes}) for dn, attrs in results]
+        delay = self.latency + self.per_entry_latency * len(results)
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            self.searches += 1
+            self.search_durations.append(time.perf_counter() - started)
+        return results
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.searches = 0
+            self.search_durations = []
+
+    def records(self, count: Optional[int] = None, service_entitlement: str = 'enterprise') -> List[dict]:
+        """
+        Plain records for EligibilityChecker.evaluate_records, parsed once per template by MCommunityUser so that they
+        match what the directory entries decide to.
+        """
+        shapes = {}
+        for name, entry in self._templates.items():
+            user = PrefetchedMCommunityUser(name, '', '', [entry])
+            user.populate_highest_affiliation()
+            shapes[name] = (user.highest_affiliation, user.check_service_entitlement(service_entitlement),
+                            user.check_sponsorship_type())
+        records = []
+        for uniqname in self.uniqnames(count):
+            affiliation, has_use, sa_type = shapes[self.template_for(uniqname)]
+            records.append({'uid': uniqname, 'entitlements': {service_entitlement} if has_use else set(),
+                            'highest_affiliation': affiliation, 'sa_type': sa_type})
+        return records
@@ -0,0 +1,193 @@
+"""
+Eligibility checker benchmarks against a synthetic in-process directory (see fake_directory.FakeDirectory).
+
+    python -m benchmarks.run --users 100000 --latency 0.002 --output bench.json
+
+Results are written as JSON so they can be compared between commits.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Iterable, List
+from unittest.mock import patch
+
+from eligibility_checker.checker import EligibilityChecker
+from eligibility_checker.overrides import override_group_membership
+
+from benchmarks.fake_directory import FakeDirectory
+
+MODES = ['construction', 'serial', 'batched', 'concurrent', 'records', 'memory']
+
+
+class BenchmarkChecker(EligibilityChecker):
+    service_friendly = 'Benchmark'
+    override_groups = ['collab-iam-admins']
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def summarize(count: int, seconds: float, latencies: List[float] = None, latency_prefix: str = '') -> dict:
+    """
+    Summarize a mode's throughput and, if there are latencies, their p50 and p99.
+    :param latency_prefix: what the latencies are of, prepended to their keys; '' for per-user check latencies,
+    'search_' for per-search latencies, which in batched modes cover a whole chunk of users
+    """
+    result = {'users': count, 'seconds': round(seconds, 6),
+              'per_second': round(count / seconds, 1) if seconds else None}
+    if latencies:
+        result[f'{latency_prefix}p50_ms'] = round(percentile(latencies, 50) * 1000, 3)
+        result[f'{latency_prefix}p99_ms'] = round(percentile(latencies, 99) * 1000, 3)
+    return result
+
+
+def consume(responses: Iterable) -> int:
+    count = 0
+    for _ in responses:
+        count += 1
+    return count
+
+
+def bench_construction(directory: FakeDirectory) -> dict:
+    override_group_membership.clear()
+    started = time.perf_counter()
+    BenchmarkChecker('bench', 'bench')
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    BenchmarkChecker('bench', 'bench')
+    warm = time.perf_counter() - started
+    return {'cold_ms': round(cold * 1000, 3), 'warm_ms': round(warm * 1000, 3)}
+
+
+def bench_serial(checker: EligibilityChecker, uniqnames: List[str]) -> dict:
+    latencies = []
+    started = time.perf_counter()
+    for uniqname in uniqnames:
+        call_started = time.perf_counter()
+        checker.check_eligibility(uniqname)
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(len(uniqnames), time.perf_counter() - started, latencies)
+
+
+def bench_batched(checker: EligibilityChecker, directory: FakeDirectory, uniqnames: List[str], chunk_size: int) -> dict:
+    directory.reset_stats()
+    started = time.perf_counter()
+    count = consume(checker.check_eligibility_many(uniqnames, chunk_size=chunk_size))
+    result = summarize(count, time.perf_counter() - started, directory.search_durations, 'search_')
+    result['searches'] = directory.searches
+    return result
+
+
+def bench_concurrent(checker: EligibilityChecker, directory: FakeDirectory, uniqnames: List[str], chunk_size: int,
+                     workers: int) -> dict:
+    directory.reset_stats()
+    started = time.perf_counter()
+    count = consume(checker.check_eligibility_concurrent(uniqnames, max_workers=workers, chunk_size=chunk_size))
+    result = summarize(count, time.perf_counter() - started, directory.search_durations, 'search_')
+    result.update(searches=directory.searches, workers=workers)
+    return result
+
+
+def bench_records(checker: EligibilityChecker, directory: FakeDirectory, count: int) -> dict:
+    records = directory.records(count)
+    started = time.perf_counter()
+    evaluated = consume(checker.evaluate_records(records))
+    return summarize(evaluated, time.perf_counter() - started)
+
+
+def bench_memory(checker: EligibilityChecker, uniqnames: List[str], chunk_size: int) -> dict:
+    result = {}
+    for retain in (True, False):
+        checker.retain_mcommunity_users = retain
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        responses = list(checker.check_eligibility_many(uniqnames, chunk_size=chunk_size))
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        result['retained_user' if retain else 'lazy_user'] = {
+            'responses': len(responses), 'bytes_per_response': round(allocated / max(len(responses), 1), 1)}
+        del responses
+    checker.retain_mcommunity_users = True
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run(args: argparse.Namespace) -> dict:
+    directory = FakeDirectory(args.users, latency=args.latency, per_entry_latency=args.per_entry_latency,
+                              seed=args.seed)
+    uniqnames = directory.uniqnames()
+    results = {'meta': {
+        'timestamp': datetime.now(timezone.utc).isoformat(), 'commit': git_commit(),
+        'python': platform.python_version(), 'users': args.users, 'latency': args.latency,
+        'per_entry_latency': args.per_entry_latency, 'chunk_size': args.chunk_size, 'seed': args.seed,
+    }}
+    with patch('mcommunity.mcommunity_base.MCommunityBase.search', side_effect=directory.search):
+        if 'construction' in args.modes:
+            results['construction'] = bench_construction(directory)
+        checker = BenchmarkChecker('bench', 'bench')
+        if 'serial' in args.modes:
+            results['serial'] = bench_serial(checker, uniqnames[:args.serial_sample])
+        if 'batched' in args.modes:
+            results['batched'] = bench_batched(checker, directory, uniqnames, args.chunk_size)
+        if 'concurrent' in args.modes:
+            results['concurrent'] = bench_concurrent(checker, directory, uniqnames, args.chunk_size, args.workers)
+        if 'records' in args.modes:
+            results['records'] = bench_records(checker, directory, args.users)
+        if 'memory' in args.modes:
+            results['memory'] = bench_memory(checker, uniqnames[:args.memory_sample], args.chunk_size)
+    override_group_membership.clear()
+    return results
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Benchmark eligibility checks against a synthetic directory')
+    parser.add_argument('--users', type=int, default=10000, help='Number of users in the synthetic directory')
+    parser.add_argument('--latency', type=float, default=0.002, help='Seconds added to every search')
+    parser.add_argument('--per-entry-latency', type=float, default=0.00001,
+                        help='Seconds added to a search for every entry it returns')
+    parser.add_argument('--chunk-size', type=int, default=100, help='Uniqnames per search for batched modes')
+    parser.add_argument('--workers', type=int, default=8, help='Threads for the concurrent mode')
+    parser.add_argument('--serial-sample', type=int, default=1000, help='Users to check in the serial mode')
+    parser.add_argument('--memory-sample', type=int, default=10000, help='Users to keep responses for in memory mode')
+    parser.add_argument('--modes', default=','.join(MODES), type=lambda s: s.split(','),
+                        help=f'Comma-separated modes to run (default: {",".join(MODES)})')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic population')
+    parser.add_argument('--output', default='-', help='File to write JSON results to (default: stdout)')
+    return parser
+
+
+def main(argv: list = None) -> int:
+    args = build_parser().parse_args(argv)
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        print(f'Unknown modes: {", ".join(sorted(unknown))}', file=sys.stderr)
+        return 2
+    results = run(args)
+    if args.output == '-':
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
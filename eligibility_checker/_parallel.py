@@ -0,0 +1,166 @@
+import logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+from eligibility_checker.overrides import override_group_membership
+
+logger = logging.getLogger(__name__)
+
+_worker_checker = None  # The EligibilityChecker of this worker process, created by init_worker_checker
+_worker_validate_affiliation = True
+
+
+def ordered_process_map(fn: Callable, items: Iterable, processes: int, initializer: Optional[Callable] = None,
+                        initargs: tuple = (), max_in_flight: Optional[int] = None,
+                        on_broken_pool: Optional[Callable] = None) -> Iterator:
+    """
+    Map fn over items in worker processes and yield the results in the same order as items. Only max_in_flight items
+    are submitted at a time, so items can be a generator over more data than fits in memory.
+    :param fn: picklable function to call on each item
+    :param items: the items to map over
+    :param processes: the number of worker processes; 1 runs everything in this process, putting the worker checker
+    that initializer may set up back the way it was afterwards
+    :param initializer: picklable function to call once in each worker process
+    :param initargs: arguments for initializer
+    :param max_in_flight: the maximum number of items submitted but not yet yielded; defaults to twice processes
+    :param on_broken_pool: called with (item, BrokenProcessPool) for each item lost when a worker process dies, i.e. to
+    a crash or the OOM killer, and its return value is yielded as that item's result; the pool is then restarted for
+    the remaining items. If None, BrokenProcessPool is raised
+    :return: generator of results
+    """
+    global _worker_checker, _worker_validate_affiliation
+    if processes < 1:
+        raise ValueError(f'processes must be at least 1, got {processes}')
+    if processes == 1:
+        worker_state = _worker_checker, _worker_validate_affiliation
+        try:
+            if initializer:
+                initializer(*initargs)
+            for item in items:
+                yield fn(item)
+        finally:
+            _worker_checker, _worker_validate_affiliation = worker_state
+        return
+    max_in_flight = max_in_flight or processes * 2
+    workers = _Workers(fn, processes, initializer, initargs, on_broken_pool)
+    in_flight = deque()
+    try:
+        for item in items:
+            in_flight.append((item, workers.submit(item)))
+            if len(in_flight) >= max_in_flight:
+                yield workers.result(*in_flight.popleft())
+        while in_flight:
+            yield workers.result(*in_flight.popleft())
+    finally:
+        for _, future in in_flight:
+            future.cancel()
+        workers.shutdown()
+
+
+def unordered_process_map(fn: Callable, items: Iterable, processes: int, initializer: Optional[Callable] = None,
+                          initargs: tuple = (), max_in_flight: Optional[int] = None,
+                          on_broken_pool: Optional[Callable] = None) -> Iterator:
+    """
+    Like ordered_process_map, but yield each result as soon as it is ready, so one slow item does not hold up the rest.
+    """
+    if processes < 1:
+        raise ValueError(f'processes must be at least 1, got {processes}')
+    if processes == 1:
+        yield from ordered_process_map(fn, items, 1, initializer, initargs)
+        return
+    max_in_flight = max_in_flight or processes * 2
+    workers = _Workers(fn, processes, initializer, initargs, on_broken_pool)
+    pending = {}  # Future: item
+    try:
+        for item in items:
+            pending[workers.submit(item)] = item
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield workers.result(pending.pop(future), future)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield workers.result(pending.pop(future), future)
+    finally:
+        for future in pending:
+            future.cancel()
+        workers.shutdown()
+
+
+class _Workers:
+    """
+    The ProcessPoolExecutor behind the process maps. If on_broken_pool is given, a pool broken by a worker process
+    dying is replaced with a new one, and the items that were lost with it get on_broken_pool's results.
+    """
+    def __init__(self, fn: Callable, processes: int, initializer: Optional[Callable], initargs: tuple,
+                 on_broken_pool: Optional[Callable]):
+        self.fn = fn
+        self.processes = processes
+        self.initializer = initializer
+        self.initargs = initargs
+        self.on_broken_pool = on_broken_pool
+        self.executor = self._new_executor()
+
+    def submit(self, item) -> Future:
+        try:
+            return self.executor.submit(self.fn, item)
+        except BrokenProcessPool:
+            if self.on_broken_pool is None:
+                raise
+            logger.error('A worker process died; starting a new process pool for the remaining items.')
+            self.executor.shutdown(wait=False)
+            self.executor = self._new_executor()
+            return self.executor.submit(self.fn, item)
+
+    def result(self, item, future: Future):
+        try:
+            return future.result()
+        except BrokenProcessPool as e:
+            if self.on_broken_pool is None:
+                raise
+            return self.on_broken_pool(item, e)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.processes, initializer=self.initializer, initargs=self.initargs)
+
+
+def shared_override_members(checker) -> dict:
+    """
+    The override group members a checker decided with, to seed worker processes with so they do not fetch the groups
+    again.
+    :param checker: EligibilityChecker object
+    :return: dictionary of group name to members; empty if the checker's members are static
+    """
+    if checker._static_override_members is not None:
+        return {}
+    return {group: override_group_membership.get(group, checker.mcommunity_app_cn, checker.mcommunity_secret)
+            for group in checker.override_groups}
+
+
+def init_worker_checker(checker_class: type, app_cn: str, secret: str, override_members: dict,
+                        validate_affiliation: bool) -> None:
+    """
+    Initializer for worker processes: create this process's checker from the override group members of the parent.
+    Groups this process already has are left alone, so running it in the parent (processes=1) changes nothing there.
+    """
+    global _worker_checker, _worker_validate_affiliation
+    known = override_group_membership.snapshot()
+    missing = {group: members for group, members in override_members.items() if group not in known}
+    if missing:
+        override_group_membership.update(missing)  # So the checker does not fetch override groups again
+    _worker_checker = checker_class(app_cn, secret)
+    _worker_checker.retain_mcommunity_users = False
+    _worker_validate_affiliation = validate_affiliation
+
+
+def worker_checker() -> Tuple[object, bool]:
+    """
+    :return: this worker process's (checker, validate_affiliation), as set up by init_worker_checker
+    """
+    return _worker_checker, _worker_validate_affiliation
@@ -0,0 +1,99 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterable, Optional, Tuple
+
+from eligibility_checker.checker import CheckEligibilityResponse, EligibilityChecker
+from eligibility_checker.directory import chunked
+
+
+class AsyncEligibilityChecker:
+    """
+    asyncio front end for an EligibilityChecker, for use in async web services. Searches run in a managed thread pool
+    on connections from the checker's connection pool, so the event loop is never blocked and LDAP binds are reused.
+    Concurrent checks of the same uniqname (with the same validate_affiliation) share a single in-flight search.
+    Decisions are identical to the checker's, and its cache is used if it has one.
+
+    Use as an async context manager, or call close() when done, to shut the thread pool down.
+    """
+    checker: EligibilityChecker
+
+    def __init__(self, checker: EligibilityChecker, max_workers: Optional[int] = None):
+        """
+        :param checker: the EligibilityChecker subclass instance to make decisions with
+        :param max_workers: the number of threads searching MCommunity at once; defaults to the checker's
+        mcommunity_pool_size, since each thread needs its own connection
+        """
+        self.checker = checker
+        self.max_workers = max_workers if max_workers is not None else checker.mcommunity_pool_size
+        if self.max_workers < 1:
+            raise ValueError(f'max_workers must be at least 1, got {self.max_workers}')
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='eligibility-checker-aio')
+        self._in_flight: Dict[Tuple[str, bool], asyncio.Future] = {}
+
+    async def __aenter__(self) -> 'AsyncEligibilityChecker':
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+    ##################
+    # Public Methods #
+    ##################
+    async def check_eligibility(self, uniqname: str, validate_affiliation: bool = True) -> CheckEligibilityResponse:
+        """
+        Check whether a given user is eligible for the service without blocking the event loop. If the same user is
+        already being checked, wait for that check instead of starting another.
+        :param uniqname: the U-M username of the user to check for eligibility
+        :param validate_affiliation: see EligibilityChecker.check_eligibility
+        :return: CheckEligibilityResponse object containing eligibility information
+        """
+        key = (uniqname, validate_affiliation)
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, self._check_chunk, [uniqname], validate_affiliation)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        responses = await asyncio.shield(future)  # A cancelled caller must not cancel the search other callers share
+        return responses[0]
+
+    async def check_eligibility_many(self, uniqnames: Iterable[str], validate_affiliation: bool = True,
+                                     chunk_size: int = 100) -> AsyncIterator[CheckEligibilityResponse]:
+        """
+        Check eligibility for many users, searching for up to max_workers chunks at once (see
+        EligibilityChecker.check_eligibility_concurrent). Use with async for.
+        :param uniqnames: the U-M usernames of the users to check for eligibility
+        :param validate_affiliation: see EligibilityChecker.check_eligibility
+        :param chunk_size: the maximum number of uniqnames to fetch in a single search
+        :return: async generator of CheckEligibilityResponse objects, in the same order as uniqnames
+        """
+        loop = asyncio.get_running_loop()
+        in_flight = deque()  # Bounded so that memory use does not grow with the number of uniqnames
+        try:
+            for chunk in chunked(uniqnames, chunk_size):
+                in_flight.append(loop.run_in_executor(self._executor, self._check_chunk, chunk, validate_affiliation))
+                if len(in_flight) >= self.max_workers:
+                    for response in await in_flight.popleft():
+                        yield response
+            while in_flight:
+                for response in await in_flight.popleft():
+                    yield response
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    async def close(self) -> None:
+        """
+        Shut down the thread pool, waiting for searches that are already running to finish.
+        :return: Nothing
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+
+    ###################
+    # Private Methods #
+    ###################
+    def _check_chunk(self, uniqnames: list, validate_affiliation: bool) -> list:
+        checker = self.checker
+        with checker.connection_pool.connection() as connection:
+            return list(checker._check_chunk_eligibility(connection, uniqnames, validate_affiliation))
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class EligibilityCache:
+    """
+    Bounded, thread-safe cache of eligibility decisions keyed by service and uniqname, evicting the least recently
+    used entry when full. Decisions are kept per service, so one cache can be shared by checkers for different
+    services. Eligible, ineligible, and errored decisions can each be kept for a different number of seconds; a TTL of 0
+    means that kind of decision is never cached.
+    """
+    max_size: int
+    positive_ttl: float
+    negative_ttl: float
+    error_ttl: float
+    hits: int
+    misses: int
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300, positive_ttl: Optional[float] = None,
+                 negative_ttl: Optional[float] = None, error_ttl: Optional[float] = 0):
+        """
+        :param max_size: the maximum number of decisions to keep
+        :param ttl: seconds to keep a decision for, unless overridden below
+        :param positive_ttl: seconds to keep eligible decisions for; defaults to ttl
+        :param negative_ttl: seconds to keep ineligible decisions for; defaults to ttl
+        :param error_ttl: seconds to keep decisions that have errors for; defaults to 0 so errors are retried
+        """
+        if max_size < 1:
+            raise ValueError(f'max_size must be at least 1, got {max_size}')
+        self.max_size = max_size
+        self.positive_ttl = ttl if positive_ttl is None else positive_ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.error_ttl = ttl if error_ttl is None else error_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (service, uniqname, validate_affiliation) -> (expires, response)
+        self._services = set()  # Every service that has been cached, so invalidate can find a user's entries
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, uniqname: str, validate_affiliation: bool = True, service: str = ''):
+        """
+        Get a cached decision if there is one that has not expired.
+        :param uniqname: the uniqname that was checked
+        :param validate_affiliation: the validate_affiliation that it was checked with
+        :param service: service_friendly of the checker that made the decision
+        :return: CheckEligibilityResponse object, or None on a miss
+        """
+        key = (service, uniqname.lower(), validate_affiliation)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, uniqname: str, validate_affiliation: bool, response, service: str = '') -> None:
+        """
+        Cache a decision for the TTL that matches its outcome.
+        :param uniqname: the uniqname that was checked
+        :param validate_affiliation: the validate_affiliation that it was checked with
+        :param response: CheckEligibilityResponse object to cache
+        :param service: service_friendly of the checker that made the decision
+        :return: Nothing
+        """
+        if response.errors:
+            ttl = self.error_ttl
+        elif response.eligible:
+            ttl = self.positive_ttl
+        else:
+            ttl = self.negative_ttl
+        if ttl <= 0:
+            return
+        key = (service, uniqname.lower(), validate_affiliation)
+        with self._lock:
+            self._services.add(service)
+            self._entries[key] = (time.monotonic() + ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, uniqname: str, service: Optional[str] = None) -> None:
+        """
+        Forget any cached decisions for a user, e.g. after their entitlements were changed.
+        :param uniqname: the uniqname to forget
+        :param service: only forget decisions for this service; None forgets them for every service
+        :return: Nothing
+        """
+        with self._lock:
+            for cached_service in (self._services if service is None else (service,)):
+                for validate_affiliation in (True, False):
+                    self._entries.pop((cached_service, uniqname.lower(), validate_affiliation), None)
+
+    def clear(self) -> None:
+        """
+        Forget all cached decisions. Hit and miss counts are kept.
+        :return: Nothing
+        """
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -1,33 +1,102 @@
 import logging
+import time
 from abc import ABC
-from typing import Union, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+from typing import Callable, Iterable, Iterator, Tuple, Union, Optional
 from warnings import warn
 
-from mcommunity import MCommunityGroup, MCommunityUser
+from mcommunity import MCommunityUser
+from mcommunity.mcommunity_base import MCommunityBase
+
+from eligibility_checker.cache import EligibilityCache
+from eligibility_checker.directory import (AFFILIATION_ATTRIBUTES, SERVICE_ENTITLEMENT_ATTRIBUTE,
+                                           PrefetchedMCommunityUser, chunked, only_service_entitlement, search_user,
+                                           search_users)
+from eligibility_checker.instrumentation import Instrumentation, Phase
+from eligibility_checker.overrides import override_group_membership
+from eligibility_checker.pool import MCommunityConnectionPool
+from eligibility_checker.resilience import CircuitOpenError, DirectoryGuard, is_transient
+from eligibility_checker.store import EligibilitySnapshotStore
+from eligibility_checker.rules import OVERRIDE_DECISION, Decision, EligibilityRules, ReasonCode
 
 logger = logging.getLogger(__name__)
 
 
 class CheckEligibilityResponse:
+    """
+    The result of an eligibility check. Only the fields the decision needs are stored; the MCommunityUser is either
+    kept as passed in or, if only a user_loader is given, fetched on first access of user. EligibilityChecker's loader
+    fetches the user with the same attributes as the check did, so either way the user has the same shape; a loader
+    that cannot reach MCommunity raises from user.
+    """
+    __slots__ = ('uniqname', 'eligible', 'reason', 'reason_code', 'errors', '_user', '_user_loader')
+
+    uniqname: str
     eligible: bool
     reason: str
-    user: MCommunityUser
+    reason_code: Optional[str]
     errors: Optional[BaseException]
 
-    def __init__(self, eligible: bool, reason: str, user: MCommunityUser, errors: Optional[BaseException]):
+    def __init__(self, eligible: bool, reason: str, user: Optional[MCommunityUser] = None,
+                 errors: Optional[BaseException] = None, uniqname: Optional[str] = None,
+                 reason_code: Optional[str] = None, user_loader: Optional[Callable[[], MCommunityUser]] = None):
+        self.uniqname = uniqname if uniqname is not None else user.name
         self.eligible = eligible
         self.reason = reason
-        self.user = user
+        self.reason_code = reason_code
         self.errors = errors
+        self._user = user
+        self._user_loader = user_loader
+
+        logger.info('%s eligibility is %s because %s.', self.uniqname, eligible, reason)  # Formatted only if enabled
+
+    @property
+    def user(self) -> Optional[MCommunityUser]:
+        if self._user is None and self._user_loader is not None:
+            self._user = self._user_loader()
+            self._user_loader = None
+        return self._user
 
-        logger.info(f'{user.name} eligibility is {eligible} because {reason}.')
+    @user.setter
+    def user(self, user: Optional[MCommunityUser]) -> None:
+        self._user = user
+
+    @property
+    def loaded_user(self) -> Optional[MCommunityUser]:
+        """
+        The MCommunityUser if it was kept or has already been fetched; unlike user, never fetches it.
+        :return: MCommunityUser object or None
+        """
+        return self._user
 
-    def to_dict(self):
-        d = self.__dict__.copy()
-        d['user'] = self.user.to_dict()
-        d['errors'] = self.errors.__repr__()
+    def to_dict(self, include_user: bool = True) -> dict:
+        """
+        Convert to a JSON serializable dictionary.
+        :param include_user: include the MCommunityUser as a dictionary; fetches it if it was not kept
+        :return: dictionary
+        """
+        d = {
+            'uniqname': self.uniqname,
+            'eligible': self.eligible,
+            'reason': self.reason,
+            'reason_code': self.reason_code,
+            'errors': self.errors.__repr__(),
+        }
+        if include_user:
+            user = self.user
+            d['user'] = user.to_dict() if user is not None else None
         return d
 
+    def to_tuple(self) -> tuple:
+        """
+        Convert to a compact tuple of (uniqname, eligible, reason_code, reason, errors repr or None).
+        :return: tuple
+        """
+        return self.uniqname, self.eligible, self.reason_code, self.reason, \
+            self.errors.__repr__() if self.errors is not None else None
+
 
 class EligibilityChecker(ABC):
     service_friendly: str  # Name of the service in Capital Case (ex: Google, Microsoft Teams, Slack)
@@ -35,29 +104,53 @@ class EligibilityChecker(ABC):
     # service_entitlement should be None if this service doesn't rely on uSE and only on affiliations
 
     override_groups: list = ['collab-iam-admins']
-    override_group_members: list = []
+    override_group_members: list = []  # If set on the class, used as-is and override_groups are not fetched
+    lazy_override_groups: bool = False  # Fetch override group members on the first check instead of in __init__
+    override_refresh_interval: Optional[float] = None  # Seconds between background refreshes of override groups
+    override_snapshot_path: Optional[str] = None  # JSON file to load override groups from and save them to
+    override_snapshot_max_age: Optional[float] = 86400  # Seconds; older groups in the snapshot are fetched again
+    stored_decision_max_age: float = 86400  # Seconds a stored decision can be served for while MCommunity is down
 
     eligible_affiliations_minus_sa: list = ['Faculty', 'RegularStaff', 'Student', 'TemporaryStaff']
     eligible_sa_types: list = [1]
 
+    # LDAP attributes asked for when fetching users; only what the eligibility decision needs. Attributes a check does
+    # not need (i.e. affiliations when validate_affiliation=False) are left out of its search
+    mcommunity_user_attributes: list = ['uid', 'umichServiceEntitlement', 'umichInstRoles', 'umichSponsorshipDetail']
+
     mcommunity_app_cn: str = ''
     mcommunity_secret: str = ''
+    mcommunity_pool_size: int = 8  # Maximum number of MCommunity connections shared by bulk and concurrent checks
+    mcommunity_search_timeout: Optional[float] = None  # Seconds before a search on a pooled connection is abandoned
+    retain_mcommunity_users: bool = True  # Keep the MCommunityUser on responses; if False it is re-fetched on access
 
     slack_errors_channel: str = ''
 
-    def __init__(self, mcommunity_app_cn, mcommunity_secret):
+    def __init__(self, mcommunity_app_cn, mcommunity_secret, cache: Optional[EligibilityCache] = None,
+                 instrumentation: Optional[Instrumentation] = None, guard: Optional[DirectoryGuard] = None,
+                 store: Optional[EligibilitySnapshotStore] = None):
         self.mcommunity_app_cn = mcommunity_app_cn
         self.mcommunity_secret = mcommunity_secret
-        if not self.override_group_members:  # Don't overwrite if it is already populated
-            for group in self.override_groups:  # Populate override_group_members
-                members = MCommunityGroup(group, self.mcommunity_app_cn, self.mcommunity_secret).members
-                if not members:
-                    raise RuntimeError(f'Got 0 members for {group}. If the group is not being used anymore, remove it '
-                                       f'from override_groups. If it is being used and has members, make sure the '
-                                       f'MCommunity app {self.mcommunity_app_cn} is an owner of the MCommunity group '
-                                       f'to give it access to read group membership.')
-                self.override_group_members += members
-        self.override_group_members = list(set(self.override_group_members))  # Remove duplicates
+        self.cache = cache  # Optional; consulted before going to MCommunity
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()  # No-op default
+        self.guard = guard  # Optional; rate limits, retries, and circuit breaks searches
+        self.store = store  # Optional; latest stored decisions are served when MCommunity is unavailable
+        self._connection_pool = None
+        self._rules = None  # Compiled by _validate
+        self._override_members_version = None
+        self._static_override_members = None
+        if self.override_group_members:  # Don't overwrite if it is already populated
+            self._static_override_members = frozenset(self.override_group_members)
+            self.override_group_members = self._static_override_members
+        else:
+            if self.override_snapshot_path:
+                override_group_membership.load(self.override_snapshot_path, max_age=self.override_snapshot_max_age)
+            if self.override_refresh_interval:
+                override_group_membership.start_refresh(self.override_groups, self.mcommunity_app_cn,
+                                                        self.mcommunity_secret, self.override_refresh_interval)
+            self.override_group_members = frozenset()
+            if not self.lazy_override_groups:
+                self._get_override_group_members()
         self._validate()
 
     ##################
@@ -72,37 +165,441 @@ class EligibilityChecker(ABC):
         (use prior to destructive actions in case of bugs in uSE); no effect if self.service_entitlement is None
         :return: CheckEligibilityResponse object containing eligibility information
         """
-        user = MCommunityUser(uniqname, self.mcommunity_app_cn, self.mcommunity_secret)
-        if user.errors:
-            return CheckEligibilityResponse(eligible=False, reason=str(user.errors), user=user, errors=user.errors)
-        elif uniqname in self.override_group_members:
-            return CheckEligibilityResponse(eligible=True, reason='Override group member', user=user, errors=None)
-        else:
-            if self.service_entitlement:  # This services relies on uSE for eligibility
-                eligible = user.check_service_entitlement(self.service_entitlement)
-                reason = f'{self.service_entitlement} entitlement is {eligible}'
-                if validate_affiliation:
-                    eligible_via_affiliations = self._check_affiliation_eligibility(user)
-                    if not eligible and eligible_via_affiliations.eligible:
-                        error = RuntimeError(
-                            f'Highest affiliation {user.highest_affiliation} shows {user.name} should have a valid '
-                            f'{self.service_entitlement} entitlement but they do not'
-                        )
-                        return CheckEligibilityResponse(eligible=True, reason=str(error), user=user, errors=error)
-                    else:
-                        logger.info(
-                            f'{self.service_entitlement} service entitlement ({eligible}) and affiliations '
-                            f'{user.highest_affiliation} validated for {user.name}.'
-                        )
-                        return CheckEligibilityResponse(eligible=eligible, reason=reason, user=user, errors=None)
-                else:
-                    return CheckEligibilityResponse(eligible=eligible, reason=reason, user=user, errors=None)
-            else:  # This service does not rely on uSE for eligibility
-                return self._check_affiliation_eligibility(user)  # No further validation necessary or possible
+        if self.cache is not None:
+            cached = self.cache.get(uniqname, validate_affiliation, self.service_friendly)
+            if cached is not None:
+                return cached
+        return self._fetch_and_check(uniqname, validate_affiliation)
+
+    def check_eligibility_many(self, uniqnames: Iterable[str], validate_affiliation: bool = True,
+                               chunk_size: int = 100) -> Iterator[CheckEligibilityResponse]:
+        """
+        Check eligibility for many users, fetching them from MCommunity in chunks with one OR-filtered search per chunk
+        instead of one search per user. Users that are not found or that error get their own error response.
+        :param uniqnames: the U-M usernames of the users to check for eligibility
+        :param validate_affiliation: see check_eligibility
+        :param chunk_size: the maximum number of uniqnames to fetch in a single search
+        :return: generator of CheckEligibilityResponse objects, in the same order as uniqnames
+        """
+        with self.connection_pool.connection() as connection:
+            for chunk in chunked(uniqnames, chunk_size):
+                yield from self._check_chunk_eligibility(connection, chunk, validate_affiliation)
+
+    def check_eligibility_concurrent(self, uniqnames: Iterable[str], validate_affiliation: bool = True,
+                                     max_workers: int = 8, chunk_size: int = 1,
+                                     timeout: Optional[float] = None) -> Iterator[CheckEligibilityResponse]:
+        """
+        Check eligibility for many users in parallel threads, each using a connection from the shared connection pool.
+        Decisions are identical to check_eligibility; only the fetching is done concurrently.
+        :param uniqnames: the U-M usernames of the users to check for eligibility
+        :param validate_affiliation: see check_eligibility
+        :param max_workers: the number of threads; also bounded by mcommunity_pool_size since each thread needs its
+        own connection
+        :param chunk_size: the number of uniqnames each thread fetches in a single search (see check_eligibility_many)
+        :param timeout: seconds after a chunk starts running that it gets error responses if it has not finished. Its
+        searches are also limited to this at the LDAP level once the pooled connection has connected (see
+        MCommunityConnectionPool), so the thread is usually freed rather than left searching. None waits forever (or
+        for mcommunity_search_timeout, if set)
+        :return: generator of CheckEligibilityResponse objects, in the same order as uniqnames
+        """
+        if max_workers < 1:
+            raise ValueError(f'max_workers must be at least 1, got {max_workers}')
+        pool = self.connection_pool
+        search_timeout = timeout
+        if timeout is not None and pool.search_timeout is not None:
+            search_timeout = min(timeout, pool.search_timeout)
+
+        def check_chunk(chunk: list, started: list) -> list:
+            with pool.connection(search_timeout=search_timeout) as connection:
+                started.append(time.monotonic())
+                return list(self._check_chunk_eligibility(connection, chunk, validate_affiliation))
+
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='eligibility-checker')
+        in_flight = deque()  # Bounded so that memory use does not grow with the number of uniqnames
+        try:
+            for chunk in chunked(uniqnames, chunk_size):
+                started = []  # Gets the time.monotonic() the chunk started running at, once it has a connection
+                in_flight.append((chunk, started, executor.submit(check_chunk, chunk, started)))
+                if len(in_flight) >= max_workers * 2:
+                    yield from self._collect_chunk(*in_flight.popleft(), timeout=timeout)
+            while in_flight:
+                yield from self._collect_chunk(*in_flight.popleft(), timeout=timeout)
+        finally:
+            # Chunks that have not started are cancelled; running ones end by their search timeout at the latest.
+            # Cancelled one by one since shutdown's cancel_futures needs Python 3.9
+            for _, _, future in in_flight:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    @property
+    def connection_pool(self) -> MCommunityConnectionPool:
+        """
+        The pool of MCommunity connections used by bulk and concurrent checks, created on first use.
+        :return: MCommunityConnectionPool object
+        """
+        if self._connection_pool is None:
+            self._connection_pool = MCommunityConnectionPool(
+                self.mcommunity_app_cn, self.mcommunity_secret, size=self.mcommunity_pool_size,
+                search_timeout=self.mcommunity_search_timeout)
+        return self._connection_pool
+
+    @property
+    def rules(self) -> EligibilityRules:
+        """
+        The configuration compiled by _validate, recompiled if any of the attributes it was built from have changed.
+        :return: EligibilityRules object
+        """
+        key = EligibilityRules.make_key(self.service_friendly, self.service_entitlement,
+                                        self.eligible_affiliations_minus_sa, self.eligible_sa_types)
+        if self._rules is None or key != self._rules.key:
+            self._rules = EligibilityRules.compile(self)
+        return self._rules
+
+    def evaluate_records(self, records: Iterable[dict],
+                         validate_affiliation: bool = True) -> Iterator[Tuple[str, Decision]]:
+        """
+        Decide eligibility for already-fetched data without building MCommunityUser objects or responses.
+        :param records: dictionaries with uid, entitlements (the uSE systems the user has), highest_affiliation, and
+        sa_type (None if the user is not a sponsored affiliate)
+        :param validate_affiliation: see check_eligibility
+        :return: generator of (uniqname, Decision), in the same order as records
+        """
+        evaluate = self.rules.evaluate
+        override_members = self._get_override_group_members()
+        for record in records:
+            yield record['uid'], evaluate(record, override_members, validate_affiliation)
 
     ###################
     # Private Methods #
     ###################
+    def _check_user_eligibility(self, user: MCommunityUser, validate_affiliation: bool) -> CheckEligibilityResponse:
+        """
+        Make the eligibility decision for a user that has already been fetched from MCommunity.
+        :param user: MCommunityUser object for the user
+        :param validate_affiliation: see check_eligibility
+        :return: CheckEligibilityResponse object containing eligibility information
+        """
+        uniqname = user.name
+        rules = self.rules
+        timer = self.instrumentation.timer
+        service = self.service_friendly
+        if is_transient(user.errors):
+            return self._directory_error_response(user, user.errors)
+        if user.errors:
+            return self._response(False, str(user.errors), ReasonCode.ERROR, user, user.errors, validate_affiliation)
+        with timer(service, Phase.OVERRIDE_LOOKUP):
+            is_override_member = uniqname in self._get_override_group_members()
+        if is_override_member:
+            return self._decided(user, OVERRIDE_DECISION, validate_affiliation)
+        elif rules.service_entitlement:  # This services relies on uSE for eligibility
+            with timer(service, Phase.ENTITLEMENT_CHECK):
+                decision = rules.entitlement_decision(user.check_service_entitlement(rules.service_entitlement))
+            if validate_affiliation:
+                with timer(service, Phase.AFFILIATION_VALIDATION):
+                    eligible_via_affiliations = self._affiliation_decision(user, rules).eligible
+                if not decision.eligible and eligible_via_affiliations:
+                    decision = rules.mismatch_decision(user.name, user.highest_affiliation)
+                else:
+                    logger.info('%s service entitlement (%s) and affiliations %s validated for %s.',
+                                rules.service_entitlement, decision.eligible, user.highest_affiliation, user.name)
+            return self._decided(user, decision, validate_affiliation)
+        else:  # This service does not rely on uSE for eligibility
+            with timer(service, Phase.AFFILIATION_VALIDATION):
+                decision = self._affiliation_decision(user, rules)
+            return self._decided(user, decision, validate_affiliation)  # No further validation necessary or possible
+
+    def _get_override_group_members(self) -> frozenset:
+        """
+        Get the members of all override groups from the process-wide snapshot, rebuilding self.override_group_members
+        only when the snapshot has changed since the last call.
+        :return: frozenset of uniqnames
+        """
+        if self._static_override_members is not None:
+            return self._static_override_members
+        version = override_group_membership.version
+        if version == self._override_members_version:
+            return self.override_group_members
+        with self.instrumentation.timer(self.service_friendly, Phase.OVERRIDE_GROUP_FETCH):
+            while version != self._override_members_version:
+                self.override_group_members = frozenset().union(*(
+                    override_group_membership.get(group, self.mcommunity_app_cn, self.mcommunity_secret)
+                    for group in self.override_groups
+                ))
+                self._override_members_version = version  # Taken before fetching, so a refresh during it is not missed
+                # Fetching a group that was not in the snapshot yet bumps the version too; going round again is then a
+                # quick rebuild from the snapshot, which also picks up any refresh that happened while fetching
+                version = override_group_membership.version
+        if self.override_snapshot_path:
+            override_group_membership.save(self.override_snapshot_path)
+        return self.override_group_members
+
+    def _check_chunk_eligibility(self, connection: MCommunityBase, uniqnames: list,
+                                 validate_affiliation: bool) -> Iterator[CheckEligibilityResponse]:
+        """
+        Fetch a chunk of users with a single search and check each of their eligibility.
+        :param connection: MCommunityBase object to run the search with
+        :param uniqnames: the uniqnames in this chunk
+        :param validate_affiliation: see check_eligibility
+        :return: generator of CheckEligibilityResponse objects, in the same order as uniqnames
+        """
+        cached = {}
+        if self.cache is not None:
+            for uniqname in uniqnames:
+                response = self.cache.get(uniqname, validate_affiliation, self.service_friendly)
+                if response is not None:
+                    cached[uniqname] = response
+        fetched = self._fetch_results(connection, [uniqname for uniqname in uniqnames if uniqname not in cached],
+                                      self._user_attributes(validate_affiliation))
+        for uniqname in uniqnames:
+            if uniqname in cached:
+                yield cached[uniqname]
+            else:
+                yield self._check_result(uniqname, next(fetched)[1], validate_affiliation)
+
+    def _fetch_and_check(self, uniqname: str, validate_affiliation: bool) -> CheckEligibilityResponse:
+        """
+        Fetch a single user and check their eligibility, caching the response if there is a cache.
+        :param uniqname: the uniqname to check
+        :param validate_affiliation: see check_eligibility
+        :return: CheckEligibilityResponse object containing eligibility information
+        """
+        attributes = self._user_attributes(validate_affiliation, uniqname in self._get_override_group_members())
+        return self._check_result(uniqname, self._fetch_result(uniqname, attributes), validate_affiliation)
+
+    def _check_result(self, uniqname: str, raw_result: Union[list, Exception],
+                      validate_affiliation: bool) -> CheckEligibilityResponse:
+        """
+        Check the eligibility of a user from their search result, caching the response if there is a cache.
+        :param uniqname: the uniqname that was fetched
+        :param raw_result: its search result, or the exception that stopped the search
+        :param validate_affiliation: see check_eligibility
+        :return: CheckEligibilityResponse object containing eligibility information
+        """
+        if isinstance(raw_result, Exception):
+            return self._error_response(uniqname, raw_result)
+        response = self._check_user_eligibility(self._prefetched_user(uniqname, raw_result), validate_affiliation)
+        if self.cache is not None:
+            self.cache.set(uniqname, validate_affiliation, response, self.service_friendly)
+        return response
+
+    def _fetch_results(self, connection: MCommunityBase, uniqnames: list,
+                       attributes: list) -> Iterator[Tuple[str, Union[list, Exception]]]:
+        """
+        Fetch a chunk of users with a single search, falling back to one search per user if it fails so that each
+        user gets their own result or error. CompositeEligibilityChecker fetches through this too, with the union of
+        its checkers' attributes.
+        :param connection: MCommunityBase object to run the searches with
+        :param uniqnames: the uniqnames in this chunk
+        :param attributes: the LDAP attributes to ask for
+        :return: generator of (uniqname, its search result or the exception that stopped its search), in the same
+        order as uniqnames
+        """
+        if not uniqnames:
+            return
+        bulk_error = None
+        try:
+            results = self._search_users(connection, uniqnames, attributes=attributes)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            self.instrumentation.count_error(self.service_friendly, e)
+            results = None
+            if self.guard is not None and is_transient(e):  # Already retried; searching one at a time adds load
+                logger.warning('Bulk search for %s users failed (%r) after retries.', len(uniqnames), e)
+                bulk_error = e
+            else:
+                logger.warning('Bulk search for %s users failed (%r); checking them one at a time.', len(uniqnames), e)
+        for uniqname in uniqnames:
+            if bulk_error is not None:
+                yield uniqname, bulk_error
+            elif results is None:  # Search on the connection this chunk holds; taking another could deadlock the pool
+                yield uniqname, self._fetch_result(uniqname, attributes, connection)
+            else:
+                yield uniqname, results.get(uniqname, [])
+
+    def _fetch_result(self, uniqname: str, attributes: list,
+                      connection: Optional[MCommunityBase] = None) -> Union[list, Exception]:
+        """
+        Fetch a single user's search result, returning rather than raising the error if the search fails.
+        :param uniqname: the uniqname to fetch
+        :param attributes: the LDAP attributes to ask for
+        :param connection: see _search_user
+        :return: the search result, or the exception that stopped the search (after the guard's retries, if there is
+        a guard)
+        """
+        try:
+            with self.instrumentation.timer(self.service_friendly, Phase.USER_FETCH):
+                return self._search_user(uniqname, attributes, connection)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            return e
+
+    def _fetch_user(self, uniqname: str, validate_affiliation: bool = True) -> MCommunityUser:
+        """
+        Fetch a user from MCommunity, asking only for the attributes this check needs, through the guard if there is
+        one. Search errors are raised rather than left on user.errors.
+        :param uniqname: the uniqname to fetch
+        :param validate_affiliation: see check_eligibility
+        :return: MCommunityUser object
+        """
+        attributes = self._user_attributes(validate_affiliation, uniqname in self._get_override_group_members())
+        return self._prefetched_user(uniqname, self._search_user(uniqname, attributes))
+
+    def _search_user(self, uniqname: str, attributes: list, connection: Optional[MCommunityBase] = None) -> list:
+        """
+        Fetch a single user's search result (see directory.search_user), through the guard if there is one.
+        :param uniqname: the uniqname to fetch
+        :param attributes: the LDAP attributes to ask for
+        :param connection: MCommunityBase object to search with, i.e. one a chunk already holds; if None, one is
+        checked out of the connection pool
+        :return: the search result; empty if the user was not found
+        """
+        def fetch() -> list:
+            if connection is not None:
+                return search_user(connection, uniqname, attributes)
+            with self.connection_pool.connection() as pooled:
+                return search_user(pooled, uniqname, attributes)
+        return fetch() if self.guard is None else self.guard.call(fetch)
+
+    def _search_users(self, connection: MCommunityBase, uniqnames: list, extra_filter: Optional[str] = None,
+                      attributes: Optional[list] = None) -> dict:
+        """
+        Fetch many users with a single search (see directory.search_users), through the guard if there is one.
+        :param connection: MCommunityBase object to run the search with
+        :param uniqnames: the uniqnames to fetch
+        :param extra_filter: optional LDAP filter that entries must also match
+        :param attributes: the LDAP attributes to ask for; defaults to mcommunity_user_attributes
+        :return: dictionary of uniqname to its search result; users not found are left out
+        """
+        attributes = attributes if attributes is not None else self._user_attributes(True)
+        with self.instrumentation.timer(self.service_friendly, Phase.USER_FETCH):
+            if self.guard is None:
+                return search_users(connection, uniqnames, attributes, extra_filter)
+            return self.guard.call(search_users, connection, uniqnames, attributes, extra_filter)
+
+    def _user_attributes(self, validate_affiliation: bool, override_member: bool = False) -> list:
+        """
+        The attributes to fetch for a check: mcommunity_user_attributes minus the ones the decision will not look at.
+        Override members only need to exist, uSE is only needed if service_entitlement is set, and affiliations are
+        only needed without uSE or to validate it.
+        :param validate_affiliation: see check_eligibility
+        :param override_member: whether the user is an override group member
+        :return: list of LDAP attributes
+        """
+        service_entitlement = self.rules.service_entitlement
+        skip = set()
+        if override_member or not service_entitlement:
+            skip.add(SERVICE_ENTITLEMENT_ATTRIBUTE)
+        if override_member or (service_entitlement and not validate_affiliation):
+            skip.update(AFFILIATION_ATTRIBUTES)
+        if not skip:
+            return self.mcommunity_user_attributes
+        return [attribute for attribute in self.mcommunity_user_attributes if attribute not in skip]
+
+    def _prefetched_user(self, uniqname: str, raw_result: list) -> PrefetchedMCommunityUser:
+        """
+        Build an MCommunityUser from a search result, keeping only the umichServiceEntitlement values for
+        service_entitlement so that no other entitlement is ever parsed.
+        :param uniqname: the uniqname that was fetched
+        :param raw_result: its search result
+        :return: PrefetchedMCommunityUser object
+        """
+        service_entitlement = self.rules.service_entitlement
+        if service_entitlement:
+            raw_result = only_service_entitlement(raw_result, service_entitlement)
+        return PrefetchedMCommunityUser(uniqname, self.mcommunity_app_cn, self.mcommunity_secret, raw_result)
+
+    def _collect_chunk(self, uniqnames: list, started: list, future,
+                       timeout: Optional[float]) -> Iterator[CheckEligibilityResponse]:
+        """
+        Wait for a chunk submitted by check_eligibility_concurrent, turning a timeout or crash into error responses.
+        Time the chunk spends queued behind other chunks does not count towards its timeout.
+        :param uniqnames: the uniqnames in this chunk
+        :param started: empty until the chunk starts running, then holds the time.monotonic() it started at
+        :param future: the Future for the chunk
+        :param timeout: seconds after the chunk starts running to wait for it; None waits forever
+        :return: generator of CheckEligibilityResponse objects, in the same order as uniqnames
+        """
+        while not future.done():
+            if timeout is None:
+                wait((future,))
+            elif not started:  # Still queued, so its timeout has not begun; check again once it could have
+                wait((future,), timeout=timeout)
+            else:
+                remaining = timeout - (time.monotonic() - started[0])
+                if remaining <= 0:
+                    future.cancel()
+                    for uniqname in uniqnames:
+                        yield self._error_response(
+                            uniqname, TimeoutError(f'Timed out after {timeout} seconds checking {uniqname}'))
+                    return
+                wait((future,), timeout=remaining)
+        try:
+            responses = future.result()
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            responses = [self._error_response(uniqname, e) for uniqname in uniqnames]
+        yield from responses
+
+    def _error_response(self, uniqname: str, error: BaseException) -> CheckEligibilityResponse:
+        """
+        Build the response for a user whose check failed before a decision could be made.
+        :param uniqname: the uniqname that was being checked
+        :param error: the exception that stopped the check
+        :return: CheckEligibilityResponse object with eligible=False
+        """
+        user = PrefetchedMCommunityUser(uniqname, self.mcommunity_app_cn, self.mcommunity_secret, [])
+        if is_transient(error):
+            return self._directory_error_response(user, error)
+        return self._response(False, str(error), ReasonCode.ERROR, user, error)
+
+    def _directory_error_response(self, user: MCommunityUser, error: BaseException) -> CheckEligibilityResponse:
+        """
+        Build the response for a user who could not be checked because MCommunity was unavailable: their latest stored
+        decision if there is a store and a recent enough one, else an error with ReasonCode.DIRECTORY_ERROR. Either way
+        errors is set, so the response is not mistaken for (or cached as) a fresh decision.
+        :param user: MCommunityUser object for the user
+        :param error: the transient error
+        :return: CheckEligibilityResponse object
+        """
+        if self.store is not None:
+            stored = self.store.latest(user.name, self.service_friendly, max_age=self.stored_decision_max_age)
+            if stored is not None:
+                checked = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stored.checked_at))
+                return self._response(stored.eligible, f'{stored.reason} (stored decision from {checked}; '
+                                      f'MCommunity unavailable: {error})', stored.reason_code, user, error)
+        return self._response(False, str(error), ReasonCode.DIRECTORY_ERROR, user, error)
+
+    def _response(self, eligible: bool, reason: str, reason_code: str, user: MCommunityUser,
+                  errors: Optional[BaseException] = None,
+                  validate_affiliation: Optional[bool] = None) -> CheckEligibilityResponse:
+        """
+        Build a response, keeping the MCommunityUser on it only if retain_mcommunity_users is set. Otherwise the user
+        is fetched again on access with _fetch_user, i.e. with the same attributes and entitlement filtering as the
+        check, so it has the same shape as a kept user would.
+        :param eligible: whether the user is eligible
+        :param reason: human-readable reason for the decision
+        :param reason_code: ReasonCode for the decision
+        :param user: MCommunityUser object for the user
+        :param errors: the exception, if any
+        :param validate_affiliation: what the user was checked with, to fetch them again the same way; None always
+        keeps the user (i.e. the empty stand-in of a check that failed before a user was fetched)
+        :return: CheckEligibilityResponse object
+        """
+        instrumentation = self.instrumentation
+        instrumentation.count_decision(self.service_friendly, reason_code, eligible)
+        if errors is not None:
+            instrumentation.count_error(self.service_friendly, errors)
+        with instrumentation.timer(self.service_friendly, Phase.RESPONSE_BUILD):
+            if self.retain_mcommunity_users or validate_affiliation is None:
+                return CheckEligibilityResponse(eligible=eligible, reason=reason, user=user, errors=errors,
+                                                reason_code=reason_code)
+            return CheckEligibilityResponse(
+                eligible=eligible, reason=reason, errors=errors, uniqname=user.name, reason_code=reason_code,
+                user_loader=partial(self._fetch_user, user.name, validate_affiliation))
+
     def _check_affiliation_eligibility(self, user: MCommunityUser) -> CheckEligibilityResponse:
         """
         Given an MCommunity user, check if their affiliation(s), including sponsored affiliate type if applicable,
@@ -110,22 +607,23 @@ class EligibilityChecker(ABC):
         :param user: MCommunityUser object for the user
         :return: CheckEligibilityResponse object containing eligibility information
         """
+        return self._decided(user, self._affiliation_decision(user, self.rules), True)
+
+    @staticmethod
+    def _affiliation_decision(user: MCommunityUser, rules: EligibilityRules) -> Decision:
+        """
+        Decide eligibility from a user's highest affiliation and, for sponsored affiliates, their sponsorship type.
+        :param user: MCommunityUser object for the user
+        :param rules: the compiled rules to decide with
+        :return: Decision
+        """
         user.populate_highest_affiliation()
-        sa_type = user.check_sponsorship_type()
-        if sa_type:  # This person is a sponsored affiliate type 1, 2, or 3
-            if sa_type in self.eligible_sa_types:
-                eligible = True
-                reason = f'Sponsored affiliates t{sa_type} are eligible for {self.service_friendly}'
-            else:
-                eligible = False
-                reason = f'Sponsored affiliates t{sa_type} are not eligible for {self.service_friendly}'
-        elif user.highest_affiliation in self.eligible_affiliations_minus_sa:
-            eligible = True
-            reason = f'{user.highest_affiliation} are eligible for {self.service_friendly}'
-        else:  # Neither sponsored affiliate type nor highest affiliation are in the eligible affiliations for service
-            eligible = False
-            reason = f'{user.highest_affiliation} are not eligible for {self.service_friendly}'
-        return CheckEligibilityResponse(eligible=eligible, reason=reason, user=user, errors=None)
+        return rules.affiliation_decision(user.highest_affiliation, user.check_sponsorship_type())
+
+    def _decided(self, user: MCommunityUser, decision: Decision,
+                 validate_affiliation: Optional[bool] = None) -> CheckEligibilityResponse:
+        return self._response(decision.eligible, decision.reason, decision.reason_code, user, decision.errors,
+                              validate_affiliation)
 
     def _validate(self) -> None:
         """
@@ -154,3 +652,4 @@ class EligibilityChecker(ABC):
                     raise RuntimeError(f'eligible_sa_types contains an invalid entry {i} (must be 1, 2, and/or 3)')
         else:
             warn('eligible_sa_types is empty. Are you sure that no sponsored affiliates are eligible?')
+        self._rules = EligibilityRules.compile(self)
@@ -0,0 +1,225 @@
+import argparse
+import csv
+import importlib
+import json
+import os
+import sys
+import time
+from itertools import chain
+from typing import Iterable, Iterator, Optional, TextIO, Tuple
+
+from eligibility_checker.checker import CheckEligibilityResponse, EligibilityChecker
+from eligibility_checker.directory import chunked
+from eligibility_checker.resilience import AdaptiveRateLimiter, CircuitOpenError, DirectoryGuard
+from eligibility_checker.rules import ReasonCode
+from eligibility_checker.store import EligibilitySnapshotStore
+
+CSV_FIELDS = ['uniqname', 'eligible', 'reason_code', 'reason', 'errors']
+
+
+def load_checker_class(path: str) -> type:
+    """
+    Import an EligibilityChecker subclass from a dotted path.
+    :param path: dotted path to the class, i.e. myproj.zoom_eligibility_checker.ZoomEligibilityChecker
+    :return: the class
+    """
+    module_name, _, class_name = path.rpartition('.')
+    if not module_name:
+        raise ValueError(f'{path} is not a dotted path to a class (i.e. myproj.module.ClassName)')
+    checker_class = getattr(importlib.import_module(module_name), class_name)
+    if not (isinstance(checker_class, type) and issubclass(checker_class, EligibilityChecker)):
+        raise TypeError(f'{path} is not a subclass of EligibilityChecker')
+    return checker_class
+
+
+def read_uniqnames(f: TextIO, skip: int = 0) -> Iterator[Tuple[int, str]]:
+    """
+    Stream uniqnames from a file with one uniqname per line, skipping blank lines and # comments.
+    :param f: the file to read
+    :param skip: the number of lines to skip, i.e. the lines already done according to a checkpoint
+    :return: generator of (line number, uniqname)
+    """
+    for line_number, line in enumerate(f, start=1):
+        if line_number <= skip:
+            continue
+        uniqname = line.strip()
+        if uniqname and not uniqname.startswith('#'):
+            yield line_number, uniqname
+
+
+def read_checkpoint(path: Optional[str]) -> dict:
+    """
+    Read the progress of an interrupted sweep.
+    :param path: the checkpoint file; None or a missing file means there is nothing to resume
+    :return: dictionary with lines_done (the input lines already done), run_id (the store run being recorded into),
+    and retry (uniqnames that MCommunity was unavailable for, to check again)
+    """
+    checkpoint = {'lines_done': 0, 'run_id': None, 'retry': []}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            checkpoint.update(json.load(f))
+    return checkpoint
+
+
+def write_checkpoint(path: Optional[str], lines_done: int, run_id: Optional[int] = None,
+                     retry: Iterable[str] = ()) -> None:
+    if not path:
+        return
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'lines_done': lines_done, 'run_id': run_id, 'retry': list(retry)}, f)
+    os.replace(tmp_path, path)
+
+
+class ResponseWriter:
+    """
+    Writes responses to a file as JSON lines or CSV rows, flushing after every batch so a checkpoint never gets ahead
+    of the output.
+    """
+    def __init__(self, f: TextIO, output_format: str, write_header: bool = True, include_user: bool = True):
+        self.f = f
+        self.output_format = output_format
+        self.include_user = include_user
+        if output_format == 'csv':
+            self._csv = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            if write_header:
+                self._csv.writeheader()
+
+    def write(self, response: CheckEligibilityResponse) -> None:
+        if self.output_format == 'csv':
+            self._csv.writerow({'uniqname': response.uniqname, 'eligible': response.eligible,
+                                'reason_code': response.reason_code, 'reason': response.reason,
+                                'errors': repr(response.errors) if response.errors else ''})
+        else:
+            self.f.write(json.dumps(response.to_dict(include_user=self.include_user)) + '\n')
+
+    def flush(self) -> None:
+        self.f.flush()
+
+
+def sweep(args: argparse.Namespace) -> int:
+    guard = None
+    if args.max_rate is not None:
+        guard = DirectoryGuard(AdaptiveRateLimiter(rate=args.max_rate, min_rate=min(1, args.max_rate),
+                                                   max_rate=args.max_rate))
+    store = EligibilitySnapshotStore(args.store) if args.store else None
+    checker = load_checker_class(args.checker)(args.app_cn, args.secret, guard=guard, store=store)
+    checker.retain_mcommunity_users = args.format == 'jsonl' and args.include_user  # Only keep users that are written
+    checkpoint = read_checkpoint(args.checkpoint)
+    lines_done = checkpoint['lines_done']
+    retrying = checkpoint['retry']  # Checked again before the rest of the input
+    resuming = lines_done > 0 or bool(retrying)
+    if resuming and args.output == '-':
+        print('Cannot resume from a checkpoint when writing to stdout; use --output.', file=sys.stderr)
+        return 2
+    in_f = sys.stdin if args.input == '-' else open(args.input)
+    out_f = sys.stdout if args.output == '-' else open(args.output, 'a' if resuming else 'w', newline='')
+    run_id = None
+    if store is not None:
+        # A resumed sweep keeps recording into the run it started, so the run has every decision of the sweep
+        run_id = checkpoint['run_id'] if resuming and checkpoint['run_id'] is not None else \
+            store.start_run(checker.service_friendly)
+    try:
+        writer = ResponseWriter(out_f, args.format, write_header=not resuming, include_user=args.include_user)
+        checked = eligible = 0
+        retry = []  # Uniqnames from this invocation that MCommunity was unavailable for
+        started = time.monotonic()
+        lines = chain(((None, uniqname) for uniqname in retrying), read_uniqnames(in_f, skip=lines_done))
+        for batch in chunked(lines, args.batch_size * args.workers):
+            uniqnames = [uniqname for _, uniqname in batch]
+            if args.workers > 1:
+                responses = checker.check_eligibility_concurrent(
+                    uniqnames, validate_affiliation=args.validate_affiliation, max_workers=args.workers,
+                    chunk_size=args.batch_size)
+            else:
+                responses = checker.check_eligibility_many(
+                    uniqnames, validate_affiliation=args.validate_affiliation, chunk_size=args.batch_size)
+            # Checked in full before anything is written, so a batch that is cut short (i.e. by the circuit opening)
+            # leaves no output behind to be written again on resume
+            responses = list(responses)
+            if store is not None:
+                store.record(run_id, responses)
+            for response in responses:
+                if args.checkpoint and response.reason_code == ReasonCode.DIRECTORY_ERROR:
+                    retry.append(response.uniqname)  # Not a decision; checked again when the sweep is resumed
+                    continue
+                writer.write(response)
+                checked += 1
+                eligible += response.eligible
+            writer.flush()
+            retried = sum(line_number is None for line_number, _ in batch)
+            retrying = retrying[retried:]
+            lines_done = batch[-1][0] or lines_done
+            write_checkpoint(args.checkpoint, lines_done, run_id, retrying + retry)
+            if args.progress:
+                rate = checked / max(time.monotonic() - started, 1e-9)
+                print(f'{checked} checked, {eligible} eligible ({rate:.1f}/s)', file=sys.stderr)
+        if retry:
+            print(f'MCommunity was unavailable for {len(retry)} users; run again with the same --checkpoint to check '
+                  f'them.', file=sys.stderr)
+            return 3
+        if store is not None:
+            store.finish_run(run_id)
+    except CircuitOpenError as e:
+        print(f'Stopped: {e}. Guard stats: {json.dumps(guard.stats())}', file=sys.stderr)
+        return 3
+    finally:
+        if store is not None:
+            store.close()
+        if in_f is not sys.stdin:
+            in_f.close()
+        if out_f is not sys.stdout:
+            out_f.close()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='eligibility-checker',
+                                     description='Check eligibility for U-M ITS Collaboration Services')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sweep_parser = subparsers.add_parser('sweep', help='Check eligibility for every uniqname in a file or stdin')
+    sweep_parser.add_argument('--checker', required=True,
+                              help='Dotted path to an EligibilityChecker subclass, i.e. myproj.ZoomEligibilityChecker')
+    sweep_parser.add_argument('--app-cn', default=os.environ.get('MCOMMUNITY_APP_CN'),
+                              help='MCommunity app cn (default: $MCOMMUNITY_APP_CN)')
+    sweep_parser.add_argument('--secret', default=os.environ.get('MCOMMUNITY_SECRET'),
+                              help='MCommunity app secret (default: $MCOMMUNITY_SECRET)')
+    sweep_parser.add_argument('--input', default='-', help='File with one uniqname per line (default: stdin)')
+    sweep_parser.add_argument('--output', default='-', help='File to write results to (default: stdout)')
+    sweep_parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl', help='Output format')
+    sweep_parser.add_argument('--batch-size', type=int, default=100,
+                              help='Number of uniqnames fetched from MCommunity in a single search')
+    sweep_parser.add_argument('--workers', type=int, default=1, help='Number of concurrent MCommunity searches')
+    sweep_parser.add_argument('--no-validate-affiliation', dest='validate_affiliation', action='store_false',
+                              help='Do not validate uSE against affiliations')
+    sweep_parser.add_argument('--no-user', dest='include_user', action='store_false',
+                              help='Leave the MCommunity user out of JSON lines output')
+    sweep_parser.add_argument('--max-rate', type=float,
+                              help='Limit MCommunity searches per second, backing off and retrying when it struggles '
+                                   'and stopping if it keeps failing')
+    sweep_parser.add_argument('--store',
+                              help='SQLite file to record decisions in as a run, and to serve recent decisions from '
+                                   'while MCommunity is unavailable')
+    sweep_parser.add_argument('--checkpoint',
+                              help='File to record progress in after every batch; an existing one is resumed from')
+    sweep_parser.add_argument('--progress', action='store_true', help='Print progress to stderr after every batch')
+    sweep_parser.set_defaults(func=sweep)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'sweep':
+        if not args.app_cn or not args.secret:
+            parser.error('--app-cn and --secret (or $MCOMMUNITY_APP_CN and $MCOMMUNITY_SECRET) are required')
+        if args.batch_size < 1 or args.workers < 1:
+            parser.error('--batch-size and --workers must be at least 1')
+        if args.max_rate is not None and args.max_rate <= 0:
+            parser.error('--max-rate must be positive')
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,195 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Type, Union
+
+from mcommunity import MCommunityUser
+from mcommunity.mcommunity_base import MCommunityBase
+
+from eligibility_checker.cache import EligibilityCache
+from eligibility_checker.checker import CheckEligibilityResponse, EligibilityChecker
+from eligibility_checker.directory import PrefetchedMCommunityUser, chunked
+from eligibility_checker.instrumentation import Instrumentation
+from eligibility_checker.pool import MCommunityConnectionPool
+from eligibility_checker.resilience import DirectoryGuard
+from eligibility_checker.store import EligibilitySnapshotStore
+
+
+Decisions = Dict[str, CheckEligibilityResponse]  # service_friendly: response
+
+
+class CompositeEligibilityChecker:
+    """
+    Check eligibility for several services at once. Each user is fetched from MCommunity once, with the union of the
+    attributes the checkers need, and every checker makes its own decision from that same user, so a cross-service
+    audit costs one directory pass instead of one per service. Decisions are identical to calling check_eligibility on
+    each checker. The cache, instrumentation, guard, and store are passed to every checker and behave as they do
+    there. Searches for the composite are run by the first checker, so they go through the guard once rather than once
+    per checker, use its connection pool, and are timed under its service_friendly.
+    """
+    checkers: Dict[str, EligibilityChecker]  # service_friendly: checker, in the order the classes were passed in
+    mcommunity_user_attributes: list  # Union of the checkers' mcommunity_user_attributes
+
+    def __init__(self, checker_classes: Iterable[Type[EligibilityChecker]], mcommunity_app_cn: str,
+                 mcommunity_secret: str, cache: Optional[EligibilityCache] = None,
+                 instrumentation: Optional[Instrumentation] = None, guard: Optional[DirectoryGuard] = None,
+                 store: Optional[EligibilitySnapshotStore] = None):
+        """
+        :param checker_classes: the EligibilityChecker subclasses to check eligibility with; override groups shared by
+        several of them are only fetched once
+        :param mcommunity_app_cn: MCommunity app cn
+        :param mcommunity_secret: MCommunity app secret
+        :param cache: optional; see EligibilityChecker. A user is only fetched if some service has no cached decision
+        :param instrumentation: optional; see EligibilityChecker
+        :param guard: optional; see EligibilityChecker
+        :param store: optional; see EligibilityChecker
+        """
+        self.mcommunity_app_cn = mcommunity_app_cn
+        self.mcommunity_secret = mcommunity_secret
+        self.guard = guard
+        self.checkers = {}
+        for checker_class in checker_classes:
+            checker = checker_class(mcommunity_app_cn, mcommunity_secret, cache=cache, instrumentation=instrumentation,
+                                    guard=guard, store=store)
+            if checker.service_friendly in self.checkers:
+                raise ValueError(f'More than one checker is for {checker.service_friendly}; service_friendly must be '
+                                 f'unique')
+            self.checkers[checker.service_friendly] = checker
+        if not self.checkers:
+            raise ValueError('At least one EligibilityChecker subclass is required')
+        self.mcommunity_user_attributes = list(dict.fromkeys(
+            attribute for checker in self.checkers.values() for attribute in checker.mcommunity_user_attributes
+        ))
+        self._fetcher = next(iter(self.checkers.values()))
+        self._fetcher.mcommunity_pool_size = max(checker.mcommunity_pool_size for checker in self.checkers.values())
+
+    ##################
+    # Public Methods #
+    ##################
+    def check_eligibility(self, uniqname: str, validate_affiliation: bool = True) -> Decisions:
+        """
+        Check whether a given user is eligible for each service, fetching them from MCommunity only once.
+        :param uniqname: the U-M username of the user to check for eligibility
+        :param validate_affiliation: see EligibilityChecker.check_eligibility
+        :return: dictionary of service_friendly to CheckEligibilityResponse object
+        """
+        cached = self._cached(uniqname, validate_affiliation)
+        if len(cached) == len(self.checkers):
+            return cached
+        return self._fetch_and_check(uniqname, validate_affiliation, cached)
+
+    def check_eligibility_many(self, uniqnames: Iterable[str], validate_affiliation: bool = True,
+                               chunk_size: int = 100) -> Iterator[Tuple[str, Decisions]]:
+        """
+        Check eligibility for each service for many users, fetching them from MCommunity in chunks with one search per
+        chunk for all of the services together (see EligibilityChecker.check_eligibility_many).
+        :param uniqnames: the U-M usernames of the users to check for eligibility
+        :param validate_affiliation: see EligibilityChecker.check_eligibility
+        :param chunk_size: the maximum number of uniqnames to fetch in a single search
+        :return: generator of (uniqname, dictionary of service_friendly to CheckEligibilityResponse object), in the
+        same order as uniqnames
+        """
+        with self.connection_pool.connection() as connection:
+            for chunk in chunked(uniqnames, chunk_size):
+                yield from self._check_chunk_eligibility(connection, chunk, validate_affiliation)
+
+    def eligible_services(self, uniqname: str, validate_affiliation: bool = True) -> List[str]:
+        """
+        List the services a given user is eligible for.
+        :param uniqname: the U-M username of the user to check for eligibility
+        :param validate_affiliation: see EligibilityChecker.check_eligibility
+        :return: list of service_friendly names, in the order the checkers were passed in
+        """
+        return [service for service, response in self.check_eligibility(uniqname, validate_affiliation).items()
+                if response.eligible]
+
+    @property
+    def connection_pool(self) -> MCommunityConnectionPool:
+        """
+        The pool of MCommunity connections used for searches, created on first use; it is the first checker's, sized
+        for the largest mcommunity_pool_size of the checkers.
+        :return: MCommunityConnectionPool object
+        """
+        return self._fetcher.connection_pool
+
+    ###################
+    # Private Methods #
+    ###################
+    def _check_user_eligibility(self, user: MCommunityUser, validate_affiliation: bool,
+                                cached: Optional[Decisions] = None) -> Decisions:
+        """
+        Make every checker's decision for a user that has already been fetched, caching the new decisions.
+        :param user: MCommunityUser object for the user
+        :param validate_affiliation: see EligibilityChecker.check_eligibility
+        :param cached: decisions already found in the checkers' caches, which are used as-is
+        :return: dictionary of service_friendly to CheckEligibilityResponse object
+        """
+        decisions = {}
+        for service, checker in self.checkers.items():
+            response = cached.get(service) if cached else None
+            if response is None:
+                response = checker._check_user_eligibility(user, validate_affiliation)
+                if checker.cache is not None:
+                    checker.cache.set(user.name, validate_affiliation, response, service)
+            decisions[service] = response
+        return decisions
+
+    def _error_responses(self, uniqname: str, error: BaseException, cached: Decisions) -> Decisions:
+        return {service: cached.get(service) or checker._error_response(uniqname, error)
+                for service, checker in self.checkers.items()}
+
+    def _cached(self, uniqname: str, validate_affiliation: bool) -> Decisions:
+        """
+        :return: dictionary of service_friendly to cached CheckEligibilityResponse, for the services that have one
+        """
+        cached = {}
+        for service, checker in self.checkers.items():
+            if checker.cache is not None:
+                response = checker.cache.get(uniqname, validate_affiliation, service)
+                if response is not None:
+                    cached[service] = response
+        return cached
+
+    def _fetch_and_check(self, uniqname: str, validate_affiliation: bool, cached: Decisions) -> Decisions:
+        """
+        Fetch a single user with the union of the checkers' attributes and check their eligibility for every service
+        that does not have a cached decision.
+        :param uniqname: the uniqname to check
+        :param validate_affiliation: see EligibilityChecker.check_eligibility
+        :param cached: see _check_user_eligibility
+        :return: dictionary of service_friendly to CheckEligibilityResponse object
+        """
+        raw_result = self._fetcher._fetch_result(uniqname, self.mcommunity_user_attributes)
+        return self._check_result(uniqname, raw_result, validate_affiliation, cached)
+
+    def _check_result(self, uniqname: str, raw_result: Union[list, Exception], validate_affiliation: bool,
+                      cached: Decisions) -> Decisions:
+        """
+        Make every checker's decision for a user from their search result (see EligibilityChecker._check_result).
+        :param uniqname: the uniqname that was fetched
+        :param raw_result: its search result, or the exception that stopped the search
+        :param validate_affiliation: see EligibilityChecker.check_eligibility
+        :param cached: see _check_user_eligibility
+        :return: dictionary of service_friendly to CheckEligibilityResponse object
+        """
+        if isinstance(raw_result, Exception):
+            return self._error_responses(uniqname, raw_result, cached)
+        # Not filtered to one service's entitlement like EligibilityChecker._prefetched_user, since every checker
+        # looks for its own
+        user = PrefetchedMCommunityUser(uniqname, self.mcommunity_app_cn, self.mcommunity_secret, raw_result)
+        return self._check_user_eligibility(user, validate_affiliation, cached)
+
+    def _check_chunk_eligibility(self, connection: MCommunityBase, uniqnames: list,
+                                 validate_affiliation: bool) -> Iterator[Tuple[str, Decisions]]:
+        """
+        Fetch a chunk of users with a single search and check each of their eligibility for every service.
+        :param connection: MCommunityBase object to run the search with
+        :param uniqnames: the uniqnames in this chunk
+        :param validate_affiliation: see EligibilityChecker.check_eligibility
+        :return: generator of (uniqname, dictionary of service_friendly to CheckEligibilityResponse object)
+        """
+        cached = {uniqname: self._cached(uniqname, validate_affiliation) for uniqname in uniqnames}
+        to_fetch = [uniqname for uniqname in uniqnames if len(cached[uniqname]) < len(self.checkers)]
+        fetched = self._fetcher._fetch_results(connection, to_fetch, self.mcommunity_user_attributes)
+        for uniqname in uniqnames:
+            if len(cached[uniqname]) == len(self.checkers):
+                yield uniqname, cached[uniqname]
+            else:
+                yield uniqname, self._check_result(uniqname, next(fetched)[1], validate_affiliation, cached[uniqname])
@@ -0,0 +1,122 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ldap.filter import escape_filter_chars
+from mcommunity import MCommunityUser
+from mcommunity.mcommunity_base import MCommunityBase
+
+Entry = Tuple[str, dict]  # (dn, {attribute: [bytes, ...]}) as returned by MCommunityBase.search
+
+SERVICE_ENTITLEMENT_ATTRIBUTE = 'umichServiceEntitlement'
+AFFILIATION_ATTRIBUTES = ('umichInstRoles', 'umichSponsorshipDetail')  # Only needed to decide by affiliation
+
+
+class PrefetchedMCommunityUser(MCommunityUser):
+    """
+    An MCommunityUser built from an LDAP entry that was already fetched (ex: by a bulk search) instead of searching
+    MCommunity again. Parsing is still done by MCommunityUser, so decisions match the single-user path.
+
+    MCommunityUser.__init__ also runs MCommunityBase.__init__ for every user. That only keeps the app cn and secret;
+    MCommunityBase connects and binds when it first searches, which this class answers from raw_result, so building
+    one never touches the directory. tests/test_directory.py checks this against the installed mcommunity.
+    """
+    def __init__(self, uniqname: str, app_cn: str, secret: str, raw_result: List[Entry]):
+        self._prefetched = raw_result
+        super().__init__(uniqname, app_cn, secret)
+
+    def search(self, *args, **kwargs) -> List[Entry]:
+        return self._prefetched
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    """
+    Split an iterable into lists of at most size items without reading it all into memory.
+    :param items: the iterable to split
+    :param size: the maximum length of each list
+    :return: generator of lists
+    """
+    if size < 1:
+        raise ValueError(f'chunk size must be at least 1, got {size}')
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def uid_filter(uniqnames: Iterable[str]) -> str:
+    """
+    Build an OR filter matching every uniqname, i.e. (|(uid=a)(uid=b)...)
+    :param uniqnames: the uniqnames to match
+    :return: LDAP filter string
+    """
+    return '(|' + ''.join(f'(uid={escape_filter_chars(uniqname)})' for uniqname in uniqnames) + ')'
+
+
+def search_users(connection: MCommunityBase, uniqnames: Iterable[str], attributes: list,
+                 extra_filter: Optional[str] = None) -> Dict[str, List[Entry]]:
+    """
+    Fetch many users from MCommunity with a single OR-filtered search.
+    :param connection: MCommunityBase object to run the search with
+    :param uniqnames: the uniqnames to fetch
+    :param attributes: the LDAP attributes to ask for; uid is always added since results are matched back on it
+    :param extra_filter: optional LDAP filter that entries must also match, i.e. (modifyTimestamp>=20220801000000Z)
+    :return: dictionary of uniqname to its search result (a list with one entry); users not found are left out. uid
+    matching is case-insensitive, so every spelling of a uniqname that was asked for gets the entry
+    """
+    wanted: Dict[str, List[str]] = {}  # Lowercased uid: every spelling of it that was asked for
+    for uniqname in uniqnames:
+        spellings = wanted.setdefault(uniqname.lower(), [])
+        if uniqname not in spellings:
+            spellings.append(uniqname)
+    if not wanted:
+        return {}
+    if 'uid' not in attributes:
+        attributes = ['uid'] + list(attributes)
+    results = {}
+    ldap_filter = uid_filter(spellings[0] for spellings in wanted.values())
+    if extra_filter:
+        ldap_filter = f'(&{extra_filter}{ldap_filter})'
+    for dn, attrs in connection.search(ldap_filter, attributes) or []:
+        for uid in attrs.get('uid', []):
+            uid = uid.decode() if isinstance(uid, bytes) else uid
+            if uid.lower() in wanted:
+                for uniqname in wanted[uid.lower()]:
+                    results[uniqname] = [(dn, attrs)]
+                break
+    return results
+
+
+def search_user(connection: MCommunityBase, uniqname: str, attributes: list) -> List[Entry]:
+    """
+    Fetch one user with the same filter MCommunityUser uses, but asking only for the given attributes.
+    :param connection: MCommunityBase object to run the search with
+    :param uniqname: the uniqname to fetch
+    :param attributes: the LDAP attributes to ask for
+    :return: the search result; empty if the user was not found
+    """
+    return connection.search(f'uid={escape_filter_chars(uniqname)}', attributes) or []
+
+
+def only_service_entitlement(raw_result: List[Entry], system: str) -> List[Entry]:
+    """
+    Drop the umichServiceEntitlement values that cannot be for system, without parsing their JSON, so that only the
+    entitlement that matters is ever parsed.
+    :param raw_result: search result for one user
+    :param system: the service entitlement system, i.e. enterprise
+    :return: search result with only the umichServiceEntitlement values that mention system
+    """
+    needle = system.lower().encode()
+    filtered = []
+    for dn, attrs in raw_result:
+        values = attrs.get(SERVICE_ENTITLEMENT_ATTRIBUTE)
+        if values:
+            attrs = dict(attrs)
+            attrs[SERVICE_ENTITLEMENT_ATTRIBUTE] = [
+                value for value in values
+                if needle in (value.lower() if isinstance(value, bytes) else value.lower().encode())
+            ]
+        filtered.append((dn, attrs))
+    return filtered
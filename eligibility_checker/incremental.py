@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+from typing import Iterable, Iterator, Optional
+
+from eligibility_checker.checker import CheckEligibilityResponse, EligibilityChecker
+from eligibility_checker.directory import chunked
+from eligibility_checker.resilience import CircuitOpenError, is_transient
+from eligibility_checker.rules import ReasonCode
+
+logger = logging.getLogger(__name__)
+
+
+def generalized_time(when: datetime) -> str:
+    """
+    Format a datetime as LDAP GeneralizedTime in UTC, the format of modifyTimestamp (i.e. 20220801120000Z).
+    :param when: timezone-aware datetime
+    :return: GeneralizedTime string
+    """
+    return when.astimezone(timezone.utc).strftime('%Y%m%d%H%M%SZ')
+
+
+class IncrementalSweep:
+    """
+    Re-check a tenant's users incrementally. The last decision for each user is kept in a JSON state file along with a
+    watermark; on later runs only users whose MCommunity entry has a modifyTimestamp at or after the watermark are
+    re-evaluated, plus users who are new to the tenant or whose override group membership changed. Everyone is
+    re-evaluated if the checker's rules (i.e. its eligible affiliations) changed since the state file was written. Only
+    users whose eligibility flipped (or who have no previous decision) are yielded.
+
+    Users who could not be checked because MCommunity was unavailable (a transient error, or a
+    ReasonCode.DIRECTORY_ERROR response) are neither yielded nor kept in the state file, so the next run checks them
+    fully instead of trusting a decision that was never made. Other responses with errors, such as users not found or
+    entitlement mismatches, are decisions and are kept like any other.
+
+    Note that an entry that is deleted outright from MCommunity does not show up as modified, so an occasional full
+    sweep (run with a fresh state file) is still worthwhile.
+    """
+    checker: EligibilityChecker
+    state_path: str
+    checked: int  # Users re-evaluated by the last run
+    flipped: int  # Users yielded by the last run
+    failed: int  # Users MCommunity was unavailable for in the last run; they are checked fully next run
+
+    def __init__(self, checker: EligibilityChecker, state_path: str, validate_affiliation: bool = True,
+                 chunk_size: int = 100, clock_skew: float = 300):
+        """
+        :param checker: the EligibilityChecker subclass instance to make decisions with
+        :param state_path: JSON file to keep decisions and the watermark in between runs
+        :param validate_affiliation: see EligibilityChecker.check_eligibility
+        :param chunk_size: the maximum number of uniqnames to fetch in a single search
+        :param clock_skew: seconds to move the watermark back by, to allow for the local clock being ahead of the
+        directory servers'
+        """
+        self.checker = checker
+        self.state_path = state_path
+        self.validate_affiliation = validate_affiliation
+        self.chunk_size = chunk_size
+        self.clock_skew = clock_skew
+        self.checked = 0
+        self.flipped = 0
+        self.failed = 0
+
+    def run(self, uniqnames: Iterable[str]) -> Iterator[CheckEligibilityResponse]:
+        """
+        Re-check the tenant and yield the users whose eligibility changed. The state file is only updated once the
+        generator is exhausted, so an interrupted run is safely repeated from the same watermark.
+        :param uniqnames: every uniqname currently in the tenant; users no longer in it are dropped from the state
+        :return: generator of CheckEligibilityResponse objects for users whose eligibility flipped or who are new
+        """
+        state = self._load_state()
+        watermark: Optional[str] = state.get('watermark')
+        previous: dict = state.get('users', {})
+        started = datetime.now(timezone.utc)
+        self.checked = self.flipped = self.failed = 0
+        rules_key = json.loads(json.dumps(self.checker.rules.key))  # As it reads back from the state file
+        if state.get('rules_key') != rules_key:
+            if watermark is not None:
+                logger.info('Incremental sweep: the eligibility rules changed since the last run; checking everyone.')
+            watermark = None
+
+        overrides = self.checker._get_override_group_members()
+        tenant = list(dict.fromkeys(uniqnames))  # Remove duplicates but keep the order
+        full, changed_only = [], []
+        for uniqname in tenant:
+            if watermark is None or uniqname not in previous or \
+                    previous[uniqname]['override'] != (uniqname in overrides):
+                full.append(uniqname)
+            else:
+                changed_only.append(uniqname)
+        logger.info(f'Incremental sweep: {len(full)} users to check fully, {len(changed_only)} to check if modified '
+                    f'since {watermark}.')
+
+        decisions = {uniqname: previous[uniqname] for uniqname in changed_only}
+        responses = self.checker.check_eligibility_many(
+            full, validate_affiliation=self.validate_affiliation, chunk_size=self.chunk_size)
+        for response in chain(responses, self._check_modified(changed_only, watermark)):
+            uniqname = response.uniqname
+            self.checked += 1
+            if is_transient(response.errors) or response.reason_code == ReasonCode.DIRECTORY_ERROR:
+                self.failed += 1
+                decisions.pop(uniqname, None)
+                logger.warning('Incremental sweep: MCommunity was unavailable checking %s (%r); they will be checked '
+                               'fully next run.', uniqname, response.errors)
+                continue
+            old = previous.get(uniqname)
+            decisions[uniqname] = {'eligible': response.eligible, 'override': uniqname in overrides}
+            if old is None or old['eligible'] != response.eligible:
+                self.flipped += 1
+                yield response
+
+        new_watermark = generalized_time(started - timedelta(seconds=self.clock_skew))
+        self._save_state({'watermark': new_watermark, 'rules_key': rules_key, 'users': decisions})
+        logger.info(f'Incremental sweep: re-checked {self.checked} users, {self.flipped} flipped, {self.failed} '
+                    f'failed; watermark is now {new_watermark}.')
+
+    def _check_modified(self, uniqnames: list, watermark: Optional[str]) -> Iterator[CheckEligibilityResponse]:
+        """
+        Fetch only the users whose entries were modified at or after the watermark and check their eligibility.
+        :param uniqnames: the uniqnames to look for modifications of
+        :param watermark: GeneralizedTime of the previous run
+        :return: generator of CheckEligibilityResponse objects for modified users. If a chunk's search fails with a
+        transient error, every user in it gets an error response; any other failure checks the chunk fully instead
+        """
+        if not uniqnames:
+            return
+        checker = self.checker
+        with checker.connection_pool.connection() as connection:
+            for chunk in chunked(uniqnames, self.chunk_size):
+                try:
+                    results = checker._search_users(
+                        connection, chunk, extra_filter=f'(modifyTimestamp>={watermark})',
+                        attributes=checker._user_attributes(self.validate_affiliation))
+                except CircuitOpenError:
+                    raise
+                except Exception as e:  # Whether they were modified is unknown, so none of them can be trusted
+                    if is_transient(e):
+                        for uniqname in chunk:
+                            yield checker._error_response(uniqname, e)
+                    else:
+                        yield from checker._check_chunk_eligibility(connection, chunk, self.validate_affiliation)
+                    continue
+                for uniqname, raw_result in results.items():
+                    user = checker._prefetched_user(uniqname, raw_result)
+                    yield checker._check_user_eligibility(user, self.validate_affiliation)
+
+    def _load_state(self) -> dict:
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def _save_state(self, state: dict) -> None:
+        tmp_path = f'{self.state_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
@@ -0,0 +1,123 @@
+from typing import ContextManager
+
+
+class Phase:
+    """
+    Names of the timed phases of an eligibility check.
+    """
+    OVERRIDE_GROUP_FETCH = 'override_group_fetch'
+    USER_FETCH = 'user_fetch'
+    OVERRIDE_LOOKUP = 'override_lookup'
+    ENTITLEMENT_CHECK = 'entitlement_check'
+    AFFILIATION_VALIDATION = 'affiliation_validation'
+    RESPONSE_BUILD = 'response_build'
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Instrumentation:
+    """
+    Hooks that EligibilityChecker calls while it works. This base class does nothing and is the default; subclass it
+    (or use one of the adapters below) to send timings and counts somewhere.
+    """
+    def timer(self, service: str, phase: str) -> ContextManager:
+        """
+        Time a phase of a check.
+        :param service: service_friendly of the checker
+        :param phase: one of the Phase names
+        :return: context manager wrapping the phase
+        """
+        return _NULL_TIMER
+
+    def count_decision(self, service: str, reason_code: str, eligible: bool) -> None:
+        """
+        Count a decision.
+        :param service: service_friendly of the checker
+        :param reason_code: ReasonCode of the decision
+        :param eligible: whether the user was eligible
+        :return: Nothing
+        """
+
+    def count_error(self, service: str, error: BaseException) -> None:
+        """
+        Count an error, whether it ended up on a response or was recovered from (i.e. a failed bulk search).
+        :param service: service_friendly of the checker
+        :param error: the exception
+        :return: Nothing
+        """
+
+
+class PrometheusInstrumentation(Instrumentation):
+    """
+    Records phase timings in a histogram and decisions and errors in counters with prometheus_client, which must be
+    installed separately (pip install prometheus-client).
+    """
+    def __init__(self, registry=None, namespace: str = 'eligibility_checker'):
+        """
+        :param registry: prometheus_client CollectorRegistry to register the metrics with; defaults to the global one
+        :param namespace: prefix for the metric names
+        """
+        try:
+            from prometheus_client import REGISTRY, Counter, Histogram
+        except ImportError as e:
+            raise ImportError('PrometheusInstrumentation requires prometheus_client; pip install prometheus-client') \
+                from e
+        registry = registry if registry is not None else REGISTRY
+        self.phase_seconds = Histogram(f'{namespace}_phase_seconds',
+                                       'Seconds spent in each phase of eligibility checks', ['service', 'phase'],
+                                       registry=registry)
+        self.decisions = Counter(f'{namespace}_decisions_total', 'Eligibility decisions by reason',
+                                 ['service', 'reason_code', 'eligible'], registry=registry)
+        self.errors = Counter(f'{namespace}_errors_total', 'Errors during eligibility checks by type',
+                              ['service', 'error_type'], registry=registry)
+
+    def timer(self, service: str, phase: str) -> ContextManager:
+        return self.phase_seconds.labels(service, phase).time()
+
+    def count_decision(self, service: str, reason_code: str, eligible: bool) -> None:
+        self.decisions.labels(service, reason_code, str(eligible).lower()).inc()
+
+    def count_error(self, service: str, error: BaseException) -> None:
+        self.errors.labels(service, type(error).__name__).inc()
+
+
+class OpenTelemetryInstrumentation(Instrumentation):
+    """
+    Records each phase as an OpenTelemetry span and decisions and errors as counters with opentelemetry-api, which
+    must be installed separately (pip install opentelemetry-api).
+    """
+    def __init__(self, tracer=None, meter=None):
+        """
+        :param tracer: opentelemetry Tracer; defaults to one from the global tracer provider
+        :param meter: opentelemetry Meter; defaults to one from the global meter provider
+        """
+        try:
+            from opentelemetry import metrics, trace
+        except ImportError as e:
+            raise ImportError('OpenTelemetryInstrumentation requires opentelemetry-api; '
+                              'pip install opentelemetry-api') from e
+        self.tracer = tracer if tracer is not None else trace.get_tracer('eligibility_checker')
+        meter = meter if meter is not None else metrics.get_meter('eligibility_checker')
+        self.decisions = meter.create_counter('eligibility_checker.decisions', description='Eligibility decisions')
+        self.errors = meter.create_counter('eligibility_checker.errors', description='Errors during eligibility checks')
+
+    def timer(self, service: str, phase: str) -> ContextManager:
+        return self.tracer.start_as_current_span(f'eligibility_checker.{phase}',
+                                                 attributes={'eligibility_checker.service': service})
+
+    def count_decision(self, service: str, reason_code: str, eligible: bool) -> None:
+        self.decisions.add(1, {'service': service, 'reason_code': reason_code, 'eligible': eligible})
+
+    def count_error(self, service: str, error: BaseException) -> None:
+        self.errors.add(1, {'service': service, 'error_type': type(error).__name__})
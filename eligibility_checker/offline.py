@@ -0,0 +1,162 @@
+import base64
+import gzip
+import json
+import logging
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional, Type
+
+from eligibility_checker._parallel import (init_worker_checker, ordered_process_map, shared_override_members,
+                                           worker_checker)
+from eligibility_checker.checker import CheckEligibilityResponse, EligibilityChecker
+from eligibility_checker.directory import Entry, chunked
+
+logger = logging.getLogger(__name__)
+
+
+def iter_ldif(f: BinaryIO) -> Iterator[Entry]:
+    """
+    Stream entries from an LDIF export one at a time (RFC 2849 content records: folded lines, comments, and base64
+    values are supported; change records and URL values are skipped).
+    :param f: LDIF file opened in binary mode
+    :return: generator of (dn, {attribute: [bytes, ...]}), the same shape as MCommunityBase.search results
+    """
+    record = []
+    for line in f:
+        line = line.rstrip(b'\r\n')
+        if line.startswith(b' '):  # Continuation of a folded line
+            if record:
+                record[-1] += line[1:]
+        elif line.startswith(b'#'):
+            record.append(b'#')  # Placeholder so that continuations of the comment are dropped with it
+        elif line:
+            record.append(line)
+        elif record:
+            entry = _parse_ldif_record(record)
+            if entry:
+                yield entry
+            record = []
+    if record:
+        entry = _parse_ldif_record(record)
+        if entry:
+            yield entry
+
+
+def _parse_ldif_record(lines: list) -> Optional[Entry]:
+    dn = None
+    attrs: Dict[str, list] = {}
+    for line in lines:
+        if line.startswith(b'#'):
+            continue
+        name, sep, value = line.partition(b':')
+        if not sep:
+            logger.warning('Skipping malformed LDIF line %r', line[:80])
+            continue
+        name = name.decode()
+        if value.startswith(b':'):
+            value = base64.b64decode(value[1:].strip())
+        elif value.startswith(b'<'):
+            logger.warning('Skipping URL value for %s; URL values are not supported', name)
+            continue
+        else:
+            value = value.lstrip(b' ')
+        if name.lower() == 'dn':
+            dn = value.decode()
+        elif name.lower() == 'version' and dn is None:
+            continue
+        elif name.lower() == 'changetype':
+            return None  # Change records are not directory entries
+        else:
+            attrs.setdefault(name, []).append(value)
+    if dn is None:
+        return None
+    return dn, attrs
+
+
+def iter_jsonl(f: BinaryIO) -> Iterator[Entry]:
+    """
+    Stream entries from a JSON lines export with one object per line, either {"dn": ..., "attributes": {...}} or
+    {"dn": ..., attribute: value(s), ...}. Values are encoded to bytes to match MCommunityBase.search results; values
+    that are not strings (numbers, booleans, objects) are encoded as their JSON text.
+    :param f: JSON lines file opened in binary mode
+    :return: generator of (dn, {attribute: [bytes, ...]})
+    """
+    for line in f:
+        if not line.strip():
+            continue
+        obj = json.loads(line)
+        dn = obj.pop('dn', '')
+        attributes = obj.get('attributes', obj)
+        attrs = {}
+        for name, values in attributes.items():
+            if not isinstance(values, list):
+                values = [values]
+            attrs[name] = [v.encode() if isinstance(v, str) else json.dumps(v).encode() for v in values]
+        yield dn, attrs
+
+
+def iter_entries(path: str) -> Iterator[Entry]:
+    """
+    Stream entries from an LDIF or JSON lines export, chosen by the file extension (.ldif or .jsonl, optionally .gz).
+    :param path: the export file
+    :return: generator of (dn, {attribute: [bytes, ...]})
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    name = path[:-3] if path.endswith('.gz') else path
+    with opener(path, 'rb') as f:
+        if name.endswith('.jsonl') or name.endswith('.json'):
+            yield from iter_jsonl(f)
+        else:
+            yield from iter_ldif(f)
+
+
+def evaluate_entries(checker: EligibilityChecker, entries: Iterable[Entry],
+                     validate_affiliation: bool = True) -> Iterator[CheckEligibilityResponse]:
+    """
+    Check eligibility for entries that were already exported from MCommunity, using exactly the same logic as
+    check_eligibility but without any searches. Entries without a uid (i.e. groups) are skipped, and an entry that
+    cannot be evaluated gets an error response instead of stopping the rest.
+    :param checker: the EligibilityChecker subclass instance to make decisions with
+    :param entries: (dn, {attribute: [bytes, ...]}) entries, i.e. from iter_entries
+    :param validate_affiliation: see EligibilityChecker.check_eligibility
+    :return: generator of CheckEligibilityResponse objects
+    """
+    for entry in entries:
+        uids = entry[1].get('uid')
+        if not uids:
+            continue
+        uniqname = uids[0].decode() if isinstance(uids[0], bytes) else uids[0]
+        try:
+            user = checker._prefetched_user(uniqname, [entry])
+            response = checker._check_user_eligibility(user, validate_affiliation)
+        except Exception as e:
+            logger.warning('Could not evaluate the entry for %s (%r).', uniqname, e)
+            response = checker._error_response(uniqname, e)
+        yield response
+
+
+def _evaluate_chunk(entries: list) -> list:
+    checker, validate_affiliation = worker_checker()
+    return [response.to_dict(include_user=False)
+            for response in evaluate_entries(checker, entries, validate_affiliation)]
+
+
+def evaluate_file(checker_class: Type[EligibilityChecker], path: str, app_cn: str = '', secret: str = '',
+                  processes: int = 1, chunk_size: int = 1000,
+                  validate_affiliation: bool = True) -> Iterator[dict]:
+    """
+    Check eligibility for every user in an LDIF or JSON lines export, spreading the work across processes. The file is
+    streamed, so memory use does not depend on its size. Override group members come from the process-wide snapshot
+    (see override_snapshot_path), so MCommunity is only contacted if a group is not in it yet.
+    :param checker_class: the EligibilityChecker subclass to make decisions with
+    :param path: the export file (.ldif or .jsonl, optionally .gz)
+    :param app_cn: MCommunity app cn, only needed if override groups have to be fetched
+    :param secret: MCommunity app secret, only needed if override groups have to be fetched
+    :param processes: the number of worker processes
+    :param chunk_size: the number of entries sent to a worker at a time
+    :param validate_affiliation: see EligibilityChecker.check_eligibility
+    :return: generator of CheckEligibilityResponse.to_dict(include_user=False) dictionaries, in file order
+    """
+    checker = checker_class(app_cn, secret)  # Populates the override group snapshot in this process
+    initargs = (checker_class, app_cn, secret, shared_override_members(checker), validate_affiliation)
+    for results in ordered_process_map(_evaluate_chunk, chunked(iter_entries(path), chunk_size), processes,
+                                       initializer=init_worker_checker, initargs=initargs):
+        yield from results
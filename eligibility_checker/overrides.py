@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from mcommunity import MCommunityGroup
+
+logger = logging.getLogger(__name__)
+
+
+class OverrideGroupMembership:
+    """
+    Process-wide snapshot of override group membership, keyed by group name, so that each EligibilityChecker does not
+    expand its override groups again. Each group's members are kept as a frozenset; a group is fetched from MCommunity
+    the first time it is asked for and can then be refreshed in the background and saved to disk for cold starts.
+    """
+    version: int  # Incremented every time any group's members change, so checkers know to rebuild their member sets
+
+    def __init__(self):
+        self.version = 0
+        self._members: Dict[str, frozenset] = {}
+        self._fetched_at: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self._refreshers: Dict[str, threading.Event] = {}
+
+    def get(self, group: str, app_cn: str, secret: str) -> frozenset:
+        """
+        Get the members of a group, fetching them from MCommunity if this process does not have them yet.
+        :param group: the MCommunity group name
+        :param app_cn: MCommunity app cn to fetch with
+        :param secret: MCommunity app secret to fetch with
+        :return: frozenset of member uniqnames
+        """
+        members = self._members.get(group)
+        if members is None:
+            with self._lock:
+                members = self._members.get(group)
+                if members is None:
+                    members = self.refresh(group, app_cn, secret)
+        return members
+
+    def refresh(self, group: str, app_cn: str, secret: str) -> frozenset:
+        """
+        Fetch the members of a group from MCommunity and replace the snapshot for that group.
+        :param group: the MCommunity group name
+        :param app_cn: MCommunity app cn to fetch with
+        :param secret: MCommunity app secret to fetch with
+        :return: frozenset of member uniqnames
+        """
+        members = MCommunityGroup(group, app_cn, secret).members
+        if not members:
+            raise RuntimeError(f'Got 0 members for {group}. If the group is not being used anymore, remove it from '
+                               f'override_groups. If it is being used and has members, make sure the MCommunity app '
+                               f'{app_cn} is an owner of the MCommunity group to give it access to read group '
+                               f'membership.')
+        members = frozenset(members)
+        with self._lock:
+            if members != self._members.get(group):
+                self.version += 1
+            self._members[group] = members
+            self._fetched_at[group] = time.time()
+        return members
+
+    def start_refresh(self, groups: Iterable[str], app_cn: str, secret: str, interval: float) -> None:
+        """
+        Refresh the given groups in a background daemon thread every interval seconds. Groups that are already being
+        refreshed are skipped. A failed refresh is logged and the previous snapshot is kept.
+        :param groups: the MCommunity group names
+        :param app_cn: MCommunity app cn to fetch with
+        :param secret: MCommunity app secret to fetch with
+        :param interval: seconds between refreshes
+        :return: Nothing
+        """
+        if interval <= 0:
+            raise ValueError(f'interval must be positive, got {interval}')
+        with self._lock:
+            for group in groups:
+                if group in self._refreshers:
+                    continue
+                stop = threading.Event()
+                self._refreshers[group] = stop
+                threading.Thread(target=self._refresh_loop, args=(group, app_cn, secret, interval, stop),
+                                 name=f'override-refresh-{group}', daemon=True).start()
+
+    def stop_refresh(self) -> None:
+        """
+        Stop all background refreshes.
+        :return: Nothing
+        """
+        with self._lock:
+            for stop in self._refreshers.values():
+                stop.set()
+            self._refreshers.clear()
+
+    def clear(self) -> None:
+        """
+        Stop all background refreshes and forget every group.
+        :return: Nothing
+        """
+        self.stop_refresh()
+        with self._lock:
+            self._members.clear()
+            self._fetched_at.clear()
+            self.version += 1
+
+    def snapshot(self) -> Dict[str, frozenset]:
+        """
+        Get a copy of every group's members, i.e. to hand to worker processes.
+        :return: dictionary of group name to frozenset of member uniqnames
+        """
+        with self._lock:
+            return dict(self._members)
+
+    def update(self, members: Dict[str, Iterable[str]]) -> None:
+        """
+        Set the members of groups directly, i.e. from a snapshot taken in another process.
+        :param members: dictionary of group name to member uniqnames
+        :return: Nothing
+        """
+        now = time.time()
+        with self._lock:
+            for group, group_members in members.items():
+                self._members[group] = frozenset(group_members)
+                self._fetched_at[group] = now
+            self.version += 1
+
+    def save(self, path: str) -> None:
+        """
+        Write the snapshot to a JSON file, replacing it atomically.
+        :param path: the file to write
+        :return: Nothing
+        """
+        with self._lock:
+            data = {group: {'members': sorted(members), 'fetched_at': self._fetched_at.get(group)}
+                    for group, members in self._members.items()}
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'  # Unique per writer
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str, max_age: Optional[float] = None) -> None:
+        """
+        Load a snapshot written by save. Groups already in memory are kept, since they are at least as new.
+        :param path: the file to read; nothing is loaded if it does not exist
+        :param max_age: skip groups fetched more than this many seconds ago; None loads every group
+        :return: Nothing
+        """
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            data = json.load(f)
+        now = time.time()
+        with self._lock:
+            for group, snapshot in data.items():
+                fetched_at = snapshot.get('fetched_at') or 0
+                if group in self._members or (max_age is not None and now - fetched_at > max_age):
+                    continue
+                self._members[group] = frozenset(snapshot['members'])
+                self._fetched_at[group] = fetched_at
+                self.version += 1
+
+    def _refresh_loop(self, group: str, app_cn: str, secret: str, interval: float, stop: threading.Event) -> None:
+        while not stop.wait(interval):
+            try:
+                self.refresh(group, app_cn, secret)
+            except Exception:
+                logger.exception(f'Refreshing override group {group} failed; keeping the previous members.')
+
+
+override_group_membership = OverrideGroupMembership()  # Shared by every EligibilityChecker in this process
@@ -0,0 +1,128 @@
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import ldap
+from mcommunity.mcommunity_base import MCommunityBase
+
+logger = logging.getLogger(__name__)
+
+
+def _ldap_object(connection: MCommunityBase):
+    """
+    The python-ldap object a connection searches with. MCommunityBase does not document what it keeps that object as,
+    so the first attribute that looks like one is used.
+    :param connection: MCommunityBase object
+    :return: LDAPObject, or None if the connection has not created one yet
+    """
+    return next((value for value in vars(connection).values() if hasattr(value, 'set_option')), None)
+
+
+def set_search_timeout(connection: MCommunityBase, seconds: Optional[float]) -> bool:
+    """
+    Limit how long LDAP operations on a connection may take, on the python-ldap object it searches with. This is best
+    effort: MCommunityBase only creates that object when it first connects, so a connection that has not searched yet
+    has nothing to set the limit on.
+    :param connection: MCommunityBase object
+    :param seconds: the limit; None removes it
+    :return: whether the connection had an LDAP object to set the limit on
+    """
+    ldap_object = _ldap_object(connection)
+    if ldap_object is None:
+        logger.debug('MCommunity connection has no LDAP object (yet); search timeout not set.')
+        return False
+    limit = -1 if seconds is None else seconds  # -1 is python-ldap's "no limit"
+    ldap_object.set_option(ldap.OPT_TIMEOUT, limit)
+    ldap_object.set_option(ldap.OPT_NETWORK_TIMEOUT, limit)
+    ldap_object.timeout = limit  # Used by the synchronous search_s and friends
+    return True
+
+
+class MCommunityConnectionPool:
+    """
+    Bounded pool of reusable MCommunityBase connections. A connection keeps its LDAP bind between searches, so checking
+    one out of the pool skips the bind that a new MCommunityUser would do. Connections are created lazily, up to size.
+
+    A search_timeout is set on a connection's LDAP object each time the connection is checked out, once it has one
+    (see set_search_timeout). Searches on it are then abandoned by the LDAP library itself (raising ldap.TIMEOUT), but
+    the first search on a new connection is not limited, so callers that cannot wait forever need their own timeout too.
+    """
+    app_cn: str
+    secret: str
+    size: int
+    search_timeout: Optional[float]
+
+    def __init__(self, app_cn: str, secret: str, size: int = 8, search_timeout: Optional[float] = None):
+        """
+        :param app_cn: MCommunity app cn
+        :param secret: MCommunity app secret
+        :param size: the most connections to create
+        :param search_timeout: seconds an LDAP search on a pooled connection may take; None does not limit them
+        """
+        if size < 1:
+            raise ValueError(f'size must be at least 1, got {size}')
+        self.app_cn = app_cn
+        self.secret = secret
+        self.size = size
+        self.search_timeout = search_timeout
+        self._idle = queue.LifoQueue()  # LIFO so the most recently used (and still bound) connection is reused first
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None,
+                   search_timeout: Optional[float] = None) -> Iterator[MCommunityBase]:
+        """
+        Check a connection out of the pool for the duration of the with block. A connection that raises inside the
+        block is unbound and thrown away instead of being returned, since its bind may no longer be usable. Closing a
+        generator that is inside the block is not an error, so the connection is returned as usual.
+        :param timeout: seconds to wait for a connection if all of them are in use; None waits forever
+        :param search_timeout: seconds each LDAP search in the with block may take, instead of the pool's
+        search_timeout
+        :return: MCommunityBase object
+        """
+        connection = self._acquire(timeout)
+        if search_timeout is not None or self.search_timeout is not None:
+            set_search_timeout(connection, self.search_timeout if search_timeout is None else search_timeout)
+        try:
+            yield connection
+        except GeneratorExit:
+            self._release(connection, search_timeout)
+            raise
+        except BaseException:
+            self._discard(connection)
+            raise
+        else:
+            self._release(connection, search_timeout)
+
+    def _acquire(self, timeout: Optional[float]) -> MCommunityBase:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return MCommunityBase(self.app_cn, self.secret)
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f'No MCommunity connection became available within {timeout} seconds') from None
+
+    def _release(self, connection: MCommunityBase, search_timeout: Optional[float]) -> None:
+        if search_timeout is not None:
+            set_search_timeout(connection, self.search_timeout)
+        self._idle.put(connection)
+
+    def _discard(self, connection: MCommunityBase) -> None:
+        with self._lock:
+            self._created -= 1
+        ldap_object = _ldap_object(connection)
+        if ldap_object is not None:
+            try:
+                ldap_object.unbind_s()
+            except ldap.LDAPError as e:
+                logger.debug('Could not unbind a discarded MCommunity connection: %s', e)
+        logger.debug('Discarded an MCommunity connection after an error.')
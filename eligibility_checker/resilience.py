@@ -0,0 +1,314 @@
+import logging
+import random
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+import ldap
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Errors that mean MCommunity is overloaded or unreachable rather than that the user is not there; worth retrying
+TRANSIENT_ERRORS = (TimeoutError, ldap.SERVER_DOWN, ldap.TIMEOUT, ldap.BUSY, ldap.UNAVAILABLE,
+                    ldap.ADMINLIMIT_EXCEEDED, ldap.TIMELIMIT_EXCEEDED, ldap.CONNECT_ERROR)
+
+
+def is_transient(error: Optional[BaseException]) -> bool:
+    """
+    Whether an error from MCommunity is transient (the directory is overloaded or unreachable), as opposed to a
+    definite answer such as the user not being found.
+    :param error: the exception, or None
+    :return: bool
+    """
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised instead of searching MCommunity while the circuit breaker is open, so that a sweep halts instead of
+    recording a flood of false negatives.
+    """
+
+
+class DirectoryThrottledError(TimeoutError):
+    """
+    Raised when the rate limiter would have made a search wait longer than the guard's max_wait.
+    """
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket that limits searches per second and adapts its rate to how MCommunity is coping: the rate grows
+    additively while searches are fast and is cut multiplicatively (at most once per decrease_interval) when a search
+    is slower than latency_target or fails with a transient error.
+    """
+    def __init__(self, rate: float = 50, min_rate: float = 1, max_rate: Optional[float] = None,
+                 burst: Optional[float] = None, latency_target: float = 2, increase: float = 1, decrease: float = 0.5,
+                 decrease_interval: float = 1):
+        """
+        :param rate: starting searches per second
+        :param min_rate: the rate is never cut below this
+        :param max_rate: the rate never grows above this; None lets it grow without limit
+        :param burst: the most searches that can start at once after an idle period; defaults to the starting rate
+        :param latency_target: seconds; slower searches cut the rate
+        :param increase: searches per second added to the rate for every second's worth of fast searches
+        :param decrease: factor the rate is multiplied by when it is cut
+        :param decrease_interval: seconds; cuts closer together than this are ignored, since searches that were
+        already in flight report the same overload
+        """
+        if not 0 < min_rate <= rate:
+            raise ValueError(f'rate must be at least min_rate, which must be positive; got {rate} and {min_rate}')
+        self.rate = float(rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self.latency_target = latency_target
+        self.increase = increase
+        self.decrease = decrease
+        self.decrease_interval = decrease_interval
+        self.decreases = 0  # Number of times the rate was cut
+        self.throttled_seconds = 0.0  # Total time searches waited for a token
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._last_decrease = float('-inf')
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait: Optional[float] = None) -> float:
+        """
+        Take a token, waiting for one if the bucket is empty.
+        :param max_wait: seconds; raise DirectoryThrottledError instead of waiting longer than this
+        :return: seconds waited
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+            if max_wait is not None and wait > max_wait:
+                raise DirectoryThrottledError(f'MCommunity searches are limited to {self.rate:.1f}/s; a token was not '
+                                              f'available within {max_wait} seconds')
+            self._tokens -= 1  # Reserve the token now so that waiting threads queue up behind each other
+            self.throttled_seconds += wait
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def record_success(self, latency: float) -> None:
+        """
+        Adjust the rate after a search succeeded.
+        :param latency: seconds the search took
+        :return: Nothing
+        """
+        if latency > self.latency_target:
+            self.record_failure()
+            return
+        with self._lock:
+            rate = self.rate + self.increase / self.rate
+            self.rate = min(rate, self.max_rate) if self.max_rate is not None else rate
+
+    def record_failure(self) -> None:
+        """
+        Cut the rate after a search was slow or failed with a transient error.
+        :return: Nothing
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease < self.decrease_interval:
+                return
+            self._last_decrease = now
+            self.rate = max(self.rate * self.decrease, self.min_rate)
+            self.decreases += 1
+        logger.info(f'MCommunity is struggling; limiting searches to {self.rate:.1f}/s.')
+
+
+class RetryPolicy:
+    """
+    How often and how long to wait before retrying a search that failed with a transient error: exponential backoff
+    with full jitter, so that threads that failed together do not retry together.
+    """
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.5, max_delay: float = 30):
+        """
+        :param max_attempts: the most times a search is tried, including the first
+        :param base_delay: seconds; the longest wait before the first retry
+        :param max_delay: seconds; no wait is longer than this
+        """
+        if max_attempts < 1:
+            raise ValueError(f'max_attempts must be at least 1, got {max_attempts}')
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """
+        :param attempt: the number of attempts that have failed so far, starting at 1
+        :return: seconds to wait before the next attempt
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    Stops searches after failure_threshold transient failures in a row. After reset_timeout seconds, a single trial
+    search is let through; if it succeeds searching resumes, and if it fails the breaker opens again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 10, reset_timeout: float = 60):
+        """
+        :param failure_threshold: transient failures in a row that open the breaker; every attempt counts, retries
+        included
+        :param reset_timeout: seconds the breaker stays open before letting a trial search through
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.trips = 0  # Number of times the breaker opened
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def before_call(self) -> None:
+        """
+        Check that a search may go ahead.
+        :return: Nothing
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == self.OPEN or (state == self.HALF_OPEN and self._trial_in_flight):
+                raise CircuitOpenError(f'MCommunity circuit breaker is open after {self._failures} transient failures '
+                                       f'in a row; not searching until it resets')
+            if state == self.HALF_OPEN:
+                self._trial_in_flight = True
+
+    def release_trial(self) -> None:
+        """
+        Give back the half-open trial slot taken by before_call when the search did not go ahead after all (i.e. it was
+        shed by the rate limiter), so the next search can be the trial instead.
+        :return: Nothing
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            state = self._current_state()
+            if state == self.HALF_OPEN or (state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+                self.trips += 1
+                logger.error(f'MCommunity circuit breaker opened after {self._failures} transient failures in a row.')
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+
+class DirectoryGuard:
+    """
+    Wraps MCommunity searches with an AdaptiveRateLimiter, a RetryPolicy for transient errors, and a CircuitBreaker.
+    Pass one to EligibilityChecker to protect its searches; a guard can be shared by several checkers so they are
+    limited together.
+    """
+    def __init__(self, rate_limiter: Optional[AdaptiveRateLimiter] = None, retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None, max_wait: Optional[float] = None):
+        """
+        :param rate_limiter: defaults to AdaptiveRateLimiter()
+        :param retry_policy: defaults to RetryPolicy()
+        :param circuit_breaker: defaults to CircuitBreaker()
+        :param max_wait: seconds a search may wait for the rate limiter before it is shed with DirectoryThrottledError;
+        None waits as long as it takes
+        """
+        self.rate_limiter = rate_limiter if rate_limiter is not None else AdaptiveRateLimiter()
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker()
+        self.max_wait = max_wait
+        self.calls = 0  # Searches asked for
+        self.retries = 0  # Extra attempts after transient errors
+        self.transient_errors = 0  # Attempts that failed with a transient error
+        self.failures = 0  # Searches that still failed after every retry
+        self.shed = 0  # Searches refused by the circuit breaker or the rate limiter
+        self._lock = threading.Lock()
+
+    def call(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Run a search, waiting for the rate limiter and retrying transient errors. Other errors are raised right away.
+        :param fn: function that searches MCommunity
+        :return: whatever fn returns
+        """
+        self._count('calls')
+        attempt = 0
+        while True:
+            try:
+                self.circuit_breaker.before_call()
+            except CircuitOpenError:
+                self._count('shed')
+                raise
+            try:
+                self.rate_limiter.acquire(self.max_wait)
+            except DirectoryThrottledError:
+                self.circuit_breaker.release_trial()
+                self._count('shed')
+                raise
+            attempt += 1
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    self.circuit_breaker.record_success()  # MCommunity answered, even if not as hoped
+                    raise
+                self._count('transient_errors')
+                self.rate_limiter.record_failure()
+                self.circuit_breaker.record_failure()
+                if attempt >= self.retry_policy.max_attempts:
+                    self._count('failures')
+                    raise
+                delay = self.retry_policy.backoff(attempt)
+                logger.warning('Transient MCommunity error (%r); retrying in %.2f seconds.', e, delay)
+                self._count('retries')
+                time.sleep(delay)
+            else:
+                self.rate_limiter.record_success(time.monotonic() - started)
+                self.circuit_breaker.record_success()
+                return result
+
+    def stats(self) -> dict:
+        """
+        Summarize what the guard has done, i.e. to report how much throughput was shed or throttled.
+        :return: dictionary
+        """
+        return {
+            'calls': self.calls,
+            'retries': self.retries,
+            'transient_errors': self.transient_errors,
+            'failures': self.failures,
+            'shed': self.shed,
+            'throttled_seconds': round(self.rate_limiter.throttled_seconds, 3),
+            'rate': round(self.rate_limiter.rate, 3),
+            'rate_decreases': self.rate_limiter.decreases,
+            'circuit_state': self.circuit_breaker.state,
+            'circuit_trips': self.circuit_breaker.trips,
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
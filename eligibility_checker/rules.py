@@ -0,0 +1,144 @@
+from sys import intern
+from typing import Iterable, NamedTuple, Optional
+
+KNOWN_AFFILIATIONS = ('Faculty', 'RegularStaff', 'Student', 'TemporaryStaff', 'Alumni', 'Retiree', 'SponsoredAffiliate')
+SA_TYPES = (1, 2, 3)
+
+
+class ReasonCode:
+    """
+    Machine-readable codes for why an eligibility decision was made; CheckEligibilityResponse.reason has the details.
+    """
+    ERROR = 'error'  # The user could not be checked (i.e. not found in MCommunity)
+    DIRECTORY_ERROR = 'directory_error'  # MCommunity was overloaded or unreachable; the decision is not trustworthy
+    OVERRIDE = 'override'  # Member of an override group
+    ENTITLEMENT = 'entitlement'  # Decided by the service entitlement (uSE)
+    ENTITLEMENT_MISMATCH = 'entitlement_mismatch'  # Missing uSE although affiliations say the user should have it
+    SA_TYPE_ELIGIBLE = 'sa_type_eligible'
+    SA_TYPE_INELIGIBLE = 'sa_type_ineligible'
+    AFFILIATION_ELIGIBLE = 'affiliation_eligible'
+    AFFILIATION_INELIGIBLE = 'affiliation_ineligible'
+
+
+class Decision(NamedTuple):
+    eligible: bool
+    reason_code: str
+    reason: str
+    errors: Optional[BaseException] = None
+
+
+OVERRIDE_DECISION = Decision(True, ReasonCode.OVERRIDE, 'Override group member')
+
+
+class EligibilityRules:
+    """
+    Immutable, precompiled form of an EligibilityChecker's configuration. Eligible affiliations and sponsored affiliate
+    types are frozensets and every reason string that does not name a user is built once, so a decision is a few set
+    and dictionary lookups. Decisions can be made from an MCommunityUser or from a plain record dictionary with the
+    keys uid, entitlements (the uSE systems the user has), highest_affiliation, and sa_type.
+    """
+    __slots__ = ('key', 'service_friendly', 'service_entitlement', 'eligible_affiliations', 'eligible_sa_types',
+                 '_entitlement_decisions', '_affiliation_decisions', '_sa_type_decisions')
+
+    def __init__(self, service_friendly: str, service_entitlement: Optional[str], eligible_affiliations: Iterable[str],
+                 eligible_sa_types: Iterable[int]):
+        eligible_affiliations = tuple(eligible_affiliations)
+        eligible_sa_types = tuple(eligible_sa_types)
+        self.key = self.make_key(service_friendly, service_entitlement, eligible_affiliations, eligible_sa_types)
+        self.service_friendly = service_friendly
+        self.service_entitlement = intern(service_entitlement) if service_entitlement else None
+        self.eligible_affiliations = frozenset(eligible_affiliations)
+        self.eligible_sa_types = frozenset(eligible_sa_types)
+        self._entitlement_decisions = {
+            eligible: Decision(eligible, ReasonCode.ENTITLEMENT,
+                               intern(f'{service_entitlement} entitlement is {eligible}'))
+            for eligible in (True, False)
+        }
+        self._affiliation_decisions = {
+            affiliation: self._build_affiliation_decision(affiliation)
+            for affiliation in set(KNOWN_AFFILIATIONS) | self.eligible_affiliations
+        }
+        self._sa_type_decisions = {
+            sa_type: self._build_sa_type_decision(sa_type) for sa_type in set(SA_TYPES) | self.eligible_sa_types
+        }
+
+    @staticmethod
+    def make_key(service_friendly: str, service_entitlement: Optional[str], eligible_affiliations: Iterable[str],
+                 eligible_sa_types: Iterable[int]) -> tuple:
+        """
+        Build the value that identifies a configuration, so a checker can tell if its rules are out of date.
+        :return: tuple
+        """
+        return service_friendly, service_entitlement, tuple(eligible_affiliations), tuple(eligible_sa_types)
+
+    @classmethod
+    def compile(cls, checker) -> 'EligibilityRules':
+        """
+        Compile the configuration of an EligibilityChecker.
+        :param checker: EligibilityChecker object
+        :return: EligibilityRules object
+        """
+        return cls(checker.service_friendly, checker.service_entitlement, checker.eligible_affiliations_minus_sa,
+                   checker.eligible_sa_types)
+
+    def entitlement_decision(self, has_entitlement: bool) -> Decision:
+        return self._entitlement_decisions[bool(has_entitlement)]
+
+    def affiliation_decision(self, highest_affiliation: Optional[str], sa_type: Optional[int]) -> Decision:
+        """
+        Decide eligibility from the highest affiliation and, for sponsored affiliates, the sponsorship type.
+        :param highest_affiliation: the user's highest affiliation
+        :param sa_type: the user's sponsored affiliate type (1, 2, or 3), or None if they are not one
+        :return: Decision
+        """
+        if sa_type:  # This person is a sponsored affiliate type 1, 2, or 3
+            decision = self._sa_type_decisions.get(sa_type)
+            return decision if decision is not None else self._build_sa_type_decision(sa_type)
+        decision = self._affiliation_decisions.get(highest_affiliation)
+        return decision if decision is not None else self._build_affiliation_decision(highest_affiliation)
+
+    def mismatch_decision(self, uniqname: str, highest_affiliation: Optional[str]) -> Decision:
+        """
+        The decision for a user with no service entitlement whose affiliations say they should have one.
+        :param uniqname: the user's uniqname
+        :param highest_affiliation: the user's highest affiliation
+        :return: Decision, eligible with a RuntimeError
+        """
+        error = RuntimeError(f'Highest affiliation {highest_affiliation} shows {uniqname} should have a valid '
+                             f'{self.service_entitlement} entitlement but they do not')
+        return Decision(True, ReasonCode.ENTITLEMENT_MISMATCH, str(error), error)
+
+    def evaluate(self, record: dict, override_members: frozenset = frozenset(),
+                 validate_affiliation: bool = True) -> Decision:
+        """
+        Decide eligibility for a plain record instead of an MCommunityUser, following the same logic as
+        EligibilityChecker.check_eligibility.
+        :param record: dictionary with uid, entitlements, highest_affiliation, and sa_type
+        :param override_members: uniqnames of override group members
+        :param validate_affiliation: see EligibilityChecker.check_eligibility
+        :return: Decision
+        """
+        uid = record['uid']
+        if uid in override_members:
+            return OVERRIDE_DECISION
+        if self.service_entitlement:
+            decision = self._entitlement_decisions[self.service_entitlement in record.get('entitlements', ())]
+            if validate_affiliation and not decision.eligible and \
+                    self.affiliation_decision(record.get('highest_affiliation'), record.get('sa_type')).eligible:
+                return self.mismatch_decision(uid, record.get('highest_affiliation'))
+            return decision
+        return self.affiliation_decision(record.get('highest_affiliation'), record.get('sa_type'))
+
+    def _build_affiliation_decision(self, affiliation: Optional[str]) -> Decision:
+        if affiliation in self.eligible_affiliations:
+            return Decision(True, ReasonCode.AFFILIATION_ELIGIBLE,
+                            intern(f'{affiliation} are eligible for {self.service_friendly}'))
+        return Decision(False, ReasonCode.AFFILIATION_INELIGIBLE,
+                        intern(f'{affiliation} are not eligible for {self.service_friendly}'))
+
+    def _build_sa_type_decision(self, sa_type: int) -> Decision:
+        if sa_type in self.eligible_sa_types:
+            return Decision(True, ReasonCode.SA_TYPE_ELIGIBLE,
+                            intern(f'Sponsored affiliates t{sa_type} are eligible for {self.service_friendly}'))
+        return Decision(False, ReasonCode.SA_TYPE_INELIGIBLE,
+                        intern(f'Sponsored affiliates t{sa_type} are not eligible for {self.service_friendly}'))
@@ -0,0 +1,132 @@
+import logging
+import time
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Type
+
+from eligibility_checker._parallel import (init_worker_checker, ordered_process_map, shared_override_members,
+                                           unordered_process_map, worker_checker)
+from eligibility_checker.checker import EligibilityChecker
+from eligibility_checker.directory import chunked
+from eligibility_checker.resilience import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+
+class ShardProgress(NamedTuple):
+    shard: int  # Index of the shard, in input order
+    users: int
+    eligible: int
+    errors: int  # Users whose response has errors
+    seconds: float  # Time the worker spent on the shard
+    failure: Optional[str]  # repr of the exception that stopped the shard (or killed its worker), if it did not finish
+
+
+def _check_shard(shard: tuple) -> tuple:
+    """
+    Check a shard in a worker process. If the check fails part way, the users it did not get to get error responses,
+    so one bad shard does not take down the sweep; only CircuitOpenError is raised, to halt it.
+    :param shard: (index, uniqnames, search chunk size)
+    :return: (index, list of CheckEligibilityResponse.to_dict(include_user=False), number of responses with errors,
+    seconds, failure repr or None)
+    """
+    index, uniqnames, chunk_size = shard
+    checker, validate_affiliation = worker_checker()
+    started = time.monotonic()
+    results = []
+    errors = 0
+    failure = None
+    try:
+        for response in checker.check_eligibility_many(uniqnames, validate_affiliation, chunk_size=chunk_size):
+            results.append(response.to_dict(include_user=False))
+            errors += response.errors is not None
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        failure = repr(e)
+        remaining = uniqnames[len(results):]
+        results += [checker._error_response(uniqname, e).to_dict(include_user=False) for uniqname in remaining]
+        errors += len(remaining)
+    return index, results, errors, time.monotonic() - started, failure
+
+
+class ShardedSweep:
+    """
+    Check eligibility for a large set of uniqnames across worker processes, so response construction and entitlement
+    parsing are not limited by the GIL. The uniqnames are deduplicated and split into shards; each worker process has
+    its own checker and MCommunity connection, seeded with the override group members from this process so the groups
+    are not fetched again in every worker. A shard that fails, even by its worker process dying, gives its users error
+    responses instead of stopping the sweep.
+    """
+    checker_class: Type[EligibilityChecker]
+    duplicates: int  # Uniqnames skipped by the last run because they were already seen
+    failed_shards: int  # Shards in the last run that did not finish and got error responses
+
+    def __init__(self, checker_class: Type[EligibilityChecker], mcommunity_app_cn: str, mcommunity_secret: str,
+                 processes: int = 4, shard_size: int = 1000, chunk_size: int = 100, validate_affiliation: bool = True,
+                 ordered: bool = True, progress: Optional[Callable[[ShardProgress], None]] = None):
+        """
+        :param checker_class: the EligibilityChecker subclass to make decisions with
+        :param mcommunity_app_cn: MCommunity app cn
+        :param mcommunity_secret: MCommunity app secret
+        :param processes: the number of worker processes; 1 runs everything in this process
+        :param shard_size: the number of uniqnames sent to a worker at a time
+        :param chunk_size: the number of uniqnames a worker fetches in a single search
+        :param validate_affiliation: see EligibilityChecker.check_eligibility
+        :param ordered: yield results in input order; if False, shards are yielded as soon as they finish
+        :param progress: called with a ShardProgress as each shard's results arrive
+        """
+        if shard_size < 1:
+            raise ValueError(f'shard_size must be at least 1, got {shard_size}')
+        self.checker_class = checker_class
+        self.mcommunity_app_cn = mcommunity_app_cn
+        self.mcommunity_secret = mcommunity_secret
+        self.processes = processes
+        self.shard_size = shard_size
+        self.chunk_size = chunk_size
+        self.validate_affiliation = validate_affiliation
+        self.ordered = ordered
+        self.progress = progress
+        self.duplicates = 0
+        self.failed_shards = 0
+
+    def run(self, uniqnames: Iterable[str]) -> Iterator[dict]:
+        """
+        Check every uniqname once. The uniqnames are streamed, but remembering which have been seen takes memory in
+        proportion to how many there are.
+        :param uniqnames: the uniqnames to check; repeats (ignoring case) after the first are skipped
+        :return: generator of CheckEligibilityResponse.to_dict(include_user=False) dictionaries, in input order unless
+        ordered is False
+        """
+        self.duplicates = self.failed_shards = 0
+        checker = self.checker_class(self.mcommunity_app_cn, self.mcommunity_secret)  # Fetches the override groups
+        initargs = (self.checker_class, self.mcommunity_app_cn, self.mcommunity_secret,
+                    shared_override_members(checker), self.validate_affiliation)
+        shards = ((index, shard, self.chunk_size)
+                  for index, shard in enumerate(chunked(self._deduplicated(uniqnames), self.shard_size)))
+
+        def lost_shard(shard: tuple, error: BaseException) -> tuple:  # Its worker process died, i.e. it was OOM killed
+            index, uniqnames, _ = shard
+            return (index, [checker._error_response(uniqname, error).to_dict(include_user=False)
+                            for uniqname in uniqnames], len(uniqnames), 0.0, repr(error))
+
+        process_map = ordered_process_map if self.ordered else unordered_process_map
+        for index, results, errors, seconds, failure in process_map(
+                _check_shard, shards, self.processes, initializer=init_worker_checker, initargs=initargs,
+                on_broken_pool=lost_shard):
+            if failure is not None:
+                self.failed_shards += 1
+                logger.error(f'Shard {index} failed after {seconds:.1f} seconds ({failure}); its remaining users got '
+                             f'error responses.')
+            if self.progress is not None:
+                self.progress(ShardProgress(index, len(results), sum(r['eligible'] for r in results), errors, seconds,
+                                            failure))
+            yield from results
+
+    def _deduplicated(self, uniqnames: Iterable[str]) -> Iterator[str]:
+        seen = set()
+        for uniqname in uniqnames:
+            key = uniqname.lower()
+            if key in seen:
+                self.duplicates += 1
+                continue
+            seen.add(key)
+            yield uniqname
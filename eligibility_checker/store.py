@@ -0,0 +1,292 @@
+import sqlite3
+import threading
+import time
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+from eligibility_checker.resilience import is_transient
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    service TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS runs_service ON runs (service, started_at);
+CREATE TABLE IF NOT EXISTS snapshots (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    uniqname TEXT NOT NULL,
+    eligible INTEGER NOT NULL,
+    reason_code TEXT,
+    reason TEXT,
+    highest_affiliation TEXT,
+    sa_type INTEGER,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (run_id, uniqname)
+);
+CREATE INDEX IF NOT EXISTS snapshots_uniqname ON snapshots (uniqname, checked_at);
+CREATE INDEX IF NOT EXISTS snapshots_eligible ON snapshots (run_id, eligible);
+CREATE INDEX IF NOT EXISTS snapshots_reason_code ON snapshots (run_id, reason_code);
+CREATE INDEX IF NOT EXISTS snapshots_affiliation ON snapshots (run_id, highest_affiliation, sa_type);
+'''
+
+SNAPSHOT_COLUMNS = 'run_id, uniqname, eligible, reason_code, reason, highest_affiliation, sa_type, checked_at'
+
+
+class Run(NamedTuple):
+    run_id: int
+    service: str
+    started_at: float
+    finished_at: Optional[float]
+
+
+class Snapshot(NamedTuple):
+    run_id: int
+    uniqname: str
+    eligible: bool
+    reason_code: Optional[str]
+    reason: Optional[str]
+    highest_affiliation: Optional[str]
+    sa_type: Optional[int]
+    checked_at: float
+
+
+class Flip(NamedTuple):
+    uniqname: str
+    was_eligible: bool
+    eligible: bool
+    reason_code: Optional[str]
+    reason: Optional[str]
+
+
+class EligibilitySnapshotStore:
+    """
+    SQLite store of eligibility decisions, one snapshot per uniqname per run, so that questions like "who became
+    ineligible this week" or "which sponsored affiliates are type 2" can be answered without searching MCommunity. An
+    EligibilityChecker given a store falls back to a user's latest stored decision when MCommunity is unavailable.
+
+    Responses for which MCommunity was unavailable are not recorded, since they are not decisions. highest_affiliation
+    and sa_type are only recorded for responses that still have their MCommunityUser (see retain_mcommunity_users) and
+    whose decision looked at affiliations.
+    """
+    path: str
+
+    def __init__(self, path: str = ':memory:'):
+        """
+        :param path: SQLite database file; created if it does not exist
+        """
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)  # Shared by threads; every use holds _lock
+        self._db.execute('PRAGMA foreign_keys = ON')
+        if path != ':memory:':
+            self._db.execute('PRAGMA journal_mode = WAL')  # Readers are not blocked while a sweep is recording
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    ########
+    # Runs #
+    ########
+    def start_run(self, service: str) -> int:
+        """
+        Start a run, i.e. a sweep of a service's users.
+        :param service: service_friendly of the checker
+        :return: the run_id to record snapshots under
+        """
+        with self._lock, self._db:
+            return self._db.execute('INSERT INTO runs (service, started_at) VALUES (?, ?)',
+                                    (service, time.time())).lastrowid
+
+    def finish_run(self, run_id: int) -> None:
+        with self._lock, self._db:
+            self._db.execute('UPDATE runs SET finished_at = ? WHERE run_id = ?', (time.time(), run_id))
+
+    def runs(self, service: Optional[str] = None) -> List[Run]:
+        """
+        :param service: only list runs of this service
+        :return: list of Run, oldest first
+        """
+        query = 'SELECT run_id, service, started_at, finished_at FROM runs'
+        params = ()
+        if service is not None:
+            query += ' WHERE service = ?'
+            params = (service,)
+        with self._lock:
+            return [Run(*row) for row in self._db.execute(query + ' ORDER BY started_at, run_id', params)]
+
+    def latest_run(self, service: str, before: Optional[float] = None) -> Optional[Run]:
+        """
+        Find the most recent finished run of a service.
+        :param service: service_friendly of the checker
+        :param before: only consider runs started before this time.time()
+        :return: Run, or None if there is none
+        """
+        query = 'SELECT run_id, service, started_at, finished_at FROM runs WHERE service = ? ' \
+                'AND finished_at IS NOT NULL'
+        params = [service]
+        if before is not None:
+            query += ' AND started_at < ?'
+            params.append(before)
+        with self._lock:
+            row = self._db.execute(query + ' ORDER BY started_at DESC, run_id DESC LIMIT 1', params).fetchone()
+        return Run(*row) if row else None
+
+    def delete_runs(self, service: str, keep: int) -> int:
+        """
+        Delete all but the most recent runs of a service, along with their snapshots.
+        :param service: service_friendly of the checker
+        :param keep: the number of runs to keep
+        :return: the number of runs deleted
+        """
+        with self._lock, self._db:
+            return self._db.execute(
+                'DELETE FROM runs WHERE service = ? AND run_id NOT IN '
+                '(SELECT run_id FROM runs WHERE service = ? ORDER BY started_at DESC, run_id DESC LIMIT ?)',
+                (service, service, keep)).rowcount
+
+    #############
+    # Snapshots #
+    #############
+    def record(self, run_id: int, responses: Iterable, batch_size: int = 1000) -> int:
+        """
+        Insert or replace the snapshots of many responses, in transactions of batch_size rows.
+        :param run_id: the run to record the snapshots under
+        :param responses: CheckEligibilityResponse objects
+        :param batch_size: the number of rows written per transaction
+        :return: the number of snapshots recorded
+        """
+        count = 0
+        batch = []
+        for response in responses:
+            if is_transient(response.errors):
+                continue
+            batch.append(self._row(run_id, response))
+            if len(batch) >= batch_size:
+                count += self._write(batch)
+                batch = []
+        if batch:
+            count += self._write(batch)
+        return count
+
+    def record_sweep(self, service: str, responses: Iterable, batch_size: int = 1000) -> Iterator:
+        """
+        Record a sweep as a new run while passing its responses through, i.e.
+        for response in store.record_sweep(checker.service_friendly, checker.check_eligibility_many(users)).
+        The run is only marked finished once every response has been recorded.
+        :param service: service_friendly of the checker
+        :param responses: CheckEligibilityResponse objects
+        :param batch_size: the number of rows written per transaction
+        :return: generator of the same responses
+        """
+        run_id = self.start_run(service)
+        batch = []
+        for response in responses:
+            if not is_transient(response.errors):
+                batch.append(self._row(run_id, response))
+            if len(batch) >= batch_size:
+                self._write(batch)
+                batch = []
+            yield response
+        if batch:
+            self._write(batch)
+        self.finish_run(run_id)
+
+    def snapshots(self, run_id: int, eligible: Optional[bool] = None, reason_code: Optional[str] = None,
+                  highest_affiliation: Optional[str] = None, sa_type: Optional[int] = None) -> List[Snapshot]:
+        """
+        Query the snapshots of a run, i.e. snapshots(run_id, highest_affiliation='SponsoredAffiliate', sa_type=2).
+        :param run_id: the run to query
+        :param eligible: only snapshots with this eligibility
+        :param reason_code: only snapshots with this ReasonCode
+        :param highest_affiliation: only snapshots with this highest affiliation
+        :param sa_type: only snapshots of sponsored affiliates of this type
+        :return: list of Snapshot, ordered by uniqname
+        """
+        query = f'SELECT {SNAPSHOT_COLUMNS} FROM snapshots WHERE run_id = ?'
+        params: list = [run_id]
+        for column, value in (('eligible', eligible), ('reason_code', reason_code),
+                              ('highest_affiliation', highest_affiliation), ('sa_type', sa_type)):
+            if value is not None:
+                query += f' AND {column} = ?'
+                params.append(value)
+        with self._lock:
+            return [self._snapshot(row) for row in self._db.execute(query + ' ORDER BY uniqname', params)]
+
+    def diff(self, old_run_id: int, new_run_id: int, to_eligible: Optional[bool] = None) -> List[Flip]:
+        """
+        Find the users whose eligibility is different between two runs. Users in only one of the runs are left out.
+        :param old_run_id: the earlier run
+        :param new_run_id: the later run
+        :param to_eligible: only users who became eligible (True) or ineligible (False)
+        :return: list of Flip, ordered by uniqname
+        """
+        query = 'SELECT new.uniqname, old.eligible, new.eligible, new.reason_code, new.reason FROM snapshots new ' \
+                'JOIN snapshots old ON old.run_id = ? AND old.uniqname = new.uniqname ' \
+                'WHERE new.run_id = ? AND old.eligible != new.eligible'
+        params: list = [old_run_id, new_run_id]
+        if to_eligible is not None:
+            query += ' AND new.eligible = ?'
+            params.append(to_eligible)
+        with self._lock:
+            return [Flip(uniqname, bool(was), bool(now), reason_code, reason)
+                    for uniqname, was, now, reason_code, reason in
+                    self._db.execute(query + ' ORDER BY new.uniqname', params)]
+
+    def flips_since(self, service: str, since: float, to_eligible: Optional[bool] = None) -> List[Flip]:
+        """
+        Find the users whose eligibility changed between the last run before a time and the latest run, i.e.
+        flips_since('Zoom', time.time() - 7 * 86400, to_eligible=False) for who became ineligible this week.
+        :param service: service_friendly of the checker
+        :param since: time.time() to compare with
+        :param to_eligible: only users who became eligible (True) or ineligible (False)
+        :return: list of Flip, ordered by uniqname; empty if there are not two runs to compare
+        """
+        old, new = self.latest_run(service, before=since), self.latest_run(service)
+        if old is None or new is None or old.run_id == new.run_id:
+            return []
+        return self.diff(old.run_id, new.run_id, to_eligible)
+
+    def latest(self, uniqname: str, service: str, max_age: Optional[float] = None) -> Optional[Snapshot]:
+        """
+        Get the most recent decision for a user from any run of a service.
+        :param uniqname: the uniqname to look up
+        :param service: service_friendly of the checker
+        :param max_age: seconds; ignore decisions older than this
+        :return: Snapshot, or None if there is none recent enough
+        """
+        query = f'SELECT {", ".join("s." + c for c in SNAPSHOT_COLUMNS.split(", "))} FROM snapshots s ' \
+                f'JOIN runs r ON r.run_id = s.run_id WHERE s.uniqname = ? AND r.service = ?'
+        params: list = [uniqname.lower(), service]
+        if max_age is not None:
+            query += ' AND s.checked_at >= ?'
+            params.append(time.time() - max_age)
+        with self._lock:
+            row = self._db.execute(query + ' ORDER BY s.checked_at DESC LIMIT 1', params).fetchone()
+        return self._snapshot(row) if row else None
+
+    ###################
+    # Private Methods #
+    ###################
+    @staticmethod
+    def _row(run_id: int, response) -> tuple:
+        highest_affiliation = sa_type = None
+        user = response.loaded_user  # Never fetch a user just to record it
+        if user is not None:
+            highest_affiliation = user.highest_affiliation
+            if highest_affiliation == 'SponsoredAffiliate':
+                sa_type = user.check_sponsorship_type()
+        return (run_id, response.uniqname.lower(), response.eligible, response.reason_code, response.reason,
+                highest_affiliation, sa_type, time.time())
+
+    def _write(self, rows: list) -> int:
+        with self._lock, self._db:
+            self._db.executemany(
+                f'INSERT OR REPLACE INTO snapshots ({SNAPSHOT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    @staticmethod
+    def _snapshot(row: tuple) -> Snapshot:
+        return Snapshot(row[0], row[1], bool(row[2]), *row[3:])
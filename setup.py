@@ -10,5 +10,12 @@ setup(
       packages=['eligibility_checker'],
       install_requires=[
             'mcommunity @ git+https://github.com/umich-its-collab/mcommunity-tools.git@v.10#egg=mcommunity'
-      ]
+      ],
+      extras_require={
+            'prometheus': ['prometheus-client'],
+            'opentelemetry': ['opentelemetry-api'],
+      },
+      entry_points={
+            'console_scripts': ['eligibility-checker=eligibility_checker.cli:main'],
+      },
 )
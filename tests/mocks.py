@@ -0,0 +1,16 @@
+import re
+
+import mcommunity.mcommunity_mocks as mocks
+
+
+def mcomm_bulk_side_effect(query, *args, **kwargs):
+    """
+    Side effect for MCommunityBase.search that also answers OR-filtered (bulk) user searches by looking up each uid in
+    mcommunity_mocks.
+    """
+    if query.startswith('(|'):
+        results = []
+        for uid in re.findall(r'\(uid=([^)]+)\)', query):
+            results += mocks.mcomm_side_effect(f'uid={uid}', *args, **kwargs)
+        return results
+    return mocks.mcomm_side_effect(query, *args, **kwargs)
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from eligibility_checker.aio import AsyncEligibilityChecker
+from eligibility_checker.checker import EligibilityChecker
+from eligibility_checker.overrides import override_group_membership
+import mcommunity.mcommunity_mocks as mocks
+
+from tests.mocks import mcomm_bulk_side_effect
+
+
+class EligibilityCheckerAsyncTestClass(EligibilityChecker):
+    service_friendly = 'Test Service with uSE'
+    override_groups = ['collab-iam-admins', 'something-iam-primary']
+
+
+class AsyncEligibilityCheckerTestCase(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mcomm_bulk_side_effect
+        override_group_membership.clear()
+        self.checker = EligibilityCheckerAsyncTestClass(mocks.test_app, mocks.test_secret)
+        self.mock.reset_mock()
+
+    def tearDown(self) -> None:
+        patch.stopall()
+        override_group_membership.clear()
+
+    async def test_check_eligibility_matches_checker(self):
+        async with AsyncEligibilityChecker(self.checker) as checker:
+            for uniqname in ['nemcardf', 'nemcardr', 'nemcardsa1', 'nemcardferr', 'fake']:
+                response = await checker.check_eligibility(uniqname)
+                single = self.checker.check_eligibility(uniqname)
+                self.assertEqual((single.eligible, single.reason_code, single.reason),
+                                 (response.eligible, response.reason_code, response.reason))
+
+    async def test_check_eligibility_coalesces_concurrent_lookups(self):
+        release = threading.Event()
+
+        def side_effect(query, *args, **kwargs):
+            release.wait(5)
+            return mcomm_bulk_side_effect(query, *args, **kwargs)
+        self.mock.side_effect = side_effect
+        async with AsyncEligibilityChecker(self.checker) as checker:
+            tasks = [asyncio.create_task(checker.check_eligibility('nemcards')) for _ in range(5)]
+            other = asyncio.create_task(checker.check_eligibility('nemcards', validate_affiliation=False))
+            await asyncio.sleep(0.05)
+            release.set()
+            responses = await asyncio.gather(*tasks)
+            await other
+        self.assertEqual(2, self.mock.call_count)
+        self.assertTrue(all(response is responses[0] for response in responses))
+        self.assertEqual({}, checker._in_flight)
+
+    async def test_cancelled_caller_does_not_cancel_shared_lookup(self):
+        release = threading.Event()
+
+        def side_effect(query, *args, **kwargs):
+            release.wait(5)
+            return mcomm_bulk_side_effect(query, *args, **kwargs)
+        self.mock.side_effect = side_effect
+        async with AsyncEligibilityChecker(self.checker) as checker:
+            first = asyncio.create_task(checker.check_eligibility('nemcards'))
+            second = asyncio.create_task(checker.check_eligibility('nemcards'))
+            await asyncio.sleep(0.05)
+            first.cancel()
+            release.set()
+            self.assertEqual(True, (await second).eligible)
+
+    async def test_check_eligibility_many(self):
+        uniqnames = ['nemcardf', 'nemcardr', 'nemcards', 'nemcardsa1', 'fake']
+        async with AsyncEligibilityChecker(self.checker, max_workers=2) as checker:
+            responses = [response async for response in checker.check_eligibility_many(uniqnames, chunk_size=2)]
+        self.assertEqual(uniqnames, [response.uniqname for response in responses])
+        self.assertEqual([True, False, True, True, False], [response.eligible for response in responses])
+        self.assertEqual(3, self.mock.call_count)
+
+    async def test_max_workers_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            AsyncEligibilityChecker(self.checker, max_workers=0)
@@ -0,0 +1,39 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from benchmarks import run
+from benchmarks.fake_directory import FakeDirectory
+
+
+class FakeDirectoryTestCase(TestCase):
+    def test_bulk_search_returns_only_existing_users(self):
+        directory = FakeDirectory(10)
+        results = directory.search('(|(uid=bench0000001)(uid=bench0000009)(uid=bench0000010)(uid=fake))', ['uid'])
+        self.assertEqual([[b'bench0000001'], [b'bench0000009']], [attrs['uid'] for _, attrs in results])
+        self.assertEqual(1, directory.searches)
+
+    def test_population_is_deterministic(self):
+        self.assertEqual(FakeDirectory(100, seed=1).records(), FakeDirectory(100, seed=1).records())
+
+
+class BenchmarkRunTestCase(TestCase):
+    def test_run_writes_json(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.json')
+            self.assertEqual(0, run.main(['--users', '50', '--latency', '0', '--per-entry-latency', '0',
+                                          '--serial-sample', '10', '--memory-sample', '10', '--chunk-size', '10',
+                                          '--workers', '2', '--output', path]))
+            with open(path) as f:
+                results = json.load(f)
+        self.assertEqual(50, results['batched']['users'])
+        self.assertEqual(5, results['batched']['searches'])
+        self.assertEqual(50, results['concurrent']['users'])
+        self.assertIn('p99_ms', results['serial'])
+        self.assertIn('search_p99_ms', results['batched'])
+        self.assertNotIn('p99_ms', results['concurrent'])  # Its latencies are per search, not per user
+        self.assertIn('cold_ms', results['construction'])
+
+    def test_unknown_mode(self):
+        self.assertEqual(2, run.main(['--modes', 'serial,nope']))
@@ -0,0 +1,75 @@
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from eligibility_checker.cache import EligibilityCache
+from eligibility_checker.checker import CheckEligibilityResponse
+from mcommunity.mcommunity_user import MCommunityUser
+import mcommunity.mcommunity_mocks as mocks
+
+
+class EligibilityCacheTestCase(TestCase):
+    @patch('mcommunity.mcommunity_base.MCommunityBase.search')
+    def setUp(self, magic_mock) -> None:
+        magic_mock.side_effect = mocks.mcomm_side_effect
+        user = MCommunityUser('nemcardf', mocks.test_app, mocks.test_secret)
+        self.eligible = CheckEligibilityResponse(eligible=True, reason='reason', user=user, errors=None)
+        self.ineligible = CheckEligibilityResponse(eligible=False, reason='reason', user=user, errors=None)
+        self.error = CheckEligibilityResponse(eligible=False, reason='error', user=user, errors=Exception('error'))
+
+    def test_get_miss_then_hit(self):
+        cache = EligibilityCache()
+        self.assertIsNone(cache.get('nemcardf'))
+        cache.set('nemcardf', True, self.eligible)
+        self.assertIs(self.eligible, cache.get('nemcardf'))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertEqual(0.5, cache.hit_rate)
+
+    def test_validate_affiliation_is_part_of_key(self):
+        cache = EligibilityCache()
+        cache.set('nemcardf', False, self.eligible)
+        self.assertIsNone(cache.get('nemcardf', True))
+
+    def test_service_is_part_of_key(self):
+        cache = EligibilityCache()
+        cache.set('nemcardf', True, self.eligible, 'Zoom')
+        cache.set('nemcardf', True, self.ineligible, 'Slack')
+        self.assertIs(self.eligible, cache.get('nemcardf', True, 'Zoom'))
+        self.assertIs(self.ineligible, cache.get('nemcardf', True, 'Slack'))
+        self.assertIsNone(cache.get('nemcardf', True, 'Box'))
+        cache.invalidate('nemcardf', 'Zoom')
+        self.assertIsNone(cache.get('nemcardf', True, 'Zoom'))
+        self.assertIsNotNone(cache.get('nemcardf', True, 'Slack'))
+        cache.invalidate('nemcardf')
+        self.assertIsNone(cache.get('nemcardf', True, 'Slack'))
+
+    def test_separate_ttls(self):
+        cache = EligibilityCache(positive_ttl=60, negative_ttl=0.01, error_ttl=0)
+        cache.set('eligible', True, self.eligible)
+        cache.set('ineligible', True, self.ineligible)
+        cache.set('error', True, self.error)
+        self.assertIsNone(cache.get('error'))
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('ineligible'))
+        self.assertIs(self.eligible, cache.get('eligible'))
+
+    def test_lru_eviction(self):
+        cache = EligibilityCache(max_size=2)
+        cache.set('a', True, self.eligible)
+        cache.set('b', True, self.eligible)
+        cache.get('a')
+        cache.set('c', True, self.eligible)
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertEqual(2, len(cache))
+
+    def test_invalidate_and_clear(self):
+        cache = EligibilityCache()
+        cache.set('a', True, self.eligible)
+        cache.set('a', False, self.eligible)
+        cache.set('b', True, self.eligible)
+        cache.invalidate('A')
+        self.assertIsNone(cache.get('a', True))
+        self.assertIsNone(cache.get('a', False))
+        cache.clear()
+        self.assertEqual(0, len(cache))
@@ -2,7 +2,7 @@ import json
 import unittest
 from unittest.mock import patch
 
-from eligibility_checker.checker import CheckEligibilityResponse
+from eligibility_checker.checker import CheckEligibilityResponse, ReasonCode
 from mcommunity.mcommunity_user import MCommunityUser
 import mcommunity.mcommunity_mocks as mocks
 
@@ -37,3 +37,33 @@ class CheckEligibilityResponseTestCase(unittest.TestCase):
         with self.assertRaises(TypeError):  # Sanity check--should fail on TypeError without to_dict
             json.dumps(self.response_invalid)
         self.assertTrue(json.dumps(self.response_invalid.to_dict()))  # Now should pass since using to_dict
+
+    def test_uniqname_defaults_to_user_name(self):
+        self.assertEqual('nemcardf', self.response_valid.uniqname)
+
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            self.response_valid.extra = 'not allowed'
+
+    def test_to_dict_without_user(self):
+        d = self.response_invalid.to_dict(include_user=False)
+        self.assertNotIn('user', d)
+        self.assertEqual('fake', d['uniqname'])
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.search')
+    def test_user_loaded_lazily(self, magic_mock):
+        magic_mock.side_effect = mocks.mcomm_side_effect
+        loads = []
+
+        def loader():
+            loads.append(1)
+            return MCommunityUser('nemcardf', mocks.test_app, mocks.test_secret)
+        r = CheckEligibilityResponse(eligible=True, reason='reason', uniqname='nemcardf',
+                                     reason_code=ReasonCode.OVERRIDE, user_loader=loader)
+        self.assertEqual([], loads)
+        self.assertEqual(r.user, r.user)
+        self.assertEqual([1], loads)
+
+    def test_to_tuple(self):
+        self.assertEqual(('fake', False, None, 'not exists', "Exception('exception')"),
+                         self.response_invalid.to_tuple())
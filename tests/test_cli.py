@@ -0,0 +1,130 @@
+import csv
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import ldap
+
+from eligibility_checker import cli
+from eligibility_checker.overrides import override_group_membership
+from eligibility_checker.resilience import CircuitOpenError
+from eligibility_checker.store import EligibilitySnapshotStore
+import mcommunity.mcommunity_mocks as mocks
+
+from tests.mocks import mcomm_bulk_side_effect
+
+checker_path = 'tests.test_eligibility_checker.EligibilityCheckerUSETestClass'
+
+
+class CLISweepTestCase(TestCase):
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mcomm_bulk_side_effect
+        self.tmp = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.tmp.name, 'uniqnames.txt')
+        self.output = os.path.join(self.tmp.name, 'results')
+        self.checkpoint = os.path.join(self.tmp.name, 'checkpoint.json')
+        with open(self.input, 'w') as f:
+            f.write('nemcards\n\n# comment\nnemcardr\nfake\nnemcardsa1\n')
+
+    def tearDown(self) -> None:
+        patch.stopall()
+        override_group_membership.clear()
+        self.tmp.cleanup()
+
+    def sweep(self, *args) -> int:
+        return cli.main(['sweep', '--checker', checker_path, '--app-cn', mocks.test_app, '--secret', mocks.test_secret,
+                         '--input', self.input, '--output', self.output, *args])
+
+    def read_jsonl(self) -> list:
+        with open(self.output) as f:
+            return [json.loads(line) for line in f]
+
+    def test_sweep_jsonl(self):
+        self.assertEqual(0, self.sweep('--batch-size', '2'))
+        self.assertEqual([True, False, False, True], [r['eligible'] for r in self.read_jsonl()])
+
+    def test_sweep_csv(self):
+        self.assertEqual(0, self.sweep('--format', 'csv', '--workers', '2', '--batch-size', '1'))
+        with open(self.output) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(['nemcards', 'nemcardr', 'fake', 'nemcardsa1'], [r['uniqname'] for r in rows])
+        self.assertEqual('True', rows[0]['eligible'])
+
+    def test_sweep_resumes_from_checkpoint(self):
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'lines_done': 4}, f)
+        with open(self.output, 'w') as f:
+            f.write('{}\n')  # Stands in for the results written before the interruption
+        self.assertEqual(0, self.sweep('--checkpoint', self.checkpoint))
+        results = self.read_jsonl()
+        self.assertEqual(3, len(results))
+        self.assertEqual([False, True], [r['eligible'] for r in results[1:]])
+        self.assertEqual(6, cli.read_checkpoint(self.checkpoint)['lines_done'])
+
+    def test_sweep_stops_when_circuit_opens(self):
+        def side_effect(query, *args, **kwargs):
+            if query.startswith('(|'):
+                raise ldap.SERVER_DOWN('down')
+            return mcomm_bulk_side_effect(query, *args, **kwargs)
+        self.mock.side_effect = side_effect
+        with patch('eligibility_checker.resilience.time.sleep'):
+            self.assertEqual(3, self.sweep('--max-rate', '1000', '--batch-size', '1', '--checkpoint', self.checkpoint))
+        self.assertEqual([], self.read_jsonl())  # MCommunity was unavailable for nemcards and nemcardr
+        checkpoint = cli.read_checkpoint(self.checkpoint)
+        self.assertEqual(4, checkpoint['lines_done'])  # Resumes with the user the circuit opened on
+        self.assertEqual(['nemcards', 'nemcardr'], checkpoint['retry'])
+        self.mock.side_effect = mcomm_bulk_side_effect
+        self.assertEqual(0, self.sweep('--max-rate', '1000', '--batch-size', '1', '--checkpoint', self.checkpoint))
+        self.assertEqual(['nemcards', 'nemcardr', 'fake', 'nemcardsa1'], [r['uniqname'] for r in self.read_jsonl()])
+        self.assertEqual([], cli.read_checkpoint(self.checkpoint)['retry'])
+
+    def test_sweep_writes_nothing_of_a_batch_the_circuit_opens_in(self):
+        def side_effect(query, *args, **kwargs):
+            if 'nemcardsa1' in query:
+                raise CircuitOpenError('open')
+            return mcomm_bulk_side_effect(query, *args, **kwargs)
+        self.mock.side_effect = side_effect
+        self.assertEqual(3, self.sweep('--max-rate', '1000', '--batch-size', '1', '--workers', '2',
+                                       '--checkpoint', self.checkpoint))
+        self.assertEqual(['nemcards', 'nemcardr'], [r['uniqname'] for r in self.read_jsonl()])  # Not fake
+        self.mock.side_effect = mcomm_bulk_side_effect
+        self.assertEqual(0, self.sweep('--checkpoint', self.checkpoint))
+        self.assertEqual(['nemcards', 'nemcardr', 'fake', 'nemcardsa1'], [r['uniqname'] for r in self.read_jsonl()])
+
+    def test_sweep_records_run_in_store(self):
+        path = os.path.join(self.tmp.name, 'eligibility.sqlite3')
+        self.assertEqual(0, self.sweep('--store', path))
+        store = EligibilitySnapshotStore(path)
+        run = store.latest_run('Test Service with uSE')
+        self.assertEqual(['fake', 'nemcardr'], [s.uniqname for s in store.snapshots(run.run_id, eligible=False)])
+        store.close()
+
+    def test_sweep_resumes_recording_into_the_same_run(self):
+        def side_effect(query, *args, **kwargs):
+            if '(uid=nemcardr)' in query:
+                raise KeyboardInterrupt
+            return mcomm_bulk_side_effect(query, *args, **kwargs)
+        self.mock.side_effect = side_effect
+        path = os.path.join(self.tmp.name, 'eligibility.sqlite3')
+        with self.assertRaises(KeyboardInterrupt):
+            self.sweep('--store', path, '--checkpoint', self.checkpoint, '--batch-size', '1')
+        self.mock.side_effect = mcomm_bulk_side_effect
+        self.assertEqual(0, self.sweep('--store', path, '--checkpoint', self.checkpoint, '--batch-size', '1'))
+        store = EligibilitySnapshotStore(path)
+        self.assertEqual(1, len(store.runs()))
+        run = store.latest_run('Test Service with uSE')
+        self.assertCountEqual(['nemcards', 'nemcardr', 'fake', 'nemcardsa1'],
+                              [s.uniqname for s in store.snapshots(run.run_id)])
+        store.close()
+
+    def test_sweep_requires_credentials(self):
+        with patch.dict(os.environ, {}, clear=True), self.assertRaises(SystemExit):
+            cli.main(['sweep', '--checker', checker_path])
+
+    def test_load_checker_class_rejects_non_checker(self):
+        with self.assertRaises(TypeError):
+            cli.load_checker_class('tests.mocks.mcomm_bulk_side_effect')
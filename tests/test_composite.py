@@ -0,0 +1,171 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import ldap
+
+from eligibility_checker.cache import EligibilityCache
+from eligibility_checker.checker import EligibilityChecker, ReasonCode
+from eligibility_checker.composite import CompositeEligibilityChecker
+from eligibility_checker.instrumentation import Phase
+from eligibility_checker.overrides import override_group_membership
+from eligibility_checker.resilience import CircuitBreaker, CircuitOpenError, DirectoryGuard, RetryPolicy
+from mcommunity.mcommunity_base import MCommunityBase
+import mcommunity.mcommunity_mocks as mocks
+
+from tests.mocks import mcomm_bulk_side_effect
+from tests.test_instrumentation import RecordingInstrumentation
+
+
+class EligibilityCheckerUSETestClass(EligibilityChecker):
+    service_friendly = 'Test Service with uSE'
+    override_groups = ['collab-iam-admins', 'something-iam-primary']
+
+
+class EligibilityCheckerAffiliationsTestClass(EligibilityChecker):
+    service_friendly = 'Test Service with no uSE'
+    service_entitlement = None
+    override_groups = ['collab-iam-admins']
+    eligible_affiliations_minus_sa = ['Faculty', 'RegularStaff', 'Student', 'TemporaryStaff', 'Retiree']
+    eligible_sa_types = [1, 2]
+    mcommunity_user_attributes = ['uid', 'umichInstRoles', 'umichSponsorshipDetail', 'cn']
+
+
+class CompositeEligibilityCheckerTestCase(TestCase):
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mcomm_bulk_side_effect
+        override_group_membership.clear()
+        self.composite = CompositeEligibilityChecker(
+            [EligibilityCheckerUSETestClass, EligibilityCheckerAffiliationsTestClass], mocks.test_app,
+            mocks.test_secret)
+
+    def tearDown(self) -> None:
+        patch.stopall()
+        override_group_membership.clear()
+
+    def test_init_unions_attributes(self):
+        self.assertEqual(['uid', 'umichServiceEntitlement', 'umichInstRoles', 'umichSponsorshipDetail', 'cn'],
+                         self.composite.mcommunity_user_attributes)
+
+    def test_init_errors_if_duplicate_service(self):
+        with self.assertRaises(ValueError):
+            CompositeEligibilityChecker([EligibilityCheckerUSETestClass, EligibilityCheckerUSETestClass],
+                                        mocks.test_app, mocks.test_secret)
+
+    def test_init_errors_if_no_checkers(self):
+        with self.assertRaises(ValueError):
+            CompositeEligibilityChecker([], mocks.test_app, mocks.test_secret)
+
+    def test_check_eligibility_matches_each_checker(self):
+        for uniqname in ['nemcardf', 'nemcardr', 'nemcardsa2', 'nemcardferr', 'nemcarda', 'fake']:
+            decisions = self.composite.check_eligibility(uniqname)
+            self.assertEqual(['Test Service with uSE', 'Test Service with no uSE'], list(decisions))
+            for service, checker in self.composite.checkers.items():
+                single = checker.check_eligibility(uniqname)
+                self.assertEqual((single.eligible, single.reason_code, single.reason),
+                                 (decisions[service].eligible, decisions[service].reason_code,
+                                  decisions[service].reason))
+
+    def test_check_eligibility_fetches_user_once(self):
+        self.mock.reset_mock()
+        self.composite.check_eligibility('nemcardr')
+        self.assertEqual(1, self.mock.call_count)
+
+    def test_eligible_services(self):
+        self.assertEqual(['Test Service with no uSE'], self.composite.eligible_services('nemcardr'))
+        self.assertEqual(['Test Service with uSE', 'Test Service with no uSE'],
+                         self.composite.eligible_services('nemcards'))
+
+    def test_check_eligibility_many_one_search_per_chunk(self):
+        self.mock.reset_mock()
+        uniqnames = ['nemcardf', 'nemcardr', 'nemcards', 'nemcardsa2', 'fake']
+        results = list(self.composite.check_eligibility_many(uniqnames, chunk_size=2))
+        self.assertEqual(3, self.mock.call_count)
+        self.assertEqual(uniqnames, [uniqname for uniqname, _ in results])
+        for uniqname, decisions in results:
+            expected = self.composite.check_eligibility(uniqname)
+            self.assertEqual({service: r.reason for service, r in expected.items()},
+                             {service: r.reason for service, r in decisions.items()})
+
+    def test_check_eligibility_many_falls_back_to_single_searches(self):
+        def side_effect(query, *args, **kwargs):
+            if query.startswith('(|'):
+                raise RuntimeError('bulk search failed')
+            return mocks.mcomm_side_effect(query, *args, **kwargs)
+        self.mock.side_effect = side_effect
+        results = dict(self.composite.check_eligibility_many(['nemcards', 'nemcardr']))
+        self.assertEqual(False, results['nemcardr']['Test Service with uSE'].eligible)
+        self.assertEqual(True, results['nemcardr']['Test Service with no uSE'].eligible)
+
+    def test_check_eligibility_searches_pooled_connection_for_needed_attributes(self):
+        with patch('eligibility_checker.pool.MCommunityBase', wraps=MCommunityBase) as base:
+            self.mock.reset_mock()
+            for uniqname in ['nemcards', 'nemcardr']:
+                self.composite.check_eligibility(uniqname)
+        self.assertEqual(1, base.call_count)
+        self.assertEqual(self.composite.mcommunity_user_attributes, self.mock.call_args[0][1])
+
+    def test_init_passes_cache_guard_and_instrumentation_to_checkers(self):
+        cache, guard = EligibilityCache(), DirectoryGuard()
+        composite = CompositeEligibilityChecker([EligibilityCheckerUSETestClass], mocks.test_app, mocks.test_secret,
+                                                cache=cache, guard=guard)
+        checker = composite.checkers['Test Service with uSE']
+        self.assertIs(cache, checker.cache)
+        self.assertIs(guard, checker.guard)
+
+    def test_searches_are_instrumented_once(self):
+        instrumentation = RecordingInstrumentation()
+        composite = CompositeEligibilityChecker(
+            [EligibilityCheckerUSETestClass, EligibilityCheckerAffiliationsTestClass], mocks.test_app,
+            mocks.test_secret, instrumentation=instrumentation)
+        instrumentation.phases.clear()
+        composite.check_eligibility('nemcardr')
+        self.assertEqual([('Test Service with uSE', Phase.USER_FETCH)],
+                         [timed for timed in instrumentation.phases if timed[1] == Phase.USER_FETCH])
+
+        def side_effect(query, *args, **kwargs):
+            if query.startswith('(|'):
+                raise RuntimeError('bulk search failed')
+            return mocks.mcomm_side_effect(query, *args, **kwargs)
+        self.mock.side_effect = side_effect
+        list(composite.check_eligibility_many(['nemcards', 'nemcardsa1']))
+        self.assertEqual([RuntimeError], instrumentation.errors)
+
+    def test_check_eligibility_uses_cache(self):
+        composite = CompositeEligibilityChecker(
+            [EligibilityCheckerUSETestClass, EligibilityCheckerAffiliationsTestClass], mocks.test_app,
+            mocks.test_secret, cache=EligibilityCache())
+        first = composite.check_eligibility('nemcardr')
+        self.mock.reset_mock()
+        self.assertEqual(first, composite.check_eligibility('nemcardr'))
+        self.assertEqual(first, dict(composite.check_eligibility_many(['nemcardr']))['nemcardr'])
+        self.assertFalse(self.mock.called)
+
+    def test_check_eligibility_directory_error(self):
+        self.mock.side_effect = ldap.SERVER_DOWN('down')
+        decisions = self.composite.check_eligibility('nemcards')
+        self.assertEqual([ReasonCode.DIRECTORY_ERROR] * 2, [r.reason_code for r in decisions.values()])
+
+    def test_check_eligibility_many_directory_errors_without_fallback_when_guarded(self):
+        def side_effect(query, *args, **kwargs):
+            raise ldap.SERVER_DOWN('down')
+        composite = CompositeEligibilityChecker(
+            [EligibilityCheckerUSETestClass, EligibilityCheckerAffiliationsTestClass], mocks.test_app,
+            mocks.test_secret, guard=DirectoryGuard(retry_policy=RetryPolicy(max_attempts=2)))
+        self.mock.side_effect = side_effect
+        self.mock.reset_mock()
+        with patch('eligibility_checker.resilience.time.sleep'):
+            results = dict(composite.check_eligibility_many(['nemcards', 'nemcardr']))
+        self.assertEqual(2, self.mock.call_count)  # The bulk search and its retry; no single searches
+        self.assertEqual({ReasonCode.DIRECTORY_ERROR},
+                         {r.reason_code for decisions in results.values() for r in decisions.values()})
+
+    def test_check_eligibility_many_halts_when_circuit_opens(self):
+        composite = CompositeEligibilityChecker(
+            [EligibilityCheckerUSETestClass], mocks.test_app, mocks.test_secret,
+            guard=DirectoryGuard(retry_policy=RetryPolicy(max_attempts=1),
+                                 circuit_breaker=CircuitBreaker(failure_threshold=1)))
+        self.mock.side_effect = ldap.SERVER_DOWN('down')
+        with self.assertRaises(CircuitOpenError):
+            list(composite.check_eligibility_many(['nemcards', 'nemcardr'], chunk_size=1))
@@ -0,0 +1,49 @@
+import json
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from eligibility_checker.directory import PrefetchedMCommunityUser, only_service_entitlement, search_user, search_users
+import mcommunity.mcommunity_mocks as mocks
+
+
+def entitlement(system: str) -> bytes:
+    return json.dumps({'system': system, 'foreignKey': 'x'}).encode()
+
+
+class DirectoryTestCase(TestCase):
+    def test_only_service_entitlement(self):
+        attrs = {'uid': [b'nemcards'],
+                 'umichServiceEntitlement': [entitlement('box'), entitlement('Enterprise'), entitlement('dropbox')]}
+        filtered = only_service_entitlement([('uid=nemcards', attrs)], 'enterprise')
+        self.assertEqual([entitlement('Enterprise')], filtered[0][1]['umichServiceEntitlement'])
+        self.assertEqual([b'nemcards'], filtered[0][1]['uid'])
+        self.assertEqual(3, len(attrs['umichServiceEntitlement']))  # The search result is not changed
+
+    def test_only_service_entitlement_without_entitlements(self):
+        raw_result = [('uid=nemcardr', {'uid': [b'nemcardr']})]
+        self.assertEqual(raw_result, only_service_entitlement(raw_result, 'enterprise'))
+
+    def test_search_user_escapes_uniqname(self):
+        connection = MagicMock()
+        connection.search.return_value = None
+        self.assertEqual([], search_user(connection, 'a*)(uid=b', ['uid']))
+        connection.search.assert_called_once_with(r'uid=a\2a\29\28uid=b', ['uid'])
+
+    def test_search_users_fills_every_spelling(self):
+        connection = MagicMock()
+        entry = ('uid=nemcards', {'uid': [b'nemcards']})
+        connection.search.return_value = [entry]
+        results = search_users(connection, ['NemCardS', 'nemcards', 'NEMCARDS', 'nemcards', 'fake'], ['uid'])
+        self.assertEqual({'NemCardS': [entry], 'nemcards': [entry], 'NEMCARDS': [entry]}, results)
+        connection.search.assert_called_once_with('(|(uid=NemCardS)(uid=fake))', ['uid'])
+
+    @patch('ldap.ldapobject.SimpleLDAPObject.__init__', side_effect=AssertionError('connected'))
+    @patch('ldap.initialize', side_effect=AssertionError('connected'))
+    @patch('mcommunity.mcommunity_base.MCommunityBase.search', side_effect=AssertionError('searched'))
+    def test_prefetched_user_does_not_search_or_connect(self, search, initialize, ldap_object):
+        entry = ('uid=nemcards', {'uid': [b'nemcards'], 'umichInstRoles': [b'StudentAA']})
+        user = PrefetchedMCommunityUser('nemcards', mocks.test_app, mocks.test_secret, [entry])
+        self.assertIsNone(user.errors)
+        self.assertFalse(search.called)
+        self.assertFalse(initialize.called)
+        self.assertFalse(ldap_object.called)
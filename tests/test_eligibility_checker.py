@@ -1,12 +1,23 @@
 from copy import deepcopy
+import json
 import logging
+import os
+import tempfile
+import threading
+import time
 from unittest import main, TestCase
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
-from eligibility_checker.checker import EligibilityChecker
+
+from eligibility_checker.cache import EligibilityCache
+from eligibility_checker.checker import EligibilityChecker, ReasonCode
+from eligibility_checker.overrides import override_group_membership
 from mcommunity import MCommunityUser
+from mcommunity.mcommunity_base import MCommunityBase
 import mcommunity.mcommunity_mocks as mocks
 
+from tests.mocks import mcomm_bulk_side_effect
+
 test_user = 'nemcardf'
 
 
@@ -22,6 +33,9 @@ class EligibilityCheckerAffiliationsTestClass(EligibilityChecker):
 
 
 class EligibilityCheckerEmptyOverrideTestCase(TestCase):
+    def setUp(self) -> None:
+        override_group_membership.clear()
+
     @patch('mcommunity.mcommunity_base.MCommunityBase.search')
     def test_init_raises_exception_if_empty_override_group(self, magic_mock):
         magic_mock.return_value = [('cn=collab-iam-admins,ou=User Groups,ou=Groups,dc=umich,dc=edu',
@@ -36,14 +50,70 @@ class EligibilityCheckerTestCase(TestCase):
         self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
         self.mock = self.patcher.start()
         self.mock.side_effect = mocks.mcomm_side_effect
+        override_group_membership.clear()
 
     def tearDown(self) -> None:
         patch.stopall()
+        override_group_membership.clear()
 
     def test_init_populates_override_group_members(self):
         c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
         self.assertCountEqual(['nemcardf', 'nemcardrs', 'nemcarda', 'nemcardts'], c.override_group_members)
 
+    def test_init_shares_override_group_members_across_instances(self):
+        EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        self.mock.reset_mock()
+        c = EligibilityCheckerAffiliationsTestClass(mocks.test_app, mocks.test_secret)
+        self.assertFalse(self.mock.called)
+        self.assertIn('nemcardf', c.override_group_members)
+        self.assertEqual([], EligibilityChecker.override_group_members)  # Class attribute is not mutated
+
+    def test_init_lazy_override_groups(self):
+        class LazyTestClass(EligibilityCheckerUSETestClass):
+            lazy_override_groups = True
+        c = LazyTestClass(mocks.test_app, mocks.test_secret)
+        self.assertFalse(self.mock.called)
+        self.assertEqual(True, c.check_eligibility('nemcarda').eligible)
+
+    def test_init_static_override_group_members(self):
+        class StaticTestClass(EligibilityCheckerUSETestClass):
+            override_group_members = ['nemcardr']
+        c = StaticTestClass(mocks.test_app, mocks.test_secret)
+        self.assertFalse(self.mock.called)
+        self.assertEqual('Override group member', c.check_eligibility('nemcardr').reason)
+
+    def test_init_loads_override_snapshot_unless_too_old(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'overrides.json')
+
+            class SnapshotTestClass(EligibilityCheckerUSETestClass):
+                override_snapshot_path = path
+                override_snapshot_max_age = 3600
+            for fetched_at, expected in ((time.time(), True), (time.time() - 7200, False)):
+                override_group_membership.clear()
+                with open(path, 'w') as f:
+                    json.dump({group: {'members': ['snapshotuser'], 'fetched_at': fetched_at}
+                               for group in SnapshotTestClass.override_groups}, f)
+                c = SnapshotTestClass(mocks.test_app, mocks.test_secret)
+                self.assertEqual(expected, 'snapshotuser' in c.override_group_members)
+                self.assertEqual(not expected, 'nemcardf' in c.override_group_members)
+
+    def test_override_refresh_while_rebuilding_is_not_missed(self):
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        override_group_membership.update({'collab-iam-admins': ['nemcardf']})
+        get = override_group_membership.get
+        refreshed = []
+
+        def get_then_refresh(group, *args):
+            members = get(group, *args)
+            if not refreshed:  # Another thread refreshes the group just after this one read it
+                refreshed.append(group)
+                override_group_membership.update({group: ['newadmin']})
+            return members
+        with patch.object(override_group_membership, 'get', side_effect=get_then_refresh):
+            c._get_override_group_members()
+        self.assertIn('newadmin', c._get_override_group_members())
+
     @patch('eligibility_checker.checker.EligibilityChecker._validate')
     def test_init_validates_attributes(self, magic_mock):
         EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
@@ -231,6 +301,241 @@ class EligibilityCheckerTestCase(TestCase):
         self.assertIsInstance(r.user, MCommunityUser)
         self.assertIsInstance(r.errors, NameError)
 
+    # Tests for the bulk version
+    def test_check_eligibility_many_matches_check_eligibility(self):
+        self.mock.side_effect = mcomm_bulk_side_effect
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        uniqnames = ['nemcardf', 'nemcardr', 'nemcardsa1', 'nemcardferr', 'nemcarda', 'fake']
+        many = list(c.check_eligibility_many(uniqnames, chunk_size=4))
+        self.assertEqual(uniqnames, [r.user.name for r in many])
+        for r in many:
+            single = c.check_eligibility(r.user.name)
+            self.assertEqual((single.eligible, single.reason), (r.eligible, r.reason))
+
+    def test_check_eligibility_many_one_search_per_chunk(self):
+        self.mock.side_effect = mcomm_bulk_side_effect
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        self.mock.reset_mock()
+        list(c.check_eligibility_many(['nemcardf', 'nemcardr', 'nemcards', 'nemcardsa1', 'nemcardts'], chunk_size=2))
+        self.assertEqual(3, self.mock.call_count)
+        self.assertTrue(self.mock.call_args_list[0][0][0].startswith('(|(uid=nemcardf)(uid=nemcardr)'))
+
+    def test_check_eligibility_many_na(self):
+        self.mock.side_effect = mcomm_bulk_side_effect
+        r = list(EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret).check_eligibility_many(
+            ['nemcards', 'fake']))
+        self.assertEqual(True, r[0].eligible)
+        self.assertEqual(False, r[1].eligible)
+        self.assertEqual('No user found in MCommunity for fake', r[1].reason)
+        self.assertIsInstance(r[1].errors, NameError)
+
+    def test_check_eligibility_many_falls_back_to_single_searches(self):
+        def side_effect(query, *args, **kwargs):
+            if query.startswith('(|'):
+                raise RuntimeError('bulk search failed')
+            return mocks.mcomm_side_effect(query, *args, **kwargs)
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        self.mock.side_effect = side_effect
+        r = list(c.check_eligibility_many(['nemcards', 'nemcardr']))
+        self.assertEqual([True, False], [i.eligible for i in r])
+
+    # Tests for the concurrent version
+    def test_check_eligibility_concurrent_matches_check_eligibility(self):
+        self.mock.side_effect = mcomm_bulk_side_effect
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        uniqnames = ['nemcardf', 'nemcardr', 'nemcardsa1', 'nemcardferr', 'nemcarda', 'fake', 'nemcards']
+        for chunk_size in (1, 3):
+            concurrent = list(c.check_eligibility_concurrent(uniqnames, max_workers=3, chunk_size=chunk_size))
+            self.assertEqual(uniqnames, [r.user.name for r in concurrent])
+            for r in concurrent:
+                single = c.check_eligibility(r.user.name)
+                self.assertEqual((single.eligible, single.reason), (r.eligible, r.reason))
+
+    def test_check_eligibility_concurrent_timeout(self):
+        def side_effect(query, *args, **kwargs):
+            if 'nemcardr' in query:
+                time.sleep(0.5)
+            return mcomm_bulk_side_effect(query, *args, **kwargs)
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        self.mock.side_effect = side_effect
+        r = list(c.check_eligibility_concurrent(['nemcards', 'nemcardr'], max_workers=2, timeout=0.1))
+        self.assertEqual(True, r[0].eligible)
+        self.assertEqual(False, r[1].eligible)
+        self.assertIsInstance(r[1].errors, TimeoutError)
+
+    def test_check_eligibility_concurrent_timeout_starts_when_chunk_runs(self):
+        def side_effect(query, *args, **kwargs):
+            time.sleep(0.15)
+            return mcomm_bulk_side_effect(query, *args, **kwargs)
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        self.mock.side_effect = side_effect
+        # With one worker the second chunk waits 0.15 seconds for the first, then runs for 0.15 of its own
+        r = list(c.check_eligibility_concurrent(['nemcards', 'nemcardsa1'], max_workers=1, timeout=0.25))
+        self.assertEqual([None, None], [i.errors for i in r])
+
+    def test_check_eligibility_concurrent_timeout_limits_ldap_searches(self):
+        timeouts = []
+
+        class LDAPMCommunityBase(MCommunityBase):
+            # Like MCommunityBase, only creates its LDAP object when it first connects to search
+            def search(self, query, attributes=None):
+                if not hasattr(self, 'conn'):
+                    self.conn = Mock(spec=['set_option', 'timeout'])
+                    self.conn.timeout = -1
+                timeouts.append(self.conn.timeout)
+                return super().search(query, attributes)
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        self.mock.side_effect = mcomm_bulk_side_effect
+        with patch('eligibility_checker.pool.MCommunityBase', LDAPMCommunityBase):
+            list(c.check_eligibility_concurrent(['nemcards'], max_workers=1, timeout=5))  # Connects
+            del timeouts[:]
+            list(c.check_eligibility_concurrent(['nemcardsa1'], max_workers=1, timeout=5))
+        self.assertTrue(timeouts)
+        self.assertEqual({5}, set(timeouts))
+
+    def test_check_eligibility_concurrent_falls_back_without_deadlock(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def side_effect(query, *args, **kwargs):
+            if query.startswith('(|'):
+                barrier.wait()  # Both workers hold their pooled connection when their bulk searches fail
+                raise RuntimeError('bulk search failed')
+            return mocks.mcomm_side_effect(query, *args, **kwargs)
+
+        class TwoConnectionsTestClass(EligibilityCheckerUSETestClass):
+            mcommunity_pool_size = 2
+        c = TwoConnectionsTestClass(mocks.test_app, mocks.test_secret)
+        self.mock.side_effect = side_effect
+        r = []
+        thread = threading.Thread(target=lambda: r.extend(c.check_eligibility_concurrent(
+            ['nemcards', 'nemcardr', 'nemcardsa1', 'nemcardf'], max_workers=2, chunk_size=2)), daemon=True)
+        thread.start()
+        thread.join(timeout=10)
+        self.assertFalse(thread.is_alive(), 'check_eligibility_concurrent deadlocked')
+        self.assertEqual([True, False, True, True], [i.eligible for i in r])
+
+    # Tests for caching
+    def test_check_eligibility_uses_cache(self):
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret, cache=EligibilityCache())
+        first = c.check_eligibility('nemcards')
+        self.mock.reset_mock()
+        self.assertIs(first, c.check_eligibility('nemcards'))
+        self.assertFalse(self.mock.called)
+
+    def test_check_eligibility_shared_cache_is_per_service(self):
+        cache = EligibilityCache()
+        use = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret, cache=cache)
+        affiliations = EligibilityCheckerAffiliationsTestClass(mocks.test_app, mocks.test_secret, cache=cache)
+        self.assertFalse(use.check_eligibility('nemcardferr', validate_affiliation=False).eligible)
+        self.assertTrue(affiliations.check_eligibility('nemcardferr', validate_affiliation=False).eligible)
+
+    def test_check_eligibility_many_only_fetches_cache_misses(self):
+        self.mock.side_effect = mcomm_bulk_side_effect
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret, cache=EligibilityCache())
+        c.check_eligibility('nemcards')
+        self.mock.reset_mock()
+        r = list(c.check_eligibility_many(['nemcards', 'nemcardr']))
+        self.assertEqual([True, False], [i.eligible for i in r])
+        self.assertEqual(1, self.mock.call_count)
+        self.assertNotIn('nemcards', self.mock.call_args[0][0])
+
+    def test_check_eligibility_reason_codes(self):
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        self.assertEqual(ReasonCode.OVERRIDE, c.check_eligibility('nemcarda').reason_code)
+        self.assertEqual(ReasonCode.ENTITLEMENT, c.check_eligibility('nemcards').reason_code)
+        self.assertEqual(ReasonCode.ENTITLEMENT_MISMATCH, c.check_eligibility('nemcardferr').reason_code)
+        self.assertEqual(ReasonCode.ERROR, c.check_eligibility('fake').reason_code)
+        a = EligibilityCheckerAffiliationsTestClass(mocks.test_app, mocks.test_secret)
+        self.assertEqual(ReasonCode.AFFILIATION_INELIGIBLE, a.check_eligibility('nemcardr').reason_code)
+        self.assertEqual(ReasonCode.SA_TYPE_ELIGIBLE, a.check_eligibility('nemcardsa1').reason_code)
+
+    def test_check_eligibility_without_retaining_users(self):
+        class NoRetainTestClass(EligibilityCheckerUSETestClass):
+            retain_mcommunity_users = False
+        r = NoRetainTestClass(mocks.test_app, mocks.test_secret).check_eligibility('nemcards')
+        self.assertIsNone(r._user)
+        self.assertEqual('nemcards', r.uniqname)
+        self.assertIsInstance(r.user, MCommunityUser)
+
+    def test_check_eligibility_lazy_user_matches_retained_user(self):
+        class NoRetainTestClass(EligibilityCheckerUSETestClass):
+            retain_mcommunity_users = False
+        for validate_affiliation in (True, False):
+            retained = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret).check_eligibility(
+                'nemcards', validate_affiliation)
+            lazy = NoRetainTestClass(mocks.test_app, mocks.test_secret).check_eligibility(
+                'nemcards', validate_affiliation)
+            checked_with = self.searched_attributes()
+            self.assertEqual(retained.user.raw_result, lazy.user.raw_result)
+            self.assertEqual(checked_with, self.searched_attributes())  # Fetched again the same way
+
+    # Tests for projected fetches
+    def searched_attributes(self) -> list:
+        return self.mock.call_args[0][1]
+
+    def test_check_eligibility_fetches_only_needed_attributes(self):
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        c.check_eligibility('nemcards')
+        self.assertEqual(['uid', 'umichServiceEntitlement', 'umichInstRoles', 'umichSponsorshipDetail'],
+                         self.searched_attributes())
+        self.assertEqual('uid=nemcards', self.mock.call_args[0][0])
+        c.check_eligibility('nemcards', validate_affiliation=False)
+        self.assertEqual(['uid', 'umichServiceEntitlement'], self.searched_attributes())
+        c.check_eligibility('nemcarda')
+        self.assertEqual(['uid'], self.searched_attributes())  # Override members only need to exist
+        a = EligibilityCheckerAffiliationsTestClass(mocks.test_app, mocks.test_secret)
+        a.check_eligibility('nemcardr', validate_affiliation=False)
+        self.assertEqual(['uid', 'umichInstRoles', 'umichSponsorshipDetail'], self.searched_attributes())
+
+    def test_check_eligibility_many_fetches_only_needed_attributes(self):
+        self.mock.side_effect = mcomm_bulk_side_effect
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        r = list(c.check_eligibility_many(['nemcards', 'nemcardr'], validate_affiliation=False))
+        self.assertEqual(['uid', 'umichServiceEntitlement'], self.searched_attributes())
+        self.assertEqual([True, False], [i.eligible for i in r])
+
+    def test_check_eligibility_override_member_not_in_mcommunity(self):
+        class MissingOverrideTestClass(EligibilityCheckerUSETestClass):
+            override_group_members = ['fake']
+        r = MissingOverrideTestClass(mocks.test_app, mocks.test_secret).check_eligibility('fake')
+        self.assertEqual((False, ReasonCode.ERROR), (r.eligible, r.reason_code))
+
+    def test_check_eligibility_reuses_pooled_connection(self):
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        with patch('eligibility_checker.pool.MCommunityBase', wraps=MCommunityBase) as base:
+            for uniqname in ['nemcards', 'nemcardr', 'nemcardsa1']:
+                c.check_eligibility(uniqname)
+        self.assertEqual(1, base.call_count)
+
+    def test_check_eligibility_search_error(self):
+        c = EligibilityCheckerAffiliationsTestClass(mocks.test_app, mocks.test_secret)
+        self.mock.side_effect = RuntimeError('search failed')
+        r = c.check_eligibility('nemcards')
+        self.assertEqual((False, ReasonCode.ERROR), (r.eligible, r.reason_code))
+        self.assertIsInstance(r.errors, RuntimeError)
+
+    # Tests for compiled rules
+    def test_rules_recompiled_when_configuration_changes(self):
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        rules = c.rules
+        self.assertIs(rules, c.rules)
+        c.eligible_affiliations_minus_sa = ['Faculty', 'RegularStaff', 'TemporaryStaff']
+        self.assertIsNot(rules, c.rules)
+        self.assertNotIn('Student', c.rules.eligible_affiliations)
+
+    def test_evaluate_records(self):
+        c = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        records = [
+            {'uid': 'nemcarda', 'entitlements': set(), 'highest_affiliation': 'Alumni', 'sa_type': None},
+            {'uid': 'x', 'entitlements': {'enterprise'}, 'highest_affiliation': 'Student', 'sa_type': None},
+            {'uid': 'y', 'entitlements': set(), 'highest_affiliation': 'Retiree', 'sa_type': None},
+        ]
+        decisions = list(c.evaluate_records(records))
+        self.assertEqual(['nemcarda', 'x', 'y'], [uid for uid, _ in decisions])
+        self.assertEqual([ReasonCode.OVERRIDE, ReasonCode.ENTITLEMENT, ReasonCode.ENTITLEMENT],
+                         [d.reason_code for _, d in decisions])
+        self.assertEqual([True, True, False], [d.eligible for _, d in decisions])
+
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.DEBUG)
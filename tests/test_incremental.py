@@ -0,0 +1,118 @@
+import json
+import os
+import re
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import ldap
+
+from eligibility_checker.incremental import IncrementalSweep
+from eligibility_checker.overrides import override_group_membership
+import mcommunity.mcommunity_mocks as mocks
+
+from tests.mocks import mcomm_bulk_side_effect
+from tests.test_eligibility_checker import EligibilityCheckerUSETestClass
+
+
+class IncrementalSweepTestCase(TestCase):
+    def setUp(self) -> None:
+        self.modified = set()  # uids that the directory reports as modified since the watermark
+        self.down = set()  # uids whose searches fail with SERVER_DOWN
+
+        def side_effect(query, *args, **kwargs):
+            if any(uid in self.down for uid in re.findall(r'uid=([^)]+)', query)):
+                raise ldap.SERVER_DOWN('down')
+            if 'modifyTimestamp' in query:
+                uids = [uid for uid in re.findall(r'\(uid=([^)]+)\)', query) if uid in self.modified]
+                if not uids:
+                    return []
+                query = '(|' + ''.join(f'(uid={uid})' for uid in uids) + ')'
+            return mcomm_bulk_side_effect(query, *args, **kwargs)
+
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = side_effect
+        self.tmp = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.tmp.name, 'state.json')
+        self.checker = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        self.sweep = IncrementalSweep(self.checker, self.state_path)
+
+    def tearDown(self) -> None:
+        patch.stopall()
+        override_group_membership.clear()
+        self.tmp.cleanup()
+
+    def test_first_run_yields_everyone(self):
+        flipped = list(self.sweep.run(['nemcards', 'nemcardr', 'nemcardf']))
+        self.assertEqual(['nemcards', 'nemcardr', 'nemcardf'], [r.user.name for r in flipped])
+        with open(self.state_path) as f:
+            state = json.load(f)
+        self.assertRegex(state['watermark'], r'^\d{14}Z$')
+        self.assertEqual({'eligible': True, 'override': True}, state['users']['nemcardf'])
+
+    def test_second_run_only_searches_modified_and_yields_flips(self):
+        list(self.sweep.run(['nemcards', 'nemcardr']))
+        with open(self.state_path) as f:
+            state = json.load(f)
+        state['users']['nemcards']['eligible'] = False  # Pretend nemcards was ineligible last time
+        with open(self.state_path, 'w') as f:
+            json.dump(state, f)
+        self.modified = {'nemcards'}
+        self.mock.reset_mock()
+        flipped = list(self.sweep.run(['nemcards', 'nemcardr']))
+        self.assertEqual(['nemcards'], [r.user.name for r in flipped])
+        self.assertEqual(1, self.sweep.checked)
+        self.assertIn('(modifyTimestamp>=', self.mock.call_args[0][0])
+
+    def test_new_users_are_checked_and_removed_users_dropped(self):
+        list(self.sweep.run(['nemcards', 'nemcardr']))
+        flipped = list(self.sweep.run(['nemcards', 'nemcardsa1']))
+        self.assertEqual(['nemcardsa1'], [r.user.name for r in flipped])
+        with open(self.state_path) as f:
+            self.assertCountEqual(['nemcards', 'nemcardsa1'], json.load(f)['users'])
+
+    def test_state_not_saved_if_interrupted(self):
+        run = self.sweep.run(['nemcards', 'nemcardr'])
+        next(run)
+        run.close()
+        self.assertFalse(os.path.exists(self.state_path))
+
+    def test_failed_checks_are_not_yielded_or_saved(self):
+        self.down = {'nemcards'}
+        flipped = list(self.sweep.run(['nemcards', 'nemcardr']))
+        self.assertEqual(['nemcardr'], [r.user.name for r in flipped])
+        self.assertEqual(1, self.sweep.failed)
+        with open(self.state_path) as f:
+            self.assertEqual(['nemcardr'], list(json.load(f)['users']))
+        self.down = set()
+        flipped = list(self.sweep.run(['nemcards', 'nemcardr']))  # nemcards is not modified, but is re-checked fully
+        self.assertEqual(['nemcards'], [r.user.name for r in flipped])
+        self.assertEqual(0, self.sweep.failed)
+
+    def test_failed_check_drops_previous_decision(self):
+        self.sweep = IncrementalSweep(self.checker, self.state_path, chunk_size=1)
+        list(self.sweep.run(['nemcards', 'nemcardr']))
+        self.modified = self.down = {'nemcards'}
+        self.assertEqual([], list(self.sweep.run(['nemcards', 'nemcardr'])))
+        with open(self.state_path) as f:
+            self.assertEqual(['nemcardr'], list(json.load(f)['users']))
+
+    def test_not_found_and_mismatched_users_are_decisions(self):
+        flipped = list(self.sweep.run(['fake', 'nemcardferr']))
+        self.assertEqual(['fake', 'nemcardferr'], [r.uniqname for r in flipped])
+        self.assertEqual(0, self.sweep.failed)
+        with open(self.state_path) as f:
+            users = json.load(f)['users']
+        self.assertFalse(users['fake']['eligible'])
+        self.assertTrue(users['nemcardferr']['eligible'])
+
+    def test_changed_rules_recheck_everyone(self):
+        list(self.sweep.run(['nemcards', 'nemcardr']))
+        self.checker.eligible_sa_types = [2]
+        self.mock.reset_mock()
+        list(self.sweep.run(['nemcards', 'nemcardr']))
+        self.assertEqual(2, self.sweep.checked)
+        self.assertFalse(any('modifyTimestamp' in c[0][0] for c in self.mock.call_args_list))
+        with open(self.state_path) as f:
+            self.assertEqual([2], json.load(f)['rules_key'][-1])
@@ -0,0 +1,86 @@
+from contextlib import contextmanager
+from unittest import TestCase
+from unittest.mock import patch
+
+from eligibility_checker.checker import EligibilityChecker, ReasonCode
+from eligibility_checker.instrumentation import Instrumentation, Phase
+from eligibility_checker.overrides import override_group_membership
+import mcommunity.mcommunity_mocks as mocks
+
+
+class EligibilityCheckerInstrumentationTestClass(EligibilityChecker):
+    service_friendly = 'Test Service with uSE'
+    override_groups = ['collab-iam-admins', 'something-iam-primary']
+
+
+class RecordingInstrumentation(Instrumentation):
+    def __init__(self):
+        self.phases = []
+        self.decisions = []
+        self.errors = []
+
+    @contextmanager
+    def timer(self, service, phase):
+        yield
+        self.phases.append((service, phase))
+
+    def count_decision(self, service, reason_code, eligible):
+        self.decisions.append((reason_code, eligible))
+
+    def count_error(self, service, error):
+        self.errors.append(type(error))
+
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mocks.mcomm_side_effect
+        override_group_membership.clear()
+        self.instrumentation = RecordingInstrumentation()
+        self.checker = EligibilityCheckerInstrumentationTestClass(mocks.test_app, mocks.test_secret,
+                                                                  instrumentation=self.instrumentation)
+
+    def tearDown(self) -> None:
+        patch.stopall()
+        override_group_membership.clear()
+
+    def phases(self):
+        return [phase for _, phase in self.instrumentation.phases]
+
+    def test_init_times_override_group_fetch(self):
+        self.assertEqual([Phase.OVERRIDE_GROUP_FETCH], self.phases())
+
+    def test_check_eligibility_times_each_phase(self):
+        self.instrumentation.phases.clear()
+        self.checker.check_eligibility('nemcardr')
+        self.assertEqual([Phase.USER_FETCH, Phase.OVERRIDE_LOOKUP, Phase.ENTITLEMENT_CHECK,
+                          Phase.AFFILIATION_VALIDATION, Phase.RESPONSE_BUILD], self.phases())
+        self.assertTrue(all(service == 'Test Service with uSE' for service, _ in self.instrumentation.phases))
+
+    def test_check_eligibility_counts_decisions(self):
+        self.checker.check_eligibility('nemcardf')
+        self.checker.check_eligibility('nemcardr')
+        self.assertEqual([(ReasonCode.OVERRIDE, True), (ReasonCode.ENTITLEMENT, False)],
+                         self.instrumentation.decisions)
+
+    def test_check_eligibility_counts_errors(self):
+        self.checker.check_eligibility('nemcardna')
+        self.assertEqual([(ReasonCode.ERROR, False)], self.instrumentation.decisions)
+        self.assertEqual(1, len(self.instrumentation.errors))
+
+    def test_check_eligibility_many_counts_failed_bulk_search(self):
+        def side_effect(query, *args, **kwargs):
+            if query.startswith('(|'):
+                raise TimeoutError('bulk search timed out')
+            return mocks.mcomm_side_effect(query, *args, **kwargs)
+        self.mock.side_effect = side_effect
+        list(self.checker.check_eligibility_many(['nemcards', 'nemcardr']))
+        self.assertEqual([TimeoutError], self.instrumentation.errors)
+
+    def test_default_is_no_op(self):
+        checker = EligibilityCheckerInstrumentationTestClass(mocks.test_app, mocks.test_secret)
+        self.assertIs(type(checker.instrumentation), Instrumentation)
+        with checker.instrumentation.timer('service', Phase.USER_FETCH):
+            pass
+        self.assertEqual(ReasonCode.ENTITLEMENT, checker.check_eligibility('nemcardr').reason_code)
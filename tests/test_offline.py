@@ -0,0 +1,110 @@
+import base64
+import gzip
+import io
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from eligibility_checker.checker import ReasonCode
+from eligibility_checker.offline import evaluate_entries, evaluate_file, iter_entries, iter_jsonl, iter_ldif
+from eligibility_checker.overrides import override_group_membership
+import mcommunity.mcommunity_mocks as mocks
+
+from tests.test_eligibility_checker import EligibilityCheckerUSETestClass
+
+uniqnames = ['nemcardf', 'nemcardr', 'nemcards', 'nemcardsa1', 'nemcardferr', 'nemcarda']
+
+
+def mock_entries() -> list:
+    entries = []
+    for uniqname in uniqnames:
+        entries += mocks.mcomm_side_effect(f'uid={uniqname}', ['*'])
+    return entries
+
+
+def to_ldif(entries: list) -> bytes:
+    lines = [b'version: 1', b'']
+    for dn, attrs in entries:
+        lines.append(b'dn: ' + dn.encode())
+        for name, values in attrs.items():
+            for value in values:
+                lines.append(name.encode() + b':: ' + base64.b64encode(value))
+        lines.append(b'')
+    return b'\n'.join(lines) + b'\n'
+
+
+class OfflineTestCase(TestCase):
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mocks.mcomm_side_effect
+        self.checker = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        patch.stopall()
+        override_group_membership.clear()
+        self.tmp.cleanup()
+
+    def test_iter_ldif_round_trip(self):
+        entries = mock_entries()
+        expected = [(dn, {name: values for name, values in attrs.items() if values}) for dn, attrs in entries]
+        self.assertEqual(expected, list(iter_ldif(io.BytesIO(to_ldif(entries)))))
+
+    def test_iter_ldif_folded_lines_and_comments(self):
+        ldif = b'# a comment\n  continued\ndn: uid=a,ou=People\nuid: a\ndescription: folded\n  value\n\n'
+        self.assertEqual([('uid=a,ou=People', {'uid': [b'a'], 'description': [b'folded value']})],
+                         list(iter_ldif(io.BytesIO(ldif))))
+
+    def test_iter_ldif_skips_change_records(self):
+        ldif = b'dn: uid=a,ou=People\nchangetype: delete\n\ndn: uid=b,ou=People\nuid: b\n'
+        self.assertEqual(['uid=b,ou=People'], [dn for dn, _ in iter_ldif(io.BytesIO(ldif))])
+
+    def test_iter_jsonl(self):
+        jsonl = b'{"dn": "uid=a,ou=People", "attributes": {"uid": ["a"], "cn": "A"}}\n\n{"dn": "uid=b", "uid": "b"}\n'
+        self.assertEqual([('uid=a,ou=People', {'uid': [b'a'], 'cn': [b'A']}), ('uid=b', {'uid': [b'b']})],
+                         list(iter_jsonl(io.BytesIO(jsonl))))
+
+    def test_iter_jsonl_encodes_other_values_as_json(self):
+        jsonl = b'{"dn": "uid=a", "uid": "a", "count": 3, "active": true, "detail": {"type": 1}}\n'
+        self.assertEqual([('uid=a', {'uid': [b'a'], 'count': [b'3'], 'active': [b'true'], 'detail': [b'{"type": 1}']})],
+                         list(iter_jsonl(io.BytesIO(jsonl))))
+
+    def test_iter_entries_gzip(self):
+        path = os.path.join(self.tmp.name, 'export.ldif.gz')
+        with gzip.open(path, 'wb') as f:
+            f.write(to_ldif(mock_entries()))
+        self.assertEqual(len(uniqnames), len(list(iter_entries(path))))
+
+    def test_evaluate_entries_matches_check_eligibility(self):
+        self.mock.reset_mock()
+        responses = list(evaluate_entries(self.checker, mock_entries()))
+        self.assertFalse(self.mock.called)
+        for r in responses:
+            single = self.checker.check_eligibility(r.uniqname)
+            self.assertEqual((single.eligible, single.reason), (r.eligible, r.reason))
+
+    def test_evaluate_entries_error_does_not_stop_the_rest(self):
+        check_user_eligibility = self.checker._check_user_eligibility
+
+        def side_effect(user, validate_affiliation):
+            if user.name == 'nemcardr':
+                raise ValueError('malformed entry')
+            return check_user_eligibility(user, validate_affiliation)
+        with patch.object(self.checker, '_check_user_eligibility', side_effect=side_effect):
+            responses = list(evaluate_entries(self.checker, mock_entries()))
+        self.assertEqual(uniqnames, [r.uniqname for r in responses])
+        self.assertIsInstance(responses[1].errors, ValueError)
+        self.assertEqual((False, ReasonCode.ERROR), (responses[1].eligible, responses[1].reason_code))
+        self.assertTrue(responses[2].eligible)
+
+    def test_evaluate_file_in_processes(self):
+        path = os.path.join(self.tmp.name, 'export.ldif')
+        with open(path, 'wb') as f:
+            f.write(to_ldif(mock_entries()))
+        serial = list(evaluate_file(EligibilityCheckerUSETestClass, path, processes=1, chunk_size=2))
+        parallel = list(evaluate_file(EligibilityCheckerUSETestClass, path, processes=2, chunk_size=2))
+        self.assertEqual(uniqnames, [r['uniqname'] for r in parallel])
+        self.assertEqual(serial, parallel)
+        self.assertEqual('Override group member', parallel[0]['reason'])
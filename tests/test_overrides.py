@@ -0,0 +1,69 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from eligibility_checker.overrides import OverrideGroupMembership
+import mcommunity.mcommunity_mocks as mocks
+
+
+class OverrideGroupMembershipTestCase(TestCase):
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mocks.mcomm_side_effect
+        self.membership = OverrideGroupMembership()
+
+    def tearDown(self) -> None:
+        patch.stopall()
+        self.membership.clear()
+
+    def test_get_fetches_once(self):
+        members = self.membership.get('collab-iam-admins', mocks.test_app, mocks.test_secret)
+        self.assertIsInstance(members, frozenset)
+        self.mock.reset_mock()
+        self.assertIs(members, self.membership.get('collab-iam-admins', mocks.test_app, mocks.test_secret))
+        self.assertFalse(self.mock.called)
+
+    def test_refresh_raises_if_empty(self):
+        self.mock.side_effect = None
+        self.mock.return_value = [('cn=collab-iam-admins,ou=User Groups,ou=Groups,dc=umich,dc=edu',
+                                   {'umichGroupEmail': [b'collab.iam.admins'], 'cn': [b'collab-iam-admins']})]
+        with self.assertRaises(RuntimeError):
+            self.membership.refresh('collab-iam-admins', mocks.test_app, mocks.test_secret)
+
+    def test_refresh_only_bumps_version_on_change(self):
+        self.membership.refresh('collab-iam-admins', mocks.test_app, mocks.test_secret)
+        version = self.membership.version
+        self.membership.refresh('collab-iam-admins', mocks.test_app, mocks.test_secret)
+        self.assertEqual(version, self.membership.version)
+
+    def test_save_and_load(self):
+        members = self.membership.get('collab-iam-admins', mocks.test_app, mocks.test_secret)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'overrides.json')
+            self.membership.save(path)
+            loaded = OverrideGroupMembership()
+            loaded.load(path)
+            self.mock.reset_mock()
+            self.assertEqual(members, loaded.get('collab-iam-admins', mocks.test_app, mocks.test_secret))
+            self.assertFalse(self.mock.called)
+
+    def test_load_skips_stale_groups(self):
+        self.membership.get('collab-iam-admins', mocks.test_app, mocks.test_secret)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'overrides.json')
+            self.membership.save(path)
+            loaded = OverrideGroupMembership()
+            loaded.load(path, max_age=-1)
+            self.mock.reset_mock()
+            loaded.get('collab-iam-admins', mocks.test_app, mocks.test_secret)
+            self.assertTrue(self.mock.called)
+
+    def test_load_missing_file(self):
+        self.membership.load('/nonexistent/overrides.json')
+        self.assertEqual(0, self.membership.version)
+
+    def test_start_refresh_rejects_bad_interval(self):
+        with self.assertRaises(ValueError):
+            self.membership.start_refresh(['collab-iam-admins'], mocks.test_app, mocks.test_secret, 0)
@@ -0,0 +1,82 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+import ldap
+
+from eligibility_checker.pool import MCommunityConnectionPool
+from mcommunity.mcommunity_base import MCommunityBase
+import mcommunity.mcommunity_mocks as mocks
+
+
+class LDAPMCommunityBase(MCommunityBase):
+    # Like MCommunityBase, only creates its LDAP object when it first connects to search
+    def search(self, query, attributes=None):
+        if not hasattr(self, 'conn'):
+            self.conn = Mock(spec=['set_option', 'timeout', 'unbind_s'])
+        return []
+
+
+class MCommunityConnectionPoolTestCase(TestCase):
+    def setUp(self) -> None:
+        self.pool = MCommunityConnectionPool(mocks.test_app, mocks.test_secret, size=2)
+
+    def test_connection_is_reused(self):
+        with self.pool.connection() as first:
+            pass
+        with self.pool.connection() as second:
+            self.assertIs(first, second)
+
+    def test_pool_is_bounded(self):
+        with self.pool.connection(), self.pool.connection():
+            with self.assertRaises(TimeoutError):
+                with self.pool.connection(timeout=0.01):
+                    pass
+
+    def test_connection_discarded_after_error(self):
+        with self.assertRaises(RuntimeError):
+            with self.pool.connection() as first:
+                raise RuntimeError('connection broke')
+        with self.pool.connection() as second:
+            self.assertIsNot(first, second)
+
+    def test_size_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            MCommunityConnectionPool(mocks.test_app, mocks.test_secret, size=0)
+
+    def test_connection_returned_when_generator_closed(self):
+        def searches():
+            with self.pool.connection() as connection:
+                yield connection
+                yield connection
+        generator = searches()
+        first = next(generator)
+        generator.close()  # The consumer stopped early; GeneratorExit is raised inside the with block
+        with self.pool.connection() as second:
+            self.assertIs(first, second)
+
+    def test_discarded_connection_unbound(self):
+        with patch('eligibility_checker.pool.MCommunityBase', LDAPMCommunityBase):
+            with self.assertRaises(RuntimeError):
+                with self.pool.connection() as connection:
+                    connection.search('uid=nemcardf')
+                    raise RuntimeError('connection broke')
+        connection.conn.unbind_s.assert_called_once_with()
+
+    def test_search_timeout_set_once_connected(self):
+        pool = MCommunityConnectionPool(mocks.test_app, mocks.test_secret, size=1, search_timeout=10)
+        with patch('eligibility_checker.pool.MCommunityBase', LDAPMCommunityBase):
+            with pool.connection() as connection:
+                connection.search('uid=nemcardf')  # Connects
+            with pool.connection() as connection:
+                connection.conn.set_option.assert_any_call(ldap.OPT_TIMEOUT, 10)
+                self.assertEqual(10, connection.conn.timeout)
+
+    def test_search_timeout_for_one_checkout(self):
+        with patch('eligibility_checker.pool.MCommunityBase', LDAPMCommunityBase):
+            with self.pool.connection() as connection:
+                connection.search('uid=nemcardf')  # Connects
+            with self.pool.connection(search_timeout=2) as connection:
+                connection.conn.set_option.assert_any_call(ldap.OPT_TIMEOUT, 2)
+                self.assertEqual(2, connection.conn.timeout)
+        connection.conn.set_option.assert_called_with(ldap.OPT_NETWORK_TIMEOUT, -1)  # Back to the pool's (none)
+        self.assertEqual(-1, connection.conn.timeout)
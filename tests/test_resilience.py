@@ -0,0 +1,218 @@
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+import ldap
+
+from eligibility_checker.checker import EligibilityChecker, ReasonCode
+from eligibility_checker.overrides import override_group_membership
+from eligibility_checker.resilience import (AdaptiveRateLimiter, CircuitBreaker, CircuitOpenError, DirectoryGuard,
+                                            DirectoryThrottledError, RetryPolicy, is_transient)
+import mcommunity.mcommunity_mocks as mocks
+
+from tests.mocks import mcomm_bulk_side_effect
+
+
+class EligibilityCheckerResilienceTestClass(EligibilityChecker):
+    service_friendly = 'Test Service with uSE'
+    override_groups = ['collab-iam-admins', 'something-iam-primary']
+
+
+class Flaky:
+    """
+    Raises the given errors in turn, then returns 'ok'.
+    """
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+class AdaptiveRateLimiterTestCase(TestCase):
+    def test_acquire_waits_when_bucket_is_empty(self):
+        limiter = AdaptiveRateLimiter(rate=100, burst=1)
+        started = time.monotonic()
+        for _ in range(5):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.035)
+        self.assertGreater(limiter.throttled_seconds, 0)
+
+    def test_acquire_max_wait(self):
+        limiter = AdaptiveRateLimiter(rate=1, burst=1)
+        limiter.acquire()
+        with self.assertRaises(DirectoryThrottledError):
+            limiter.acquire(max_wait=0.01)
+
+    def test_rate_grows_additively_and_is_capped(self):
+        limiter = AdaptiveRateLimiter(rate=10, max_rate=10.5, increase=1)
+        for _ in range(10):
+            limiter.record_success(0.01)
+        self.assertAlmostEqual(10.5, limiter.rate)
+
+    def test_rate_cut_on_failure_and_slow_search(self):
+        limiter = AdaptiveRateLimiter(rate=10, min_rate=3, decrease=0.5, decrease_interval=0)
+        limiter.record_failure()
+        self.assertEqual(5, limiter.rate)
+        limiter.record_success(latency=10)
+        self.assertEqual(3, limiter.rate)
+        self.assertEqual(2, limiter.decreases)
+
+    def test_rate_cut_at_most_once_per_interval(self):
+        limiter = AdaptiveRateLimiter(rate=10, decrease=0.5, decrease_interval=60)
+        for _ in range(5):
+            limiter.record_failure()
+        self.assertEqual(5, limiter.rate)
+
+
+class CircuitBreakerTestCase(TestCase):
+    def test_opens_after_threshold_and_half_opens_after_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.02)
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        time.sleep(0.03)
+        breaker.before_call()  # Trial search
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()  # Only one trial at a time
+        breaker.record_failure()
+        self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+        self.assertEqual(2, breaker.trips)
+
+    def test_success_closes(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(CircuitBreaker.CLOSED, breaker.state)
+
+
+class DirectoryGuardTestCase(TestCase):
+    def setUp(self) -> None:
+        self.sleep = patch('eligibility_checker.resilience.time.sleep').start()
+
+    def tearDown(self) -> None:
+        patch.stopall()
+
+    def test_is_transient(self):
+        self.assertTrue(is_transient(ldap.SERVER_DOWN()))
+        self.assertTrue(is_transient(TimeoutError()))
+        self.assertFalse(is_transient(NameError()))
+        self.assertFalse(is_transient(None))
+
+    def test_retries_transient_errors_with_backoff(self):
+        guard = DirectoryGuard(retry_policy=RetryPolicy(max_attempts=3, base_delay=1))
+        fn = Flaky(ldap.BUSY(), ldap.TIMEOUT())
+        self.assertEqual('ok', guard.call(fn))
+        self.assertEqual(3, fn.calls)
+        self.assertEqual(2, self.sleep.call_count)
+        self.assertTrue(all(0 <= c[0][0] <= 2 for c in self.sleep.call_args_list))
+        self.assertEqual((1, 2, 2, 0), (guard.calls, guard.retries, guard.transient_errors, guard.failures))
+
+    def test_gives_up_after_max_attempts(self):
+        guard = DirectoryGuard(retry_policy=RetryPolicy(max_attempts=2))
+        fn = Flaky(ldap.BUSY(), ldap.BUSY(), ldap.BUSY())
+        with self.assertRaises(ldap.BUSY):
+            guard.call(fn)
+        self.assertEqual(2, fn.calls)
+        self.assertEqual(1, guard.failures)
+
+    def test_does_not_retry_other_errors(self):
+        guard = DirectoryGuard()
+        fn = Flaky(NameError())
+        with self.assertRaises(NameError):
+            guard.call(fn)
+        self.assertEqual(1, fn.calls)
+
+    def test_circuit_open_sheds(self):
+        guard = DirectoryGuard(retry_policy=RetryPolicy(max_attempts=5),
+                               circuit_breaker=CircuitBreaker(failure_threshold=2))
+        fn = Flaky(*[ldap.SERVER_DOWN()] * 5)
+        with self.assertRaises(CircuitOpenError):
+            guard.call(fn)
+        self.assertEqual(2, fn.calls)
+        with self.assertRaises(CircuitOpenError):
+            guard.call(fn)
+        stats = guard.stats()
+        self.assertEqual((2, 'open', 1), (stats['shed'], stats['circuit_state'], stats['circuit_trips']))
+
+    def test_throttled_trial_does_not_keep_circuit_half_open(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()  # Open; half-open again right away since reset_timeout is 0
+        limiter = AdaptiveRateLimiter(rate=1, burst=1)
+        limiter.acquire()  # Empty the bucket so the trial search is throttled
+        guard = DirectoryGuard(rate_limiter=limiter, circuit_breaker=breaker, max_wait=0)
+        with self.assertRaises(DirectoryThrottledError):
+            guard.call(Flaky())
+        limiter._tokens = 1.0
+        self.assertEqual('ok', guard.call(Flaky()))  # Not CircuitOpenError: the trial slot was given back
+        self.assertEqual(CircuitBreaker.CLOSED, breaker.state)
+
+
+class EligibilityCheckerGuardTestCase(TestCase):
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mcomm_bulk_side_effect
+        patch('eligibility_checker.resilience.time.sleep').start()
+        override_group_membership.clear()
+        self.guard = DirectoryGuard(retry_policy=RetryPolicy(max_attempts=2),
+                                    circuit_breaker=CircuitBreaker(failure_threshold=5))
+        self.checker = EligibilityCheckerResilienceTestClass(mocks.test_app, mocks.test_secret, guard=self.guard)
+
+    def tearDown(self) -> None:
+        patch.stopall()
+        override_group_membership.clear()
+
+    def fail_for(self, uniqname, times):
+        remaining = [times]
+
+        def side_effect(query, *args, **kwargs):
+            if uniqname in query and remaining[0]:
+                remaining[0] -= 1
+                raise ldap.SERVER_DOWN('down')
+            return mcomm_bulk_side_effect(query, *args, **kwargs)
+        self.mock.side_effect = side_effect
+
+    def test_check_eligibility_retries_transient_user_errors(self):
+        self.fail_for('nemcards', 1)
+        r = self.checker.check_eligibility('nemcards')
+        self.assertEqual((True, ReasonCode.ENTITLEMENT), (r.eligible, r.reason_code))
+        self.assertEqual(1, self.guard.retries)
+
+    def test_check_eligibility_directory_error_after_retries(self):
+        self.fail_for('nemcards', 2)
+        r = self.checker.check_eligibility('nemcards')
+        self.assertEqual((False, ReasonCode.DIRECTORY_ERROR), (r.eligible, r.reason_code))
+        self.assertIsInstance(r.errors, ldap.SERVER_DOWN)
+
+    def test_check_eligibility_not_found_is_not_retried(self):
+        r = self.checker.check_eligibility('fake')
+        self.assertEqual(ReasonCode.ERROR, r.reason_code)
+        self.assertEqual(0, self.guard.retries)
+
+    def test_check_eligibility_many_directory_errors_without_fallback(self):
+        self.fail_for('nemcards', 2)
+        self.mock.reset_mock()
+        r = list(self.checker.check_eligibility_many(['nemcards', 'nemcardr']))
+        self.assertEqual([ReasonCode.DIRECTORY_ERROR] * 2, [i.reason_code for i in r])
+        self.assertEqual(2, self.mock.call_count)  # No single searches after the bulk search gave up
+
+    def test_check_eligibility_many_halts_when_circuit_opens(self):
+        self.fail_for('nemcard', 100)
+        with self.assertRaises(CircuitOpenError):
+            list(self.checker.check_eligibility_many(['nemcards', 'nemcardr', 'nemcardf', 'nemcardsa1'],
+                                                     chunk_size=1))
+
+    def test_check_eligibility_concurrent_halts_when_circuit_opens(self):
+        self.fail_for('nemcard', 100)
+        with self.assertRaises(CircuitOpenError):
+            list(self.checker.check_eligibility_concurrent(['nemcards', 'nemcardr', 'nemcardf', 'nemcardsa1'],
+                                                           max_workers=1))
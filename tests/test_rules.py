@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from eligibility_checker.rules import EligibilityRules, ReasonCode
+
+eligible_affiliations = ['Faculty', 'RegularStaff', 'Student', 'TemporaryStaff']
+use_rules = EligibilityRules('Test Service', 'enterprise', eligible_affiliations, [1])
+affiliation_rules = EligibilityRules('Test Service', None, eligible_affiliations, [1, 2])
+
+
+def record(uid, highest_affiliation, entitlements=(), sa_type=None):
+    return {'uid': uid, 'entitlements': set(entitlements), 'highest_affiliation': highest_affiliation,
+            'sa_type': sa_type}
+
+
+class EligibilityRulesTestCase(TestCase):
+    def test_override(self):
+        d = use_rules.evaluate(record('nemcardr', 'Retiree'), frozenset(['nemcardr']))
+        self.assertEqual((True, ReasonCode.OVERRIDE), (d.eligible, d.reason_code))
+
+    def test_entitlement(self):
+        d = use_rules.evaluate(record('nemcards', 'Student', ['enterprise']))
+        self.assertEqual((True, 'enterprise entitlement is True'), (d.eligible, d.reason))
+        d = use_rules.evaluate(record('nemcardr', 'Retiree'))
+        self.assertEqual((False, 'enterprise entitlement is False'), (d.eligible, d.reason))
+
+    def test_entitlement_mismatch(self):
+        d = use_rules.evaluate(record('nemcardferr', 'Faculty'))
+        self.assertEqual(True, d.eligible)
+        self.assertEqual(ReasonCode.ENTITLEMENT_MISMATCH, d.reason_code)
+        self.assertEqual('Highest affiliation Faculty shows nemcardferr should have a valid enterprise entitlement '
+                         'but they do not', d.reason)
+        self.assertIsInstance(d.errors, RuntimeError)
+
+    def test_entitlement_no_validation(self):
+        d = use_rules.evaluate(record('nemcardferr', 'Faculty'), validate_affiliation=False)
+        self.assertEqual((False, ReasonCode.ENTITLEMENT), (d.eligible, d.reason_code))
+
+    def test_affiliations(self):
+        self.assertEqual('Student are eligible for Test Service',
+                         affiliation_rules.evaluate(record('nemcards', 'Student')).reason)
+        self.assertEqual('Retiree are not eligible for Test Service',
+                         affiliation_rules.evaluate(record('nemcardr', 'Retiree')).reason)
+        d = affiliation_rules.evaluate(record('nemcardsa2', 'SponsoredAffiliate', sa_type=2))
+        self.assertEqual((True, 'Sponsored affiliates t2 are eligible for Test Service'), (d.eligible, d.reason))
+        d = affiliation_rules.evaluate(record('um999999', 'SponsoredAffiliate', sa_type=3))
+        self.assertEqual((False, ReasonCode.SA_TYPE_INELIGIBLE), (d.eligible, d.reason_code))
+
+    def test_reasons_are_precomputed(self):
+        first = affiliation_rules.evaluate(record('a', 'Student'))
+        self.assertIs(first, affiliation_rules.evaluate(record('b', 'Student')))
+
+    def test_unknown_affiliation(self):
+        self.assertEqual('None are not eligible for Test Service', affiliation_rules.evaluate(record('a', None)).reason)
@@ -0,0 +1,105 @@
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from eligibility_checker._parallel import worker_checker
+from eligibility_checker.checker import EligibilityChecker, ReasonCode
+from eligibility_checker.overrides import override_group_membership
+from eligibility_checker.sharding import ShardedSweep, _check_shard
+import mcommunity.mcommunity_mocks as mocks
+
+from tests.mocks import mcomm_bulk_side_effect
+from tests.test_eligibility_checker import EligibilityCheckerUSETestClass
+
+uniqnames = ['nemcardf', 'nemcardr', 'nemcards', 'NEMCARDR', 'nemcardsa1', 'fake', 'nemcardf', 'nemcardferr']
+expected = ['nemcardf', 'nemcardr', 'nemcards', 'nemcardsa1', 'fake', 'nemcardferr']
+
+
+def crashing_check_shard(shard: tuple) -> tuple:
+    if 'nemcardsa1' in shard[1]:
+        os._exit(1)  # As if the worker process was OOM killed
+    return _check_shard(shard)
+
+
+class ShardedSweepTestCase(TestCase):
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mcomm_bulk_side_effect
+        override_group_membership.clear()
+
+    def tearDown(self) -> None:
+        patch.stopall()
+        override_group_membership.clear()
+
+    def sweep(self, **kwargs) -> ShardedSweep:
+        return ShardedSweep(EligibilityCheckerUSETestClass, mocks.test_app, mocks.test_secret, shard_size=2,
+                            chunk_size=1, **kwargs)
+
+    def test_run_dedupes_and_keeps_order(self):
+        sweep = self.sweep(processes=2)
+        results = list(sweep.run(uniqnames))
+        self.assertEqual(expected, [r['uniqname'] for r in results])
+        self.assertEqual(2, sweep.duplicates)
+        checker = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        for r in results:
+            single = checker.check_eligibility(r['uniqname'])
+            self.assertEqual((single.eligible, single.reason_code), (r['eligible'], r['reason_code']))
+
+    def test_run_unordered(self):
+        results = list(self.sweep(processes=2, ordered=False).run(uniqnames))
+        self.assertCountEqual(expected, [r['uniqname'] for r in results])
+
+    def test_workers_do_not_fetch_override_groups(self):
+        with patch.object(override_group_membership, 'refresh', wraps=override_group_membership.refresh) as refresh:
+            list(self.sweep(processes=1).run(uniqnames))
+        self.assertEqual(2, refresh.call_count)  # Once per group, by the parent
+
+    def test_single_process_leaves_parent_state_alone(self):
+        checker = EligibilityCheckerUSETestClass(mocks.test_app, mocks.test_secret)
+        override_group_membership.update({'collab-iam-admins': ['nemcardr']})  # i.e. a refresh after the sweep started
+        version = override_group_membership.version
+        with patch('eligibility_checker.sharding.shared_override_members',
+                   return_value={'collab-iam-admins': frozenset(['nemcardf']), 'something-iam-primary': frozenset()}):
+            list(self.sweep(processes=1).run(uniqnames))
+        self.assertEqual(version, override_group_membership.version)
+        self.assertIn('nemcardr', checker._get_override_group_members())
+        self.assertEqual((None, True), worker_checker())
+
+    def test_progress_per_shard(self):
+        progress = []
+        list(self.sweep(processes=1, progress=progress.append).run(uniqnames))
+        self.assertEqual([0, 1, 2], [p.shard for p in progress])
+        self.assertEqual([2, 2, 2], [p.users for p in progress])
+        self.assertEqual([1, 2, 1], [p.eligible for p in progress])
+        self.assertEqual([0, 0, 2], [p.errors for p in progress])  # Not found and entitlement mismatch
+
+    def test_failed_shard_is_isolated(self):
+        check = EligibilityChecker._check_user_eligibility
+
+        def check_user_eligibility(checker, user, validate_affiliation):
+            if user.name == 'nemcardsa1':
+                raise ValueError('unexpected entry')
+            return check(checker, user, validate_affiliation)
+        progress = []
+        sweep = self.sweep(processes=1, progress=progress.append)
+        with patch.object(EligibilityChecker, '_check_user_eligibility', check_user_eligibility):
+            results = list(sweep.run(uniqnames))
+        self.assertEqual(expected, [r['uniqname'] for r in results])
+        self.assertEqual(ReasonCode.ERROR, results[3]['reason_code'])
+        self.assertEqual(ReasonCode.ERROR, results[4]['reason_code'])  # Rest of the failed shard
+        self.assertEqual(ReasonCode.ENTITLEMENT_MISMATCH, results[5]['reason_code'])
+        self.assertEqual(1, sweep.failed_shards)
+        self.assertEqual([None, "ValueError('unexpected entry')", None], [p.failure for p in progress])
+
+    def test_dead_worker_process_is_isolated(self):
+        progress = []
+        sweep = self.sweep(processes=2, progress=progress.append)
+        with patch('eligibility_checker.sharding._check_shard', crashing_check_shard):
+            results = list(sweep.run(uniqnames + ['nemcardsa2', 'nemcarda']))
+        self.assertEqual(expected + ['nemcardsa2', 'nemcarda'], [r['uniqname'] for r in results])
+        self.assertEqual(ReasonCode.ERROR, results[3]['reason_code'])
+        self.assertIn('BrokenProcessPool', results[3]['errors'])
+        self.assertIn('BrokenProcessPool', progress[1].failure)
+        self.assertEqual(2, progress[1].errors)
+        self.assertGreaterEqual(sweep.failed_shards, 1)
@@ -0,0 +1,152 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+import ldap
+
+from eligibility_checker.checker import CheckEligibilityResponse, EligibilityChecker, ReasonCode
+from eligibility_checker.overrides import override_group_membership
+from eligibility_checker.store import EligibilitySnapshotStore, Flip
+from mcommunity.mcommunity_user import MCommunityUser
+import mcommunity.mcommunity_mocks as mocks
+
+from tests.mocks import mcomm_bulk_side_effect
+
+service = 'Test Service with uSE'
+
+
+class EligibilityCheckerStoreTestClass(EligibilityChecker):
+    service_friendly = service
+    override_groups = ['collab-iam-admins', 'something-iam-primary']
+
+
+def response(uniqname, eligible, reason_code=ReasonCode.ENTITLEMENT, errors=None):
+    return CheckEligibilityResponse(eligible=eligible, reason=f'{uniqname} is {eligible}', uniqname=uniqname,
+                                    reason_code=reason_code, errors=errors)
+
+
+class EligibilitySnapshotStoreTestCase(TestCase):
+    def setUp(self) -> None:
+        self.store = EligibilitySnapshotStore()
+
+    def tearDown(self) -> None:
+        self.store.close()
+
+    def run_with(self, *responses) -> int:
+        run_id = self.store.start_run(service)
+        self.store.record(run_id, responses, batch_size=2)
+        self.store.finish_run(run_id)
+        return run_id
+
+    def test_record_and_query(self):
+        run_id = self.run_with(response('a', True), response('b', False), response('c', False, ReasonCode.ERROR))
+        self.assertEqual(['b', 'c'], [s.uniqname for s in self.store.snapshots(run_id, eligible=False)])
+        self.assertEqual(['c'], [s.uniqname for s in self.store.snapshots(run_id, reason_code=ReasonCode.ERROR)])
+        self.assertIs(True, self.store.snapshots(run_id)[0].eligible)
+
+    def test_record_replaces_within_run(self):
+        run_id = self.run_with(response('a', True), response('a', False))
+        self.assertEqual([False], [s.eligible for s in self.store.snapshots(run_id)])
+
+    def test_record_skips_directory_errors(self):
+        run_id = self.run_with(response('a', False, ReasonCode.DIRECTORY_ERROR, ldap.SERVER_DOWN()))
+        self.assertEqual([], self.store.snapshots(run_id))
+
+    @patch('mcommunity.mcommunity_base.MCommunityBase.search')
+    def test_record_affiliation_of_retained_users(self, magic_mock):
+        magic_mock.side_effect = mocks.mcomm_side_effect
+        user = MCommunityUser('nemcardsa2', mocks.test_app, mocks.test_secret)
+        user.populate_highest_affiliation()
+        run_id = self.run_with(CheckEligibilityResponse(eligible=False, reason='reason', user=user),
+                               response('a', True))
+        snapshots = self.store.snapshots(run_id, highest_affiliation='SponsoredAffiliate', sa_type=2)
+        self.assertEqual(['nemcardsa2'], [s.uniqname for s in snapshots])
+
+    def test_diff_and_flips_since(self):
+        old = self.run_with(response('a', True), response('b', True), response('c', False), response('d', True))
+        since = time.time()
+        time.sleep(0.01)
+        new = self.run_with(response('a', True), response('b', False), response('c', True), response('e', False))
+        self.assertEqual([Flip('b', True, False, ReasonCode.ENTITLEMENT, 'b is False'),
+                          Flip('c', False, True, ReasonCode.ENTITLEMENT, 'c is True')], self.store.diff(old, new))
+        self.assertEqual(['b'], [f.uniqname for f in self.store.flips_since(service, since, to_eligible=False)])
+        self.assertEqual([], self.store.flips_since('Other', since))
+
+    def test_record_sweep_passes_responses_through(self):
+        responses = [response('a', True), response('b', False), response('c', True)]
+        passed = []
+        for r in self.store.record_sweep(service, responses, batch_size=2):
+            passed.append(r)
+            self.assertIsNone(self.store.latest_run(service))  # Not finished until the end
+        self.assertEqual(responses, passed)
+        self.assertEqual(3, len(self.store.snapshots(self.store.latest_run(service).run_id)))
+
+    def test_latest(self):
+        self.run_with(response('a', True))
+        self.run_with(response('a', False))
+        self.assertIs(False, self.store.latest('A', service).eligible)
+        self.assertIsNone(self.store.latest('a', 'Other'))
+        with patch('eligibility_checker.store.time.time', return_value=time.time() + 100):
+            self.assertIsNone(self.store.latest('a', service, max_age=50))
+
+    def test_delete_runs(self):
+        self.run_with(response('a', True))
+        newest = self.run_with(response('a', False))
+        self.assertEqual(1, self.store.delete_runs(service, keep=1))
+        self.assertEqual([newest], [run.run_id for run in self.store.runs(service)])
+        self.assertIs(False, self.store.latest('a', service).eligible)
+
+    def test_persists_to_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'eligibility.sqlite3')
+            store = EligibilitySnapshotStore(path)
+            run_id = store.start_run(service)
+            store.record(run_id, [response('a', True)])
+            store.close()
+            store = EligibilitySnapshotStore(path)
+            self.assertIs(True, store.latest('a', service).eligible)
+            store.close()
+
+
+class EligibilityCheckerStoreFallbackTestCase(TestCase):
+    def setUp(self) -> None:
+        self.patcher = patch('mcommunity.mcommunity_base.MCommunityBase.search')
+        self.mock = self.patcher.start()
+        self.mock.side_effect = mcomm_bulk_side_effect
+        override_group_membership.clear()
+        self.store = EligibilitySnapshotStore()
+        self.checker = EligibilityCheckerStoreTestClass(mocks.test_app, mocks.test_secret, store=self.store)
+        list(self.store.record_sweep(service, self.checker.check_eligibility_many(['nemcards', 'nemcardr'])))
+
+    def tearDown(self) -> None:
+        patch.stopall()
+        override_group_membership.clear()
+        self.store.close()
+
+    def directory_down(self):
+        def side_effect(query, *args, **kwargs):
+            raise ldap.SERVER_DOWN('down')
+        self.mock.side_effect = side_effect
+
+    def test_serves_stored_decision_when_directory_is_down(self):
+        self.directory_down()
+        r = self.checker.check_eligibility('nemcards')
+        self.assertEqual((True, ReasonCode.ENTITLEMENT), (r.eligible, r.reason_code))
+        self.assertIn('stored decision', r.reason)
+        self.assertIsInstance(r.errors, ldap.SERVER_DOWN)
+        many = list(self.checker.check_eligibility_many(['nemcards', 'nemcardr', 'nemcardf']))
+        self.assertEqual([True, False, False], [i.eligible for i in many])
+        self.assertEqual(ReasonCode.DIRECTORY_ERROR, many[2].reason_code)  # Never stored
+
+    def test_stale_decision_is_not_served(self):
+        self.directory_down()
+        self.checker.stored_decision_max_age = 0
+        r = self.checker.check_eligibility('nemcards')
+        self.assertEqual((False, ReasonCode.DIRECTORY_ERROR), (r.eligible, r.reason_code))
+
+    def test_fallback_responses_are_not_recorded(self):
+        self.directory_down()
+        self.assertEqual(0, self.store.record(self.store.start_run(service),
+                                              [self.checker.check_eligibility('nemcards')]))